@@ -12,9 +12,12 @@ from pathlib import Path
 
 from config_manager import ConfigManager
 from worker_controller import WorkerController
-from gui_components import ModernLoginFrame, ModernStatusFrame, ModernControlFrame, SettingsFrame
+from worker_stats import WorkerStats
+from gui_components import ModernLoginFrame, ModernStatusFrame, ModernControlFrame, SettingsFrame, LOG_FLUSH_INTERVAL
 from ui_theme import UITheme
-from notification_system import NotificationManager, ProgressIndicator, StatusToast
+
+# Refresh period (ms) of the statistics of the worker
+STATS_INTERVAL = 1000
 
 class FishtestGUI:
     def __init__(self, root):
@@ -35,19 +38,51 @@ class FishtestGUI:
 
         # Initialize components
         self.worker_controller = WorkerController()
-        self.notification_manager = NotificationManager()
-        self.progress_indicator = ProgressIndicator(self.root)
-        self.status_toast = StatusToast(self.root)
+        self.worker_stats = WorkerStats()
+        self._notification_manager = None
+        self._progress_indicator = None
+        self._status_toast = None
+
+        # Set by the output monitoring thread, shown by the Tk main loop
+        self.pending_quick_status = None
 
         # Create GUI components
         self.create_widgets()
+        self.root.after(LOG_FLUSH_INTERVAL, self.poll_worker_output)
+        self.root.after(STATS_INTERVAL, self.refresh_stats)
 
         # Set up window closing handler
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
         # Set up keyboard shortcuts
         self.setup_shortcuts()
-        
+
+    # The notification components are only needed once the user acts, they
+    # are created on first use to keep them out of the startup.
+    @property
+    def notification_manager(self):
+        if self._notification_manager is None:
+            from notification_system import NotificationManager
+
+            self._notification_manager = NotificationManager()
+        return self._notification_manager
+
+    @property
+    def progress_indicator(self):
+        if self._progress_indicator is None:
+            from notification_system import ProgressIndicator
+
+            self._progress_indicator = ProgressIndicator(self.root)
+        return self._progress_indicator
+
+    @property
+    def status_toast(self):
+        if self._status_toast is None:
+            from notification_system import StatusToast
+
+            self._status_toast = StatusToast(self.root)
+        return self._status_toast
+
     def create_widgets(self):
         """Create the modern tabbed GUI widgets"""
         # Main container with padding
@@ -58,10 +93,12 @@ class FishtestGUI:
         self.notebook = ttk.Notebook(main_frame, style='Modern.TNotebook')
         self.notebook.pack(fill=tk.BOTH, expand=True)
 
-        # Create tabs
+        # Create tabs, the settings are filled in when first shown
         self.create_main_tab()
         self.create_logs_tab()
-        self.create_settings_tab()
+        self.settings_tab = ttk.Frame(self.notebook, style="Card.TFrame")
+        self.notebook.add(self.settings_tab, text="⚙️ Settings")
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
 
         # Configure grid weights
         self.root.columnconfigure(0, weight=1)
@@ -107,13 +144,14 @@ class FishtestGUI:
         self.status_frame = ModernStatusFrame(content_frame, self.theme)
         self.status_frame.pack(fill=tk.BOTH, expand=True)
 
-    def create_settings_tab(self):
-        """Create the settings tab"""
-        settings_tab = ttk.Frame(self.notebook, style='Card.TFrame')
-        self.notebook.add(settings_tab, text="⚙️ Settings")
+    def on_tab_changed(self, event):
+        """Fill in the settings tab the first time it is selected"""
+        if not hasattr(self, "settings_frame") and self.notebook.select() == str(self.settings_tab):
+            self.create_settings_tab()
 
-        # Create settings tab content
-        content_frame = ttk.Frame(settings_tab, padding="10")
+    def create_settings_tab(self):
+        """Create the settings tab content"""
+        content_frame = ttk.Frame(self.settings_tab, padding="10")
         content_frame.pack(fill=tk.BOTH, expand=True)
 
         # Settings section
@@ -354,6 +392,7 @@ Built with Python and tkinter for enhanced user experience."""
             self.status_frame.add_log_message("Starting fishtest worker...", 'info')
             self.quick_status_var.set("🚀 Starting worker...")
             self.status_toast.show("Starting fishtest worker...", toast_type='info')
+            self.worker_stats.reset()
             self.worker_controller.start_worker(username, password, cores, self.on_worker_output)
 
             # Update UI
@@ -381,6 +420,7 @@ Built with Python and tkinter for enhanced user experience."""
             self.quick_status_var.set("⏹️ Stopping worker...")
             self.status_toast.show("Stopping worker...", toast_type='info')
             self.worker_controller.stop_worker()
+            self.worker_stats.stop()
 
             # Update UI
             self.login_frame.set_worker_running(False)
@@ -400,7 +440,13 @@ Built with Python and tkinter for enhanced user experience."""
             messagebox.showerror("Error", f"Failed to stop worker: {e}")
             
     def on_worker_output(self, message):
-        """Handle worker output messages with enhanced formatting"""
+        """Handle worker output messages with enhanced formatting
+
+        Called for every line from the output monitoring thread: only queue
+        the message here, the Tk widgets are updated in batches by the main loop.
+        """
+        self.worker_stats.feed(message)
+
         # Determine message type based on content
         msg_type = 'info'
         if any(word in message.lower() for word in ['error', 'failed', 'exception']):
@@ -414,9 +460,27 @@ Built with Python and tkinter for enhanced user experience."""
 
         # Update quick status for important messages
         if 'completed' in message.lower():
-            self.quick_status_var.set("✅ Test completed")
+            self.pending_quick_status = "✅ Test completed"
         elif 'error' in message.lower():
-            self.quick_status_var.set("⚠️ Error occurred")
+            self.pending_quick_status = "⚠️ Error occurred"
+
+    def poll_worker_output(self):
+        """Show the quick status set by the latest worker output"""
+        try:
+            quick_status, self.pending_quick_status = self.pending_quick_status, None
+            if quick_status is not None:
+                self.quick_status_var.set(quick_status)
+        finally:
+            self.root.after(LOG_FLUSH_INTERVAL, self.poll_worker_output)
+
+    def refresh_stats(self):
+        """Show the throughput statistics parsed from the worker output"""
+        try:
+            if self.worker_controller.is_running():
+                stats, history = self.worker_stats.snapshot()
+                self.status_frame.update_stats(stats, history)
+        finally:
+            self.root.after(STATS_INTERVAL, self.refresh_stats)
         
     def on_closing(self):
         """Handle window closing"""
@@ -5,9 +5,42 @@ Contains modern UI components for login, status, controls, and settings.
 
 import tkinter as tk
 from tkinter import ttk
+import tkinter.font as tkfont
 import os
+from collections import deque
 from datetime import datetime
-import webbrowser
+from itertools import islice
+
+# The activity log keeps the last LOG_BUFFER_SIZE lines and is redrawn at
+# most every LOG_FLUSH_INTERVAL ms, however fast the worker prints.
+LOG_BUFFER_SIZE = 10000
+LOG_FLUSH_INTERVAL = 100
+LOG_WHEEL_LINES = 3
+
+
+class Sparkline(tk.Canvas):
+    """Small line chart of recent values, redrawn by moving a single canvas item"""
+
+    def __init__(self, parent, width=120, height=22, color='#0d6efd'):
+        super().__init__(parent, width=width, height=height, bg='#f8f9fa',
+                         highlightthickness=0, bd=0)
+        self.width = width
+        self.height = height
+        self.line = self.create_line(0, 0, 0, 0, fill=color, width=1.5)
+
+    def set_values(self, values):
+        """Draw the values, scaled between their minimum and maximum"""
+        if len(values) < 2:
+            self.coords(self.line, 0, 0, 0, 0)
+            return
+        low, high = min(values), max(values)
+        span = (high - low) or 1
+        step = (self.width - 2) / (len(values) - 1)
+        coords = []
+        for i, value in enumerate(values):
+            coords.append(1 + i * step)
+            coords.append(self.height - 2 - (value - low) / span * (self.height - 4))
+        self.coords(self.line, *coords)
 
 class LoginFrame(ttk.LabelFrame):
     """Login and configuration frame"""
@@ -351,7 +384,15 @@ class ModernStatusFrame(ttk.LabelFrame):
     def __init__(self, parent, theme=None):
         super().__init__(parent, text="📊 Status & Logs", padding="15", style='Card.TLabelframe')
         self.theme = theme
+        # Ring buffer of (timestamp, message, msg_type), of which only the
+        # visible window is inserted in the text widget.
+        self.log_lines = deque(maxlen=LOG_BUFFER_SIZE)
+        # Messages not yet shown; appending to a deque is thread safe.
+        self.pending_log = deque(maxlen=LOG_BUFFER_SIZE)
+        self.log_count = 0  # number of lines ever added to log_lines
+        self.log_top = 0  # index (in log_count terms) of the first visible line
         self.create_widgets()
+        self.after(LOG_FLUSH_INTERVAL, self.flush_log)
 
     def create_widgets(self):
         """Create modern status widgets"""
@@ -374,8 +415,13 @@ class ModernStatusFrame(ttk.LabelFrame):
         self.stats_vars = {
             'tests_completed': tk.StringVar(value="0"),
             'uptime': tk.StringVar(value="00:00:00"),
-            'games_played': tk.StringVar(value="0")
+            'games_played': tk.StringVar(value="0"),
+            'games_per_minute': tk.StringVar(value="-"),
+            'nps': tk.StringVar(value="-"),
+            'task_progress': tk.StringVar(value="-"),
+            'latency': tk.StringVar(value="-")
         }
+        self.sparklines = {}
 
         stats_grid = ttk.Frame(stats_frame)
         stats_grid.pack(fill=tk.X)
@@ -395,6 +441,21 @@ class ModernStatusFrame(ttk.LabelFrame):
         ttk.Label(stats_grid, textvariable=self.stats_vars['games_played'],
                  style='Heading.TLabel').grid(row=2, column=1, sticky=tk.E)
 
+        # Throughput, with the recent trend where it is useful
+        throughput = [
+            ('games_per_minute', "Games / Minute:", '#198754'),
+            ('nps', "Bench Speed:", '#0d6efd'),
+            ('task_progress', "Task Progress:", None),
+            ('latency', "Server Latency:", '#fd7e14'),
+        ]
+        for row, (key, text, color) in enumerate(throughput, start=3):
+            ttk.Label(stats_grid, text=text, style='Secondary.TLabel').grid(row=row, column=0, sticky=tk.W)
+            ttk.Label(stats_grid, textvariable=self.stats_vars[key],
+                     style='Heading.TLabel').grid(row=row, column=1, sticky=tk.E)
+            if color is not None:
+                self.sparklines[key] = Sparkline(stats_grid, color=color)
+                self.sparklines[key].grid(row=row, column=2, sticky=tk.E, padx=(10, 0))
+
         stats_grid.columnconfigure(1, weight=1)
 
         # Log section
@@ -409,7 +470,7 @@ class ModernStatusFrame(ttk.LabelFrame):
 
         self.auto_scroll_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(log_controls, text="Auto-scroll",
-                       variable=self.auto_scroll_var).pack(side=tk.LEFT, padx=(0, 5))
+                       variable=self.auto_scroll_var, command=self.render_log).pack(side=tk.LEFT, padx=(0, 5))
 
         ttk.Button(log_controls, text="Clear", command=self.clear_log).pack(side=tk.LEFT, padx=(5, 0))
         ttk.Button(log_controls, text="Save", command=self.save_log).pack(side=tk.LEFT, padx=(5, 0))
@@ -424,11 +485,17 @@ class ModernStatusFrame(ttk.LabelFrame):
                                font=('Consolas', 9), relief='flat',
                                selectbackground='#0d6efd', selectforeground='white')
 
-        scrollbar = ttk.Scrollbar(log_frame, orient=tk.VERTICAL, command=self.log_text.yview)
-        self.log_text.configure(yscrollcommand=scrollbar.set)
+        # The scrollbar moves the window over the ring buffer, not the text.
+        self.log_scrollbar = ttk.Scrollbar(log_frame, orient=tk.VERTICAL, command=self.scroll_log)
+        self.log_linespace = tkfont.Font(font=('Consolas', 9)).metrics('linespace')
 
         self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.log_text.bind('<Configure>', lambda e: self.render_log())
+        self.log_text.bind('<MouseWheel>', self.on_log_wheel)
+        self.log_text.bind('<Button-4>', lambda e: self.scroll_log('scroll', -LOG_WHEEL_LINES, 'units'))
+        self.log_text.bind('<Button-5>', lambda e: self.scroll_log('scroll', LOG_WHEEL_LINES, 'units'))
 
         # Configure text tags for different message types
         self.log_text.tag_configure('info', foreground='#0d6efd')
@@ -456,34 +523,87 @@ class ModernStatusFrame(ttk.LabelFrame):
                 self.status_label.config(foreground='#0d6efd')
 
     def add_log_message(self, message, msg_type='info'):
-        """Add message to log with type-based formatting"""
+        """Add message to log with type-based formatting (safe to call from any thread)"""
         timestamp = datetime.now().strftime("%H:%M:%S")
+        self.pending_log.append((timestamp, message, msg_type))
 
-        self.log_text.config(state=tk.NORMAL)
-
-        # Insert timestamp
-        self.log_text.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-
-        # Insert message with appropriate tag
-        self.log_text.insert(tk.END, f"{message}\n", msg_type)
-
-        # Auto-scroll if enabled
+    def flush_log(self):
+        """Move the pending messages to the log and redraw it, on the Tk main loop"""
+        try:
+            if self.pending_log:
+                while self.pending_log:
+                    self.log_lines.append(self.pending_log.popleft())
+                    self.log_count += 1
+                self.render_log()
+        finally:
+            self.after(LOG_FLUSH_INTERVAL, self.flush_log)
+
+    def visible_log_rows(self):
+        """Number of lines that fit in the text widget"""
+        height = self.log_text.winfo_height()
+        if height <= 1:  # not mapped yet
+            return int(self.log_text.cget('height'))
+        return max(1, height // self.log_linespace)
+
+    def render_log(self):
+        """Show the visible window of the log in the text widget"""
+        rows = self.visible_log_rows()
+        first = self.log_count - len(self.log_lines)
+        last_top = max(first, self.log_count - rows)
         if self.auto_scroll_var.get():
-            self.log_text.see(tk.END)
+            self.log_top = last_top
+        self.log_top = min(max(self.log_top, first), last_top)
 
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.delete(1.0, tk.END)
+        start = self.log_top - first
+        for timestamp, message, msg_type in islice(self.log_lines, start, start + rows):
+            self.log_text.insert(tk.END, f"[{timestamp}] ", 'timestamp')
+            self.log_text.insert(tk.END, f"{message}\n", msg_type)
+        if self.log_top == last_top:
+            # Wrapped lines may not fit, keep the last one visible.
+            self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
 
-    def update_stats(self, stats_dict):
-        """Update statistics display"""
+        if self.log_lines:
+            total = len(self.log_lines)
+            self.log_scrollbar.set(start / total, min(1.0, (start + rows) / total))
+        else:
+            self.log_scrollbar.set(0.0, 1.0)
+
+    def scroll_log(self, action, amount, unit=None):
+        """Move the visible window of the log (scrollbar and mouse wheel)"""
+        rows = self.visible_log_rows()
+        first = self.log_count - len(self.log_lines)
+        if action == 'moveto':
+            self.log_top = first + int(float(amount) * len(self.log_lines))
+        elif action == 'scroll':
+            step = rows if unit == 'pages' else 1
+            self.log_top += int(amount) * step
+        # Scrolling away from the end stops following the new messages.
+        if self.log_top < self.log_count - rows:
+            self.auto_scroll_var.set(False)
+        self.render_log()
+        return 'break'
+
+    def on_log_wheel(self, event):
+        """Scroll the log with the mouse wheel (Windows and macOS)"""
+        direction = -1 if event.delta > 0 else 1
+        return self.scroll_log('scroll', direction * LOG_WHEEL_LINES, 'units')
+
+    def update_stats(self, stats_dict, history=None):
+        """Update statistics display, and the sparklines from the history of the values"""
         for key, value in stats_dict.items():
             if key in self.stats_vars:
                 self.stats_vars[key].set(str(value))
+        for key, values in (history or {}).items():
+            if key in self.sparklines:
+                self.sparklines[key].set_values(values)
 
     def clear_log(self):
         """Clear the log display"""
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state=tk.DISABLED)
+        self.log_lines.clear()
+        self.render_log()
 
     def save_log(self):
         """Save log to file"""
@@ -496,7 +616,8 @@ class ModernStatusFrame(ttk.LabelFrame):
         if filename:
             try:
                 with open(filename, 'w') as f:
-                    f.write(self.log_text.get(1.0, tk.END))
+                    for timestamp, message, _ in list(self.log_lines):
+                        f.write(f"[{timestamp}] {message}\n")
                 self.add_log_message(f"Log saved to {filename}", 'success')
             except Exception as e:
                 self.add_log_message(f"Failed to save log: {e}", 'error')
@@ -596,6 +717,7 @@ class ModernControlFrame(ttk.LabelFrame):
 
     def open_web_ui(self):
         """Open Fishtest web interface"""
+        import webbrowser
         webbrowser.open("https://tests.stockfishchess.org")
 
 
@@ -7,12 +7,23 @@ import tkinter as tk
 from tkinter import messagebox
 import threading
 
-try:
-    # Try to import plyer for cross-platform notifications
-    from plyer import notification
-    PLYER_AVAILABLE = True
-except ImportError:
-    PLYER_AVAILABLE = False
+_plyer_notification = None
+
+def plyer_notification():
+    """The plyer notification facade, None if plyer is not installed
+
+    plyer is imported on the first notification rather than at startup,
+    importing it is slow.
+    """
+    global _plyer_notification
+    if _plyer_notification is None:
+        try:
+            # Try to import plyer for cross-platform notifications
+            from plyer import notification
+            _plyer_notification = notification
+        except ImportError:
+            _plyer_notification = False
+    return _plyer_notification or None
 
 class NotificationManager:
     """Manages desktop notifications and system alerts"""
@@ -28,7 +39,8 @@ class NotificationManager:
             return
             
         try:
-            if PLYER_AVAILABLE:
+            notification = plyer_notification()
+            if notification is not None:
                 # Use plyer for cross-platform notifications
                 notification.notify(
                     title=title,
@@ -4,7 +4,6 @@ Simple launcher for Fishtest Worker GUI
 """
 
 import sys
-import subprocess
 from pathlib import Path
 
 def main():
@@ -16,9 +15,11 @@ def main():
         return 1
         
     try:
-        # Launch the GUI
-        subprocess.run([sys.executable, str(gui_script)])
-        return 0
+        # Launch the GUI in this process, starting a second interpreter
+        # only delays the window
+        sys.path.insert(0, str(gui_script.parent))
+        import fishtest_gui
+        return fishtest_gui.main()
     except Exception as e:
         print(f"Error launching GUI: {e}")
         return 1
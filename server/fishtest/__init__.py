@@ -5,6 +5,7 @@ import threading
 import traceback
 
 import fishtest.github_api as gh
+from fishtest.renderers import json_renderer_factory
 from fishtest.routes import setup_routes
 from fishtest.rundb import RunDb
 from pyramid.authentication import AuthTktAuthenticationPolicy
@@ -39,6 +40,7 @@ def main(global_config, **settings):
         root_factory="fishtest.models.RootFactory",
     )
     config.include("pyramid_mako")
+    config.add_renderer("json", json_renderer_factory)
     config.set_default_csrf_options(require_csrf=False)
 
     port = int(settings.get("fishtest.port", -1))
@@ -62,7 +64,7 @@ def main(global_config, **settings):
         request = event.request
         if request.authenticated_userid is not None:
             auth_user_id = request.authenticated_userid
-            if is_user_blocked(auth_user_id, request.userdb):
+            if request.userdb.is_blocked(auth_user_id):
                 session = request.session
                 headers = forget(request)
                 session.invalidate()
@@ -72,13 +74,6 @@ def main(global_config, **settings):
         if rundb._shutdown:
             raise HTTPServiceUnavailable()
 
-    def is_user_blocked(auth_user_id, userdb):
-        blocked_users = userdb.get_blocked()
-        for user in blocked_users:
-            if user["username"] == auth_user_id and user["blocked"]:
-                return True
-        return False
-
     def init_app(event):
         if rundb.is_primary_instance():
             # Some initialization stuff that
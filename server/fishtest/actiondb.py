@@ -1,11 +1,77 @@
+import atexit
+import json
+import math
+import queue
+import re
+import threading
+import time
+from collections import Counter
 from datetime import UTC, datetime
 
 from bson.objectid import ObjectId
-from fishtest.schemas import ACTION_MESSAGE_SIZE, action_schema
+from fishtest.schemas import (
+    ACTION_MESSAGE_SIZE,
+    ACTIONS_QUERY_LIMIT,
+    action_schema,
+    actions_query_schema,
+)
 from fishtest.util import hex_print, worker_name
 from pymongo import DESCENDING
 from vtjson import ValidationError, validate
 
+# These actions may come in bulk (e.g. a bad engine crashing on thousands of
+# workers), they are written in batches by a background thread. The other
+# actions are written synchronously, since they are read right away.
+BATCHED_ACTIONS = {"dead_task", "failed_task", "crash_or_time", "log_message"}
+ACTIONS_QUEUE_SIZE = 10000
+ACTIONS_BATCH_SIZE = 500
+# At shutdown the batched actions are written for at most this long (s).
+ACTIONS_FLUSH_TIMEOUT = 10
+
+# The counts of the actions page are capped (beyond this they are estimates)
+# and cached for a short time.
+ACTIONS_COUNT_LIMIT = 10000
+ACTIONS_COUNT_TTL = 60
+
+# The links to the actions of a worker or a run search for the quoted name,
+# these searches use the indexes on "worker" and "run" instead of the
+# text index.
+WORKER_NAME_SEARCH = re.compile(r'"(\S+-\d+cores-[a-zA-Z0-9]{2,8}(-[a-f0-9]{4})?)"')
+RUN_NAME_SEARCH = re.compile(r'"(.{0,23}-[a-f0-9]{7})"')
+
+
+def text_query(text):
+    if match := WORKER_NAME_SEARCH.fullmatch(text):
+        # Also the long names (with the uuid suffix) of the worker. Only the
+        # regex metacharacters are escaped, to keep a literal prefix for the
+        # index.
+        name = re.sub(r"([.^$*+?()[\]{}|\\])", r"\\\1", match.group(1))
+        return {"worker": {"$regex": f"^{name}($|[-*])"}}
+    if match := RUN_NAME_SEARCH.fullmatch(text):
+        return {"run": match.group(1)}
+    return {"$text": {"$search": text}}
+
+
+def time_to_id_bounds(time_range):
+    """
+    Return _id bounds which contain the actions of a time range, so that a
+    query on time alone uses the _id index instead of a collection scan.
+    The _id of an action is created right after its time, to the second.
+    """
+
+    def object_id(t):
+        t = min(max(t, 0), 2**32 - 1)
+        return ObjectId.from_datetime(datetime.fromtimestamp(int(t), UTC))
+
+    bounds = {}
+    lower = max(time_range.get("$gt", 0), time_range.get("$gte", 0))
+    if lower > 0:
+        bounds["$gte"] = object_id(lower)
+    upper = min(time_range.get("$lt", math.inf), time_range.get("$lte", math.inf))
+    if upper < math.inf:
+        bounds["$lt"] = object_id(upper + 2)
+    return bounds
+
 
 def run_name(run):
     run_id = str(run["_id"])
@@ -17,6 +83,17 @@ class ActionDb:
     def __init__(self, db):
         self.db = db
         self.actions = self.db["actions"]
+        # Identical queries of /api/actions (e.g. by the notifications of
+        # many browser tabs) are answered from this cache for a few seconds.
+        self.query_cache = {}
+        self.query_cache_lock = threading.Lock()
+        self.query_cache_ttl = 5
+        self.count_cache = {}
+        self.count_cache_lock = threading.Lock()
+        # Batched actions waiting for the writer thread, see insert_action().
+        self.write_queue = queue.Queue(maxsize=ACTIONS_QUEUE_SIZE)
+        self.writer = None
+        self.writer_lock = threading.Lock()
 
     def get_actions(
         self,
@@ -28,7 +105,14 @@ class ActionDb:
         utc_before=None,
         run_id=None,
         max_actions=None,
+        before_id=None,
     ):
+        """
+        Return the actions, newest first, and their count, which is capped at
+        max_actions or ACTIONS_COUNT_LIMIT. before_id (the _id of the last
+        action of the previous page) replaces skip for paging through the
+        actions without scanning the previous pages.
+        """
         q = {}
         if action:
             # update_stats is no longer used, but included for backward compatibility
@@ -41,17 +125,18 @@ class ActionDb:
         if username:
             q["username"] = username
         if text:
-            q["$text"] = {"$search": text}
+            q.update(text_query(text))
         if utc_before:
             q["time"] = {"$lte": utc_before}
         if run_id:
             q["run_id"] = str(run_id)
 
+        count = self.count_actions(q, max_actions or ACTIONS_COUNT_LIMIT)
         if max_actions:
-            count = self.actions.count_documents(q, limit=max_actions)
             limit = min(limit, max_actions - skip)
-        else:
-            count = self.actions.count_documents(q)
+        if before_id:
+            q["_id"] = {"$lt": ObjectId(before_id)}
+            skip = 0
 
         actions_list = self.actions.find(
             q, limit=limit, skip=skip, sort=[("_id", DESCENDING)]
@@ -59,6 +144,77 @@ class ActionDb:
 
         return actions_list, count
 
+    def count_actions(self, q, limit):
+        key = (json.dumps(q, sort_keys=True), limit)
+        now = time.time()
+        with self.count_cache_lock:
+            entry = self.count_cache.get(key)
+            if entry is not None and entry["time"] > now - ACTIONS_COUNT_TTL:
+                return entry["count"]
+        count = self.actions.count_documents(q, limit=limit)
+        with self.count_cache_lock:
+            if len(self.count_cache) > 1000:
+                self.count_cache = {
+                    k: v
+                    for k, v in self.count_cache.items()
+                    if v["time"] > now - ACTIONS_COUNT_TTL
+                }
+            self.count_cache[key] = {"count": count, "time": now}
+        return count
+
+    def query_actions(self, query):
+        """
+        Return the actions matching a query of /api/actions, newest first,
+        see actions_query_schema. Raises ValidationError for an invalid query.
+        """
+        validate(actions_query_schema, query, "query")
+        key = json.dumps(query, sort_keys=True)
+        now = time.time()
+        with self.query_cache_lock:
+            entry = self.query_cache.get(key)
+            if entry is not None and entry["time"] > now - self.query_cache_ttl:
+                return entry["actions"]
+
+        q = {}
+        for field in ("action", "username", "run_id"):
+            value = query.get(field)
+            if isinstance(value, list):
+                q[field] = {"$in": value}
+            elif value is not None:
+                q[field] = value
+        id_bounds = {}
+        if "time" in query:
+            q["time"] = query["time"]
+            id_bounds = time_to_id_bounds(query["time"])
+        if "text" in query:
+            q["$text"] = {"$search": query["text"]}
+        if "before" in query:
+            before = ObjectId(query["before"])
+            id_bounds["$lt"] = min(id_bounds.get("$lt", before), before)
+        if id_bounds:
+            q["_id"] = id_bounds
+        projection = None
+        if "fields" in query:
+            projection = {field: 1 for field in query["fields"]}
+        actions = list(
+            self.actions.find(
+                q,
+                projection=projection,
+                sort=[("_id", DESCENDING)],
+                limit=query.get("limit", ACTIONS_QUERY_LIMIT),
+            )
+        )
+
+        with self.query_cache_lock:
+            if len(self.query_cache) > 1000:
+                self.query_cache = {
+                    k: v
+                    for k, v in self.query_cache.items()
+                    if v["time"] > now - self.query_cache_ttl
+                }
+            self.query_cache[key] = {"actions": actions, "time": now}
+        return actions
+
     def failed_task(self, username=None, run=None, task_id=None, message=None):
         task = run["tasks"][task_id]
         self.insert_action(
@@ -238,4 +394,63 @@ class ActionDb:
                 message=message,
             )
             return
+        if action["action"] in BATCHED_ACTIONS:
+            self.start_writer()
+            try:
+                self.write_queue.put_nowait(action)
+                return
+            except queue.Full:
+                # The database does not keep up, slow down the callers.
+                pass
         self.actions.insert_one(action)
+
+    def start_writer(self):
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(
+                    target=self.write_actions, name="actions writer", daemon=True
+                )
+                self.writer.start()
+                atexit.register(self.flush)
+
+    def write_actions(self):
+        while True:
+            batch = [self.write_queue.get()]
+            while len(batch) < ACTIONS_BATCH_SIZE:
+                try:
+                    batch.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.actions.insert_many(batch, ordered=False)
+            except Exception as e:
+                print(f"Writing {len(batch)} actions failed: {str(e)}", flush=True)
+            finally:
+                for _ in batch:
+                    self.write_queue.task_done()
+
+    def flush(self, timeout=ACTIONS_FLUSH_TIMEOUT):
+        """
+        Wait until the batched actions are written, for at most timeout
+        seconds. The actions which are still queued then are dropped and
+        logged. Returns True if all the actions were written.
+        """
+        deadline = time.monotonic() + timeout
+        q = self.write_queue
+        with q.all_tasks_done:
+            while q.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                q.all_tasks_done.wait(remaining)
+            else:
+                return True
+        dropped = Counter()
+        while True:
+            try:
+                dropped[q.get_nowait()["action"]] += 1
+            except queue.Empty:
+                break
+            q.task_done()
+        print(f"Flushing actions timed out, dropped: {dict(dropped)}", flush=True)
+        return False
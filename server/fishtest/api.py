@@ -7,19 +7,26 @@ from datetime import UTC, datetime
 from urllib.parse import urlparse
 
 import fishtest.github_api as gh
-from fishtest.schemas import api_access_schema, api_schema, gzip_data
+from fishtest.schemas import (
+    ACTIONS_QUERY_LIMIT,
+    api_access_schema,
+    api_schema,
+    gzip_data,
+)
 from fishtest.stats.stat_util import SPRT_elo, get_elo
-from fishtest.util import strip_run, worker_name
+from fishtest.util import parse_run_cursor, run_cursor, strip_run, worker_name
 from pyramid.httpexceptions import (
     HTTPBadRequest,
     HTTPException,
     HTTPFound,
     HTTPNotFound,
+    HTTPNotModified,
     HTTPUnauthorized,
 )
 from pyramid.response import FileIter, Response
 from pyramid.view import exception_view_config, view_config, view_defaults
 from vtjson import ValidationError, validate
+from webob.etag import ETagMatcher
 
 """
 Important note
@@ -36,7 +43,7 @@ Proper configuration of `nginx` is crucial for this, and should be done
 according to the route/URL mapping defined in `__init__.py`.
 """
 
-WORKER_VERSION = 288
+WORKER_VERSION = 311
 
 
 @exception_view_config(HTTPException)
@@ -356,17 +363,27 @@ class UserApi(GenericApi):
 
     @view_config(route_name="api_active_runs")
     def active_runs(self):
-        runs = self.request.rundb.runs.find(
-            {"finished": False},
-            {"tasks": 0, "bad_tasks": 0, "args.spsa.param_history": 0},
-        )
-        active = {}
-        for run in runs:
-            # some string conversions
-            for key in ("_id", "start_time", "last_updated"):
-                run[key] = str(run[key])
-            active[str(run["_id"])] = run
-        return active
+        rundb = self.request.rundb
+        if not rundb.is_primary_instance():
+            runs = rundb.runs.find(
+                {"finished": False},
+                {"tasks": 0, "bad_tasks": 0, "args.spsa.param_history": 0},
+            )
+            # The json renderer takes care of ObjectId and datetime.
+            return {str(run["_id"]): run for run in runs}
+
+        since = self.request.params.get("since")
+        version, runs, removed = rundb.get_active_runs(since)
+        response = self.request.response
+        response.etag = version
+        response.cache_control.no_cache = True
+        if_none_match = ETagMatcher.parse(self.request.headers.get("If-None-Match", ""))
+        if version in if_none_match:
+            return HTTPNotModified(etag=version, cache_control="no-cache")
+        if since is None:
+            return runs
+        # A full state if since was not usable (removed is None).
+        return {"version": version, "runs": runs, "removed": removed}
 
     @view_config(route_name="api_finished_runs")
     def finished_runs(self):
@@ -376,7 +393,16 @@ class UserApi(GenericApi):
         ltc_only = self.request.params.get("ltc_only", False)
         timestamp = self.request.params.get("timestamp", "")
         page_param = self.request.params.get("page", "")
-
+        cursor = self.request.params.get("cursor", "")
+
+        # A cursor (from the X-Next-Cursor header of the previous page)
+        # replaces the page number.
+        before = None
+        if cursor != "":
+            before = parse_run_cursor(cursor)
+            if before is None:
+                self.handle_error("Please provide a valid cursor.")
+            page_param = "1"
         if page_param == "":
             self.handle_error("Please provide a Page number.")
         if not page_param.isdigit() or int(page_param) < 1:
@@ -398,30 +424,29 @@ class UserApi(GenericApi):
             skip=page_idx * page_size,
             limit=page_size,
             last_updated=last_updated,
+            before=before,
         )
 
-        finished = {}
-        for run in runs:
-            # some string conversions
-            for key in ("_id", "start_time", "last_updated"):
-                run[key] = str(run[key])
-            finished[str(run["_id"])] = run
-        return finished
+        if len(runs) == page_size:
+            self.request.response.headers["X-Next-Cursor"] = run_cursor(runs[-1])
+        return {str(run["_id"]): run for run in runs}
 
     @view_config(route_name="api_actions")
     def actions(self):
+        self.request.response.headers["access-control-allow-origin"] = "*"
+        self.request.response.headers["access-control-allow-headers"] = "content-type"
         try:
             query = self.request.json_body
-            actions = self.request.rundb.db["actions"].find(query).limit(200)
         except Exception:
-            actions = []
-        ret = []
-        for action in actions:
-            action["_id"] = str(action["_id"])
-            ret.append(action)
-        self.request.response.headers["access-control-allow-origin"] = "*"
-        self.request.response.headers["access-control-allow-headers"] = "content-type"
-        return ret
+            self.handle_error("request is not json encoded")
+        try:
+            actions = self.request.actiondb.query_actions(query)
+        except ValidationError as e:
+            self.handle_error(str(e))
+        # For the next page, pass the _id of the last action as "before".
+        if len(actions) == query.get("limit", ACTIONS_QUERY_LIMIT):
+            self.request.response.headers["X-Next-Cursor"] = str(actions[-1]["_id"])
+        return actions
 
     @view_config(route_name="api_get_run")
     def get_run(self):
@@ -441,16 +466,19 @@ class UserApi(GenericApi):
             task_id = self.request.matchdict["task_id"]
             if task_id.endswith("bad"):
                 task_id = int(task_id[:-3])
-                task = copy.deepcopy(run["bad_tasks"][task_id])
+                task = run["bad_tasks"][task_id]
             else:
                 task_id = int(task_id)
-                task = copy.deepcopy(run["tasks"][task_id])
+                task = run["tasks"][task_id]
         except Exception:
             self.handle_error(
                 f"The task {run_id}/{task_id} does not exist", exception=HTTPNotFound
             )
+        # The json renderer takes care of the datetimes, of the infinite
+        # residuals and of packed_flips: only the worker_info is modified.
+        task = dict(task)
         if "worker_info" in task:
-            worker_info = task["worker_info"]
+            worker_info = task["worker_info"] = dict(task["worker_info"])
             # Do not reveal the unique_key.
             if "unique_key" in worker_info:
                 unique_key = worker_info["unique_key"]
@@ -458,18 +486,6 @@ class UserApi(GenericApi):
             # Do not reveal remote_addr.
             if "remote_addr" in worker_info:
                 worker_info["remote_addr"] = "?.?.?.?"
-        if "last_updated" in task:
-            # json does not know about datetime
-            task["last_updated"] = str(task["last_updated"])
-        if "residual" in task:
-            # json does not know about infinity
-            if task.get("residual", None) == float("inf"):
-                task["residual"] = "inf"
-        if "spsa_params" in task:
-            spsa_params = task["spsa_params"]
-            if "packed_flips" in spsa_params:
-                # json has no binary type
-                spsa_params["packed_flips"] = list(spsa_params["packed_flips"])
         return task
 
     @view_config(route_name="api_get_elo")
@@ -638,13 +654,11 @@ class UserApi(GenericApi):
     @view_config(route_name="api_download_nn")
     def download_nn(self):
         nn_id = self.request.matchdict["id"]
-        nn = self.request.rundb.get_nn(nn_id)
-        if nn is None:
+        if not self.request.rundb.increment_nn_downloads(nn_id):
             self.handle_error(
                 f"The network {nn_id} does not exist", exception=HTTPNotFound
             )
 
-        self.request.rundb.increment_nn_downloads(nn_id)
         nn_base_url = os.environ.get(
             "FISHTEST_NN_URL", f"{self.request.scheme}://{self.request.host}"
         ).rstrip("/")
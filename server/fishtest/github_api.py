@@ -34,6 +34,7 @@ _github_rate_limit = {
     "_uninitialized": True,
 }
 _lru_cache = None
+_saved_lru_cache = None  # the content of _lru_cache when it was last saved
 _kvstore = None
 
 _dummy_sha = 40 * "f"
@@ -42,6 +43,7 @@ official_master_sha = _dummy_sha
 
 def init(kvstore, actiondb):
     global _actiondb, _github_rate_limit, _kvstore, _lru_cache, _api_initialized
+    global _saved_lru_cache
     _kvstore = kvstore
     _actiondb = actiondb
     _lru_cache = LRUCache(LRU_CACHE_SIZE)
@@ -54,6 +56,7 @@ def init(kvstore, actiondb):
             raise Exception("Stored github_api_cache has different version")
         for k, v in github_api_cache["lru_cache"]:
             _lru_cache[tuple(k)] = v
+        _saved_lru_cache = list(_lru_cache.items())
     except Exception as e:
         print(f"Unable to restore github_api_cache from kvstore: {str(e)}", flush=True)
 
@@ -67,11 +70,16 @@ def clear_api_cache():
 
 
 def save():
-    global _kvstore
+    global _kvstore, _saved_lru_cache
+    lru_cache = list(_lru_cache.items())
+    # The cached values are replaced, never modified, so this is cheap.
+    if lru_cache == _saved_lru_cache:
+        return
     _kvstore["github_api_cache"] = {
         "version": GITHUB_API_VERSION,
-        "lru_cache": [(k, v) for k, v in _lru_cache.items()],
+        "lru_cache": lru_cache,
     }
+    _saved_lru_cache = lru_cache
 
 
 def call(url, *args, _method="GET", _ignore_rate_limit=False, **kwargs):
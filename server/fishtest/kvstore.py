@@ -1,44 +1,114 @@
+import threading
 from datetime import UTC
 
 from bson.codec_options import CodecOptions
 from fishtest.schemas import kvstore_schema
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from vtjson import validate
 
 _missing_default = object()
 
 
+def _is_field_name(key):
+    return isinstance(key, str) and key != "" and "." not in key and key[0] != "$"
+
+
 class KeyValueStore:
+    """
+    A dict stored in a MongoDB collection, with an in-memory write-through
+    cache. Every write increments the version of the document, so that a
+    cached value is reused only if it is still current. Checking that costs
+    a query for the version only. The cached values are shared: do not
+    modify a value without writing it back.
+    """
+
     def __init__(self, db=None, db_name=None, collection="kvstore"):
         if db is None:
             conn = MongoClient("localhost")
             codec_options = CodecOptions(tz_aware=True, tzinfo=UTC)
             db = conn[db_name].with_options(codec_options=codec_options)
         self.__kvstore = db[collection]
+        self.__cache = {}
+        self.__cache_lock = threading.Lock()
+
+    def __cache_value(self, key, value, version):
+        with self.__cache_lock:
+            self.__cache[key] = {"value": value, "version": version}
+
+    def __uncache(self, key):
+        with self.__cache_lock:
+            self.__cache.pop(key, None)
 
     def __setitem__(self, key, value):
         document = {"_id": key, "value": value}
         validate(kvstore_schema, document)
-        self.__kvstore.replace_one({"_id": key}, document, upsert=True)
+        document = self.__kvstore.find_one_and_update(
+            {"_id": key},
+            {"$set": {"value": value}, "$inc": {"version": 1}},
+            projection={"version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self.__cache_value(key, value, document["version"])
 
     def __getitem__(self, key):
-        document = self.__kvstore.find_one({"_id": key})
+        document = self.__kvstore.find_one({"_id": key}, {"version": 1})
+        if document is not None:
+            with self.__cache_lock:
+                entry = self.__cache.get(key)
+            if entry is not None and entry["version"] == document.get("version", 0):
+                return entry["value"]
+            document = self.__kvstore.find_one({"_id": key})
         if document is None:
+            self.__uncache(key)
             raise KeyError(key)
-        else:
-            return document["value"]
+        self.__cache_value(key, document["value"], document.get("version", 0))
+        return document["value"]
 
     def __delitem__(self, key):
+        self.__uncache(key)
         d = self.__kvstore.delete_one({"_id": key})
         if d.deleted_count == 0:
             raise KeyError(key)
 
     def __contains__(self, key):
-        try:
-            self[key]
-        except KeyError:
-            return False
-        return True
+        return self.__kvstore.find_one({"_id": key}, {"_id": 1}) is not None
+
+    def update_fields(self, key, value, set_keys=(), unset_keys=()):
+        """
+        Persist the changes of some entries of a dict value: value is the
+        current dict, set_keys are the entries that were added or modified
+        and unset_keys the entries that were removed. Only these entries are
+        written, unless a key cannot be used as a field name, in which case
+        the whole value is written.
+        """
+        if not set_keys and not unset_keys:
+            return
+        if not all(_is_field_name(k) for k in (*set_keys, *unset_keys)):
+            self[key] = value
+            return
+        update = {"$inc": {"version": 1}}
+        if set_keys:
+            update["$set"] = {f"value.{k}": value[k] for k in set_keys}
+            validate(kvstore_schema, {"_id": key, "value": update["$set"]})
+        if unset_keys:
+            update["$unset"] = {f"value.{k}": "" for k in unset_keys}
+        document = self.__kvstore.find_one_and_update(
+            {"_id": key},
+            update,
+            projection={"version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            self[key] = value
+            return
+        with self.__cache_lock:
+            entry = self.__cache.get(key)
+            # Keep the cache only if there was no other write in between.
+            if entry is not None and entry["version"] == document["version"] - 1:
+                self.__cache[key] = {"value": value, "version": document["version"]}
+            else:
+                self.__cache.pop(key, None)
 
     def get(self, key, default=_missing_default):
         try:
@@ -66,8 +136,8 @@ class KeyValueStore:
             yield d["_id"], d["value"]
 
     def keys(self):
-        for i in self.items():
-            yield i[0]
+        for d in self.__kvstore.find({}, {"_id": 1}):
+            yield d["_id"]
 
     def values(self):
         for i in self.items():
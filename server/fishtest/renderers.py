@@ -0,0 +1,75 @@
+"""JSON rendering of the documents of the database.
+
+The renderer registered for renderer="json" serializes the BSON types found
+in our documents itself, so that views can return documents (also cached
+ones) without converting or copying them first. The convention is:
+
+- ObjectId: its hex string;
+- datetime: str(), e.g. "2025-01-02 03:04:05.678000+00:00";
+- bytes (and bson Binary): the list of the byte values;
+- non finite floats: the strings "inf", "-inf" and "nan", as JSON has no
+  representation for them.
+
+The C encoder of the json module does the work. Documents with non finite
+floats (rare, e.g. the residual of a task without games) are first copied
+with these floats replaced.
+"""
+
+import json
+import math
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+_converters = {
+    ObjectId: str,
+    datetime: str,
+    bytes: list,
+}
+
+
+def _default(obj):
+    convert = _converters.get(type(obj))
+    if convert is None:
+        for type_, convert_ in _converters.items():
+            if isinstance(obj, type_):
+                convert = convert_
+                break
+        else:
+            raise TypeError(
+                f"Object of type {type(obj).__name__} is not JSON serializable"
+            )
+    return convert(obj)
+
+
+def _finite(value):
+    if isinstance(value, float):
+        if math.isfinite(value):
+            return value
+        return "nan" if math.isnan(value) else ("inf" if value > 0 else "-inf")
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+
+def dumps(value):
+    try:
+        return json.dumps(value, default=_default, allow_nan=False)
+    except ValueError as e:
+        if "Out of range float values" not in str(e):
+            raise
+    return json.dumps(_finite(value), default=_default, allow_nan=False)
+
+
+def json_renderer_factory(info):
+    def render(value, system):
+        request = system.get("request")
+        if request is not None:
+            response = request.response
+            if response.content_type == response.default_content_type:
+                response.content_type = "application/json"
+        return dumps(value)
+
+    return render
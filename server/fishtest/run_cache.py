@@ -58,6 +58,14 @@ class RunCache:
         self.run_lock = RunLock()
         self.run_cache_lock = threading.Lock()
         self.run_cache = {}
+        # Change tracking (for /api/active_runs): every buffer() call is a new
+        # version and run_versions maps a run_id to the version of its latest
+        # change. Changes older than min_version may have been forgotten.
+        # The epoch distinguishes the versions of different server processes.
+        self.epoch = int(time.time())
+        self.version = 0
+        self.min_version = 0
+        self.run_versions = {}
 
     def active_run_lock(self, run_id):
         return self.run_lock.active_run_lock(run_id)
@@ -83,6 +91,8 @@ class RunCache:
         flush = priority == Prio.SAVE_NOW
         run_id = str(run["_id"])
         with self.run_cache_lock:
+            self.version += 1
+            self.run_versions[run_id] = self.version
             if flush:
                 self.run_cache[run_id] = {
                     "is_changed": False,
@@ -110,6 +120,27 @@ class RunCache:
                 if not create and r.matched_count == 0:
                     print(f"Buffer: update of {run_id} failed", flush=True)
 
+    def changes(self, since=None):
+        """
+        Return (version, delta, run_ids) where version is the current version
+        as a string. If since is such a version, not too old, then delta is
+        True and run_ids is the set of runs changed after it. Otherwise delta
+        is False and run_ids is the set of all runs whose changes are tracked.
+        """
+        with self.run_cache_lock:
+            version = f"{self.epoch}-{self.version}"
+            try:
+                epoch, since = (int(v) for v in since.split("-"))
+            except (AttributeError, ValueError):
+                epoch = None
+            if epoch != self.epoch or not self.min_version <= since <= self.version:
+                return version, False, set(self.run_versions)
+            return (
+                version,
+                True,
+                {run_id for run_id, v in self.run_versions.items() if v > since},
+            )
+
     def get_run(self, run_id):
         run_id = str(run_id)
         try:
@@ -182,6 +213,10 @@ class RunCache:
                     and cache_entry["last_access_time"] < now - 300
                 ):
                     del self.run_cache[run_id]
+            for run_id, version in list(self.run_versions.items()):
+                if run_id not in self.run_cache:
+                    del self.run_versions[run_id]
+                    self.min_version = max(self.min_version, version)
 
     def validate(self):
         self.run_lock.validate()
@@ -1,4 +1,5 @@
 import copy
+import itertools
 import json
 import math
 import os
@@ -54,7 +55,7 @@ from fishtest.util import (
     worker_name,
 )
 from fishtest.workerdb import WorkerDb
-from pymongo import DESCENDING, MongoClient
+from pymongo import DESCENDING, MongoClient, UpdateOne
 from vtjson import ValidationError, validate
 
 
@@ -79,13 +80,35 @@ class RunDb:
         self.wtt_map = {}
         self.wtt_lock = threading.RLock()
 
+        # Counts of the finished runs per filter of get_finished_runs(),
+        # maintained in set_inactive_run(), set_active_run() and
+        # count_finished_run(). Recounted after some time, as runs may
+        # also be modified by other instances.
+        self.finished_runs_counts = {}
+        self.finished_runs_counts_lock = threading.Lock()
+        self.finished_runs_count_ttl = 600
+
         self.connections_counter = {}
         self.connections_lock = threading.Lock()
 
+        # Downloads of nets, counted in memory and written with $inc by
+        # flush_nn_downloads(). known_nns caches the names of existing nets.
+        self.nn_downloads = {}
+        self.known_nns = set()
+        self.nn_downloads_lock = threading.Lock()
+        self.nn_downloads_flush_time = time.time()
+        self.nn_downloads_flush_period = 60
+        # Caches of the nets page: the uploaders of nets, the master nets and
+        # the counts of the searches.
+        self.nns_cache = {}
+        self.nns_cache_lock = threading.Lock()
+        self.nns_cache_ttl = 300
+
         self.books = self.kvstore.get("books", {})
         self.worker_runs = self.kvstore.get("worker_runs", {})
 
         self.task_duration = 1800  # 30 minutes
+        self.prefetch_count = 2  # runs hinted to the worker for background builds
         self.ltc_lower_bound = 40  # Beware: this is used as a filter in an index!
         self.pt_info = {
             "pt_version": "SF_17",
@@ -107,6 +130,8 @@ class RunDb:
         self._base_url_set = bool(url)
 
         self.worker_runs_lock = threading.Lock()
+        # The workers whose entry in worker_runs changed since it was saved.
+        self.worker_runs_changed = set()
 
         self.request_task_lock = threading.Lock()
         self.scheduler = None
@@ -125,8 +150,13 @@ class RunDb:
             self.scheduler = Scheduler(jitter=0.05)
         self.scheduler.create_task(1.0, self.run_cache.flush_buffers, min_delay=1.0)
         self.scheduler.create_task(60.0, self.run_cache.clean_cache)
-        self.scheduler.create_task(60.0, self.scavenge_dead_tasks)
+        # Workers that spooled their results during a restart of the server
+        # should get the chance to deliver them before their tasks are
+        # declared dead.
+        self.scheduler.create_task(60.0, self.scavenge_dead_tasks, initial_delay=360.0)
         self.scheduler.create_task(60.0, self.update_itp)
+        self.scheduler.create_task(60.0, self.workerdb.flush_telemetry)
+        self.scheduler.create_task(60.0, self.flush_nn_downloads)
         # short initial delay to make testing more pleasant
         self.scheduler.create_task(180.0, self.validate_random_run, initial_delay=60.0)
         self.scheduler.create_task(180.0, self.clean_wtt_map, initial_delay=60.0)
@@ -144,18 +174,26 @@ class RunDb:
 
     def clean_worker_runs(self):
         with self.worker_runs_lock:
-            for v in self.worker_runs.values():
+            removed = set()
+            for k, v in self.worker_runs.items():
                 run_ids = copy.copy(v)
                 for run_id in run_ids:
                     if run_id != "last_run" and run_id not in self.unfinished_runs:
                         del v[run_id]
+                        self.worker_runs_changed.add(k)
 
             wr = copy.copy(self.worker_runs)
             for k, v in wr.items():
                 if len(v) == 1 and v["last_run"] not in self.unfinished_runs:
                     del self.worker_runs[k]
+                    removed.add(k)
 
-        self.kvstore["worker_runs"] = self.worker_runs
+            # Only the entries of the workers that changed are written.
+            changed = self.worker_runs_changed - removed
+            self.worker_runs_changed = set()
+            self.kvstore.update_fields(
+                "worker_runs", self.worker_runs, set_keys=changed, unset_keys=removed
+            )
 
     def update_books(self):
         books = None
@@ -321,6 +359,7 @@ class RunDb:
     def set_inactive_run(self, run):
         run_id = str(run["_id"])
         with self.active_run_lock(run_id):
+            was_finished = run["finished"]
             for task_id in range(len(run["tasks"])):
                 self.set_inactive_task(task_id, run)
             self.unfinished_runs.discard(run_id)
@@ -329,10 +368,14 @@ class RunDb:
             run["games_per_minute"] = 0.0
             flags = compute_flags(run)
             run.update(flags)
+        if not was_finished:
+            self.count_finished_run(run)
         self.buffer(run, priority=Prio.SAVE_NOW)
 
     def set_active_run(self, run):
         run_id = str(run["_id"])
+        if run["finished"]:
+            self.count_finished_run(run, -1)
         with self.active_run_lock(run_id):
             self.unfinished_runs.add(run_id)
             run["deleted"] = False
@@ -739,40 +782,144 @@ class RunDb:
 
     def upload_nn(self, userid, name):
         self.write_nn({"user": userid, "name": name, "downloads": 0})
+        self.clear_nns_cache()
 
     def update_nn(self, net):
         net = copy.copy(net)  # avoid side effects
         net.pop("downloads", None)
+        net.pop("_id", None)
         old_net = self.get_nn(net["name"])
         old_net.update(net)
-        self.write_nn(old_net)
+        validate(nn_schema, old_net, "net")
+        # $set rather than replace, so that no downloads are lost
+        self.nndb.update_one({"name": net["name"]}, {"$set": net})
+        if "is_master" in net:
+            self.clear_nns_cache()
 
     def increment_nn_downloads(self, name):
-        net = self.get_nn(name)
-        net["downloads"] += 1
-        self.write_nn(net)
-
-    def get_nns(self, user="", network_name="", master_only=False, limit=0, skip=0):
+        """
+        Count a download of a net, without accessing the database (except
+        the first time for a net, to check that it exists). Returns False if
+        the net does not exist.
+        """
+        with self.nn_downloads_lock:
+            known = name in self.known_nns
+        if not known:
+            if self.nndb.find_one({"name": name}, {"_id": 1}) is None:
+                return False
+        with self.nn_downloads_lock:
+            if len(self.known_nns) > 10000:
+                self.known_nns.clear()
+            self.known_nns.add(name)
+            self.nn_downloads[name] = self.nn_downloads.get(name, 0) + 1
+            flush = (
+                time.time()
+                > self.nn_downloads_flush_time + self.nn_downloads_flush_period
+            )
+        # Also here, as only the primary instance runs the scheduler.
+        if flush:
+            self.flush_nn_downloads()
+        return True
+
+    def flush_nn_downloads(self):
+        with self.nn_downloads_lock:
+            downloads, self.nn_downloads = self.nn_downloads, {}
+            self.nn_downloads_flush_time = time.time()
+        if not downloads:
+            return
+        try:
+            self.nndb.bulk_write(
+                [
+                    UpdateOne({"name": name}, {"$inc": {"downloads": count}})
+                    for name, count in downloads.items()
+                ],
+                ordered=False,
+            )
+        except Exception:
+            # Keep the downloads for the next flush.
+            with self.nn_downloads_lock:
+                for name, count in downloads.items():
+                    self.nn_downloads[name] = self.nn_downloads.get(name, 0) + count
+            raise
+
+    def clear_nns_cache(self):
+        with self.nns_cache_lock:
+            self.nns_cache.clear()
+
+    def cached_nns_query(self, key, query):
+        now = time.time()
+        with self.nns_cache_lock:
+            entry = self.nns_cache.get(key)
+            if entry is not None and entry["time"] > now - self.nns_cache_ttl:
+                return entry["value"]
+        value = query()
+        with self.nns_cache_lock:
+            if len(self.nns_cache) > 1000:
+                self.nns_cache.clear()
+            self.nns_cache[key] = {"value": value, "time": now}
+        return value
+
+    def nns_query(self, user="", network_name="", master_only=False):
         q = {}
         if user:
-            q["user"] = {"$regex": ".*{}.*".format(user), "$options": "i"}
+            # Case insensitive substring search in the (few) uploaders of nets,
+            # which are then looked up in the (user, _id) index.
+            users = self.cached_nns_query("users", lambda: self.nndb.distinct("user"))
+            user = user.lower()
+            q["user"] = {"$in": [u for u in users if user in u.lower()]}
         if network_name:
-            q["name"] = {"$regex": ".*{}.*".format(network_name), "$options": "i"}
+            # Net names are lower case. A search for "nn-..." is a prefix
+            # search, which uses the name index best.
+            network_name = network_name.lower()
+            prefix = "^" if network_name.startswith("nn-") else ""
+            q["name"] = {"$regex": prefix + re.escape(network_name)}
         if master_only:
             q["is_master"] = True
+        return q
 
-        count = self.nndb.count_documents(q)
-        nns_list = (
-            dict(n, time=n["_id"].generation_time)
-            for n in self.nndb.find(
+    def get_nns(
+        self, user="", network_name="", master_only=False, limit=0, skip=0, before=None
+    ):
+        """
+        Return the nets (newest first) and their count. before, the _id of
+        the last net of the previous page, replaces skip for paging without
+        scanning the previous pages.
+        """
+        if master_only and not user and not network_name:
+            # The master nets are listed often and are few.
+            nns = self.cached_nns_query(
+                "master",
+                lambda: list(
+                    self.nndb.find(
+                        {"is_master": True}, {"nn": 0}, sort=[("_id", DESCENDING)]
+                    )
+                ),
+            )
+            count = len(nns)
+            if before is not None:
+                nns = [n for n in nns if n["_id"] < before]
+                skip = 0
+            nns = nns[skip : skip + limit] if limit else nns[skip:]
+        else:
+            q = self.nns_query(user, network_name, master_only)
+            count = self.cached_nns_query(
+                ("count", user.lower(), network_name.lower(), bool(master_only)),
+                lambda: self.nndb.count_documents(q),
+            )
+            if before is not None:
+                q["_id"] = {"$lt": before}
+                skip = 0
+            nns = self.nndb.find(
                 q, {"nn": 0}, limit=limit, skip=skip, sort=[("_id", DESCENDING)]
             )
-        )
+        nns_list = (dict(n, time=n["_id"].generation_time) for n in nns)
         return nns_list, count
 
     def save_persistent_data(self):
         self.kvstore["books"] = self.books
-        self.kvstore["worker_runs"] = self.worker_runs
+        with self.worker_runs_lock:
+            self.kvstore["worker_runs"] = self.worker_runs
+            self.worker_runs_changed = set()
         gh.save()
 
     # handle termination
@@ -791,8 +938,14 @@ class RunDb:
             self.run_cache.flush_all()
             print("Saving persistent data...", flush=True)
             self.save_persistent_data()
+            print("Flushing worker telemetry...", flush=True)
+            self.workerdb.flush_telemetry()
+        print("Flushing net downloads...", flush=True)
+        self.flush_nn_downloads()
         if self.port >= 0:
             self.actiondb.system_event(message=f"stop fishtest@{self.port}")
+        print("Flushing actions...", flush=True)
+        self.actiondb.flush()
         print("Quitting...", flush=True)
         sys.exit(0)
 
@@ -843,6 +996,39 @@ class RunDb:
             )
         return unfinished_runs
 
+    def get_active_runs(self, since=None):
+        """
+        Primary instance only: the unfinished runs, without their tasks, from
+        the run cache. Returns (version, runs, removed). If since is a version
+        returned by an earlier call, runs only contains the runs changed
+        since then and removed is the list of runs which are no longer
+        active. Otherwise runs contains all unfinished runs and removed is
+        None. The runs are deep copies, taken under the lock of each run, so
+        that they can be serialized while the cached runs are updated. They
+        are read after the version, so they are at least as recent as it.
+        """
+        version, delta, run_ids = self.run_cache.changes(since)
+        if not delta:
+            # A new run is buffered before it is added to unfinished_runs.
+            with self.unfinished_runs_lock:
+                run_ids.update(self.unfinished_runs)
+        runs, removed = {}, []
+        for run_id in run_ids:
+            run = self.get_run(run_id)
+            if run is None or run["finished"]:
+                removed.append(run_id)
+                continue
+            with self.active_run_lock(run_id):
+                run = {k: v for k, v in run.items() if k not in ("tasks", "bad_tasks")}
+                args = run["args"] = dict(run["args"])
+                if "spsa" in args:
+                    args["spsa"] = {
+                        k: v for k, v in args["spsa"].items() if k != "param_history"
+                    }
+                run = copy.deepcopy(run)
+            runs[run_id] = run
+        return version, runs, removed if delta else None
+
     def get_machines(self):
         active_runs = self.runs.find({"finished": False}, {"tasks": 1, "args": 1})
         machines = (
@@ -909,6 +1095,55 @@ class RunDb:
             machines_count,
         )
 
+    def finished_runs_query(
+        self, username="", success_only=False, yellow_only=False, ltc_only=False
+    ):
+        # Deleted runs are excluded by the partial indexes.
+        q = {"finished": True, "deleted": False}
+        if username:
+            q["args.username"] = username
+        if ltc_only:
+            q["tc_base"] = {"$gte": self.ltc_lower_bound}
+        if success_only:
+            q["is_green"] = True
+        if yellow_only:
+            q["is_yellow"] = True
+        return q
+
+    def count_finished_run(self, run, increment=1):
+        """
+        Update the counts of the finished runs for a run which is finished
+        (increment=1) or is deleted or no longer finished (increment=-1).
+        """
+        if run["deleted"]:
+            return
+        with self.finished_runs_counts_lock:
+            for key, entry in self.finished_runs_counts.items():
+                username, success_only, yellow_only, ltc_only = key
+                if (
+                    (not username or run["args"].get("username") == username)
+                    and (not success_only or run["is_green"])
+                    and (not yellow_only or run["is_yellow"])
+                    and (not ltc_only or run["tc_base"] >= self.ltc_lower_bound)
+                ):
+                    entry["count"] += increment
+
+    def count_finished_runs(
+        self, username="", success_only=False, yellow_only=False, ltc_only=False
+    ):
+        key = (username, bool(success_only), bool(yellow_only), bool(ltc_only))
+        now = time.time()
+        with self.finished_runs_counts_lock:
+            entry = self.finished_runs_counts.get(key)
+            if entry is not None and entry["time"] > now - self.finished_runs_count_ttl:
+                return entry["count"]
+        count = self.runs.count_documents(self.finished_runs_query(*key))
+        with self.finished_runs_counts_lock:
+            if len(self.finished_runs_counts) > 1000:
+                self.finished_runs_counts.clear()
+            self.finished_runs_counts[key] = {"count": count, "time": now}
+        return count
+
     def get_finished_runs(
         self,
         skip=0,
@@ -918,32 +1153,42 @@ class RunDb:
         yellow_only=False,
         ltc_only=False,
         last_updated=None,
+        before=None,
     ):
-        q = {"finished": True}
+        """
+        Return the finished runs, newest first, and their total count.
+        before=(last_updated, _id), see parse_run_cursor(), selects the runs
+        after the run with this cursor in this order. Unlike skip, this does
+        not scan the runs of the previous pages.
+        """
+        q = self.finished_runs_query(username, success_only, yellow_only, ltc_only)
         projection = {"tasks": 0, "bad_tasks": 0, "args.spsa.param_history": 0}
-        if username:
-            q["args.username"] = username
-        if ltc_only:
-            q["tc_base"] = {"$gte": self.ltc_lower_bound}
-        if success_only:
-            q["is_green"] = True
-        if yellow_only:
-            q["is_yellow"] = True
         if last_updated is not None:
             q["last_updated"] = {"$gte": last_updated}
+            count = None
+        else:
+            count = self.count_finished_runs(
+                username, success_only, yellow_only, ltc_only
+            )
+        if before is not None:
+            before_updated, before_id = before
+            q["$or"] = [
+                {"last_updated": {"$lt": before_updated}},
+                {"last_updated": before_updated, "_id": {"$lt": before_id}},
+            ]
 
         c = self.runs.find(
             q,
             skip=skip,
             limit=limit,
-            sort=[("last_updated", DESCENDING)],
+            sort=[("last_updated", DESCENDING), ("_id", DESCENDING)],
             projection=projection,
         )
+        runs_list = list(c)
 
-        count = self.runs.count_documents(q)
-
-        # Don't show runs that were deleted
-        runs_list = [run for run in c if not run.get("deleted")]
+        if count is None:
+            q.pop("$or", None)
+            count = self.runs.count_documents(q)
         return [runs_list, count]
 
     def calc_itp(self, run, count):
@@ -1044,6 +1289,10 @@ After fixing the issues you can unblock the worker at
         # do not waste space in the db but also avoid side effects!
         worker_info = copy.copy(worker_info)
         worker_info.pop("host_url", None)
+        # The phase timings of the previous task of the worker.
+        telemetry = worker_info.pop("telemetry", None)
+        if telemetry is not None:
+            self.workerdb.record_telemetry(my_name, telemetry)
 
         # Now we see if a worker with the same name is already connected.
         now = datetime.now(UTC)
@@ -1111,22 +1360,20 @@ After fixing the issues you can unblock the worker at
         # Now go through the sorted list of unfinished runs.
         # We will add a task to the first run that is suitable.
 
-        run_found = False
-
-        for run in unfinished_runs:
+        def is_suitable(run):
             run_id = str(run["_id"])
 
             if run["finished"]:
-                continue
+                return False
 
             if not run["approved"]:
-                continue
+                return False
 
             if run["args"]["threads"] > max_threads:
-                continue
+                return False
 
             if run["args"]["threads"] < min_threads:
-                continue
+                return False
 
             # Check if there aren't already enough workers
             # working on this run.
@@ -1134,7 +1381,7 @@ After fixing the issues you can unblock the worker at
 
             remaining = run["args"]["num_games"] - committed_games
             if remaining <= 0:
-                continue
+                return False
 
             # We check if the worker has reserved enough memory
             need_tt = 0
@@ -1152,7 +1399,7 @@ After fixing the issues you can unblock the worker at
             )
 
             if need_base + need_tt > max_memory:
-                continue
+                return False
 
             # GitHub API limit...
             if near_github_api_limit:
@@ -1160,7 +1407,7 @@ After fixing the issues you can unblock the worker at
                     my_name in self.worker_runs and run_id in self.worker_runs[my_name]
                 )
                 if not have_binary:
-                    continue
+                    return False
 
             # Limit the number of cores.
             # Currently this is only done for spsa.
@@ -1170,17 +1417,30 @@ After fixing the issues you can unblock the worker at
                 limit_cores = 1000000  # infinity
 
             if run["cores"] > limit_cores:
-                continue
+                return False
 
             # If we make it here, it means we have found a run
             # suitable for a new task.
-            run_found = True
-            break
+            return True
+
+        suitable_runs = (run for run in unfinished_runs if is_suitable(run))
+        run = next(suitable_runs, None)
 
         # If there is no suitable run, tell the worker.
-        if not run_found:
+        if run is None:
             return {"task_waiting": False}
 
+        # The next suitable runs are the most likely ones for the following
+        # task of this worker. It may build their engines in the background.
+        prefetch = [
+            {
+                "resolved_new": r["args"]["resolved_new"],
+                "resolved_base": r["args"]["resolved_base"],
+                "tests_repo": r["args"]["tests_repo"],
+            }
+            for r in itertools.islice(suitable_runs, self.prefetch_count)
+        ]
+
         # Now we create a new task for this run.
         run_id = str(run["_id"])
         with self.active_run_lock(run_id):
@@ -1254,8 +1514,9 @@ After fixing the issues you can unblock the worker at
                 self.worker_runs[my_name] = {}
             self.worker_runs[my_name][run_id] = True
             self.worker_runs[my_name]["last_run"] = run_id
+            self.worker_runs_changed.add(my_name)
 
-        return {"run": run, "task_id": task_id}
+        return {"run": run, "task_id": task_id, "prefetch": prefetch}
 
     def finished_run_message(self, run):
         if "spsa" in run["args"]:
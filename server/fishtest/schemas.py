@@ -27,6 +27,7 @@ from vtjson import (
     ip_address,
     keys,
     lax,
+    le,
     magic,
     nothing,
     number,
@@ -103,6 +104,7 @@ user_schema = {
     "groups": [str, ...],
     "tests_repo": union(github_repo, ""),
     "machine_limit": uint,
+    "last_updated?": datetime_utc,
 }
 
 kvstore_schema = {
@@ -110,11 +112,49 @@ kvstore_schema = {
     "value": anything,
 }
 
+# Where the wall time of the tasks of a worker goes
+worker_phases = (
+    "request_task",
+    "download",
+    "build",
+    "bench",
+    "net",
+    "games",
+    "update",
+    "pgn_upload",
+)
+worker_counters = ("api_calls", "retries", "bytes_sent", "bytes_received")
+
+# Newer workers may report phases and counters which are not known here.
+# They are accepted, but ignored.
+telemetry_key = regex(r"[a-z][a-z0-9_]{0,31}", name="telemetry_key")
+TELEMETRY_SIZE = 32
+telemetry_schema = {
+    "phases": intersect({telemetry_key: unumber}, size(0, TELEMETRY_SIZE)),
+    "counters": intersect({telemetry_key: unumber}, size(0, TELEMETRY_SIZE)),
+}
+
 worker_schema = {
     "_id?": ObjectId,
     "worker_name": short_worker_name,
     "blocked": bool,
     "message": worker_message,
+    "last_updated": union(datetime_utc, None),
+}
+
+known_telemetry_schema = {
+    "phases": {f"{phase}?": unumber for phase in worker_phases},
+    "counters": {f"{counter}?": uint for counter in worker_counters},
+}
+
+# The documents expire when the worker has not reported for some time,
+# see create_indexes.py.
+worker_telemetry_schema = {
+    "_id?": ObjectId,
+    "worker_name": short_worker_name,
+    "tasks": suint,
+    **known_telemetry_schema,
+    "last": known_telemetry_schema,
     "last_updated": datetime_utc,
 }
 
@@ -398,6 +438,44 @@ action_schema = intersect(
     ),
 )
 
+ACTIONS_QUERY_LIMIT = 200
+
+
+def one_or_more(schema):
+    # {"$in": [...]} is the form sent by older clients.
+    return union(schema, [schema, ...], {"$in": [schema, ...]})
+
+
+# The queries of /api/actions. Each of action, username and run_id matches
+# an index (together with _id, which orders the actions, newest first).
+actions_query_schema = {
+    "action?": one_or_more(action_name),
+    "username?": one_or_more(username),
+    "run_id?": one_or_more(run_id),
+    "time?": intersect(
+        {"$gt?": number, "$gte?": number, "$lt?": number, "$lte?": number},
+        size(1, 4),
+    ),
+    "text?": intersect(str, size(1, 100)),
+    "before?": run_id,
+    "limit?": intersect(int, ge(1), le(ACTIONS_QUERY_LIMIT)),
+    "fields?": [
+        union(
+            "action",
+            "username",
+            "worker",
+            "run_id",
+            "run",
+            "task_id",
+            "message",
+            "time",
+            "nn",
+            "user",
+        ),
+        ...,
+    ],
+}
+
 
 worker_info_schema_api = {
     "uname": str,
@@ -415,9 +493,11 @@ worker_info_schema_api = {
     "ARCH": str,
     "nps": unumber,
     "near_github_api_limit": bool,
+    "telemetry?": telemetry_schema,
 }
 
 worker_info_schema_runs = copy.deepcopy(worker_info_schema_api)
+del worker_info_schema_runs["telemetry?"]
 worker_info_schema_runs.update(
     {"remote_addr": ip_address, "country_code": union(country_code, "?")}
 )
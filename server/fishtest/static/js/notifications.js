@@ -205,9 +205,7 @@ async function purgeNotifications(lastFetchTime) {
     let json1 = [];
     try {
       json1 = await fetchPost("/api/actions", {
-        action: {
-          $in: ["finished_run", "stop_run", "delete_run"],
-        },
+        action: ["finished_run", "stop_run", "delete_run"],
         run_id: runId,
         time: { $gte: lastFetchTime / 1000 - 60 },
       });
@@ -274,8 +272,8 @@ async function mainFollowLoop() {
     try {
       if (notifications.count()) {
         json = await fetchPost("/api/actions", {
-          action: { $in: ["finished_run", "stop_run", "delete_run"] },
-          run_id: { $in: notifications.toArray() },
+          action: ["finished_run", "stop_run", "delete_run"],
+          run_id: notifications.toArray(),
         });
       }
     } catch (e) {
@@ -303,6 +301,7 @@ async function mainFollowLoop() {
         json = await fetchPost("/api/actions", {
           action: "new_run",
           run_id: runId,
+          limit: 1,
         });
         notifyElo(json[0], entry);
       } catch (e) {
@@ -90,6 +90,32 @@
     >Submit</button>
     <button type="submit" name="sumbit" class="btn btn-secondary">Cancel</button>
   </form>
+  % if telemetry is not None:
+    <h4 class="mt-3">Telemetry</h4>
+    <div class="mb-2">
+      ${telemetry["tasks"]} tasks reported, last one ${format_time_ago(telemetry["last_updated"])}
+    </div>
+    <table class="table table-striped table-sm">
+      <thead>
+        <tr>
+          <th>Phase / Counter</th>
+          <th class="text-end">Last task</th>
+          <th class="text-end">Mean per task</th>
+        </tr>
+      </thead>
+      <tbody>
+        % for kind, unit in (("phases", "s"), ("counters", "")):
+          % for key, total in telemetry[kind].items():
+            <tr>
+              <td>${key.replace("_", " ")}</td>
+              <td class="text-end">${f"{telemetry['last'][kind].get(key, 0):,.1f}"}${unit}</td>
+              <td class="text-end">${f"{total / telemetry['tasks']:,.1f}"}${unit}</td>
+            </tr>
+          % endfor
+        % endfor
+      </tbody>
+    </table>
+  % endif
   <hr>
 % endif  ## show_admin
 
@@ -1,13 +1,24 @@
 import sys
 import threading
 import time
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
 
+from fishtest.lru_cache import LRUCache
 from fishtest.schemas import user_schema
 from pymongo import ASCENDING
 from vtjson import ValidationError, validate
 
 DEFAULT_MACHINE_LIMIT = 16
+USER_CACHE_SIZE = 1000
+USER_CACHE_TTL = 120
+# The blocked users are also updated directly by save_user() and remove_user(),
+# the refresh is for the changes made by other instances. It reads only the
+# users updated since the previous refresh (with a margin for the clock skew
+# of the instances). A periodic reload of all the blocked users catches the
+# other changes, e.g. removed users or direct edits of the database.
+BLOCKED_REFRESH_PERIOD = 1
+BLOCKED_RELOAD_PERIOD = 600
+BLOCKED_REFRESH_MARGIN = timedelta(seconds=60)
 
 
 def validate_user(user):
@@ -25,19 +36,32 @@ class UserDb:
         self.users = self.db["users"]
         self.user_cache = self.db["user_cache"]
         self.top_month = self.db["top_month"]
-
-    # Cache user lookups for 120s
-    user_lock = threading.Lock()
-    cache = {}
+        # Cache user lookups for USER_CACHE_TTL seconds
+        self.user_lock = threading.Lock()
+        self.cache = LRUCache(USER_CACHE_SIZE)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # The blocked users are checked on every request, they have their own
+        # lock, which is not held while the database is queried.
+        self.blocked_usernames_lock = threading.Lock()
+        self.blocked_usernames = set()
+        self.blocked_usernames_time = 0
+        self.blocked_usernames_reload_time = 0
+        self.blocked_usernames_since = None
+        self.blocked_usernames_refreshing = False
 
     def find_by_username(self, name):
         with self.user_lock:
-            user = self.cache.get(name)
-            if user and time.time() < user["time"] + 120:
-                return user["user"]
+            entry = self.cache[name] if name in self.cache else None
+            if entry and time.time() < entry["time"] + USER_CACHE_TTL:
+                self.cache_hits += 1
+                return entry["user"]
+            self.cache_misses += 1
             user = self.users.find_one({"username": name})
             if user is not None:
                 self.cache[name] = {"user": user, "time": time.time()}
+            else:
+                self.cache.pop(name, None)
             return user
 
     def find_by_email(self, email):
@@ -46,6 +70,70 @@ class UserDb:
     def clear_cache(self):
         with self.user_lock:
             self.cache.clear()
+        with self.blocked_usernames_lock:
+            self.blocked_usernames_reload_time = 0
+
+    def invalidate_user(self, user):
+        with self.user_lock:
+            self.cache.pop(user["username"], None)
+        with self.blocked_usernames_lock:
+            if user.get("blocked"):
+                self.blocked_usernames.add(user["username"])
+            else:
+                self.blocked_usernames.discard(user["username"])
+
+    def cache_info(self):
+        with self.user_lock:
+            return {
+                "size": len(self.cache),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+            }
+
+    def is_blocked(self, username):
+        self.refresh_blocked_usernames()
+        with self.blocked_usernames_lock:
+            return username in self.blocked_usernames
+
+    def refresh_blocked_usernames(self):
+        # A single thread refreshes, the others use the current set meanwhile.
+        now = time.time()
+        with self.blocked_usernames_lock:
+            if (
+                self.blocked_usernames_refreshing
+                or now < self.blocked_usernames_time + BLOCKED_REFRESH_PERIOD
+            ):
+                return
+            self.blocked_usernames_refreshing = True
+            since = self.blocked_usernames_since
+            reload = (
+                since is None
+                or now > self.blocked_usernames_reload_time + BLOCKED_RELOAD_PERIOD
+            )
+        try:
+            start = datetime.now(UTC)
+            if reload:
+                q = {"blocked": True}
+            else:
+                q = {"last_updated": {"$gte": since - BLOCKED_REFRESH_MARGIN}}
+            users = list(self.users.find(q, {"username": 1, "blocked": 1}))
+        except Exception:
+            with self.blocked_usernames_lock:
+                self.blocked_usernames_refreshing = False
+            raise
+        with self.blocked_usernames_lock:
+            if reload:
+                self.blocked_usernames = {user["username"] for user in users}
+                self.blocked_usernames_reload_time = now
+            else:
+                for user in users:
+                    if user.get("blocked"):
+                        self.blocked_usernames.add(user["username"])
+                    else:
+                        self.blocked_usernames.discard(user["username"])
+            self.blocked_usernames_since = start
+            self.blocked_usernames_time = time.time()
+            self.blocked_usernames_refreshing = False
 
     def authenticate(self, username, password):
         user = self.get_user(username)
@@ -101,9 +189,10 @@ class UserDb:
     def add_user_group(self, username, group):
         user = self.get_user(username)
         user["groups"].append(group)
+        user["last_updated"] = datetime.now(UTC)
         validate_user(user)
         self.users.replace_one({"_id": user["_id"]}, user)
-        self.clear_cache()
+        self.invalidate_user(user)
 
     def create_user(self, username, password, email, tests_repo):
         try:
@@ -120,9 +209,11 @@ class UserDb:
                 "groups": [],
                 "tests_repo": tests_repo,
                 "machine_limit": DEFAULT_MACHINE_LIMIT,
+                "last_updated": datetime.now(UTC),
             }
             validate_user(user)
             self.users.insert_one(user)
+            self.invalidate_user(user)
             self.last_pending_time = 0
             self.last_blocked_time = 0
 
@@ -131,18 +222,19 @@ class UserDb:
             return None
 
     def save_user(self, user):
+        user["last_updated"] = datetime.now(UTC)
         validate_user(user)
         self.users.replace_one({"_id": user["_id"]}, user)
         self.last_pending_time = 0
         self.last_blocked_time = 0
-        self.clear_cache()
+        self.invalidate_user(user)
 
     def remove_user(self, user, rejector):
         result = self.users.delete_one({"_id": user["_id"]})
         if result.deleted_count > 0:
             # User successfully deleted
             self.last_pending_time = 0
-            self.clear_cache()
+            self.invalidate_user({"username": user["username"]})
             # logs rejected users to the server
             print(
                 f"user: {user['username']} with email: {user['email']} was rejected by: {rejector}",
@@ -2,16 +2,20 @@ import copy
 import hashlib
 import math
 import re
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
 from functools import cache
 
 import fishtest.github_api as gh
 import fishtest.stats.stat_util
 import numpy as np
 import scipy.stats
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
 from email_validator import EmailNotValidError, caching_resolver, validate_email
 from zxcvbn import zxcvbn
 
+EPOCH = datetime.fromtimestamp(0, UTC)
+
 
 class GeneratorAsFileReader:
     def __init__(self, generator):
@@ -566,6 +570,23 @@ def strip_run(run):
     return stripped
 
 
+def run_cursor(run):
+    """Position of a run in the lists of finished runs (newest first), for
+    keyset pagination: "<last_updated in ms>-<run_id>". Integer arithmetic
+    keeps the ms exact, like the ms precision of the dates in MongoDB."""
+    ms = (run["last_updated"] - EPOCH) // timedelta(milliseconds=1)
+    return f"{ms}-{run['_id']}"
+
+
+def parse_run_cursor(cursor):
+    """The (last_updated, _id) pair of a cursor, None if it is invalid."""
+    try:
+        ms, run_id = cursor.split("-")
+        return EPOCH + timedelta(milliseconds=int(ms)), ObjectId(run_id)
+    except (AttributeError, ValueError, OverflowError, OSError, InvalidId):
+        return None
+
+
 def count_games(stats):
     return stats["wins"] + stats["losses"] + stats["draws"]
 
@@ -12,6 +12,7 @@ import bson
 import fishtest.github_api as gh
 import fishtest.stats.stat_util
 import requests
+from fishtest.actiondb import ACTIONS_COUNT_LIMIT
 from fishtest.run_cache import Prio
 from fishtest.schemas import (
     RUN_VERSION,
@@ -29,9 +30,11 @@ from fishtest.util import (
     get_hash,
     get_tc_ratio,
     is_sprt_ltc_data,
+    parse_run_cursor,
     password_strength,
     plural,
     reasonable_run_hashes,
+    run_cursor,
     tests_repo,
 )
 from pyramid.httpexceptions import HTTPFound, HTTPNotFound
@@ -42,7 +45,7 @@ from vtjson import ValidationError, union, validate
 HTTP_TIMEOUT = 15.0
 
 
-def pagination(page_idx, num, page_size, query_params):
+def pagination(page_idx, num, page_size, query_params, next_cursor=None):
     pages = [
         {
             "idx": "Prev",
@@ -70,7 +73,9 @@ def pagination(page_idx, num, page_size, query_params):
     pages.append(
         {
             "idx": "Next",
-            "url": "?page={}".format(page_idx + 2) + query_params,
+            "url": "?page={}".format(page_idx + 2)
+            + query_params
+            + ("&cursor={}".format(next_cursor) if next_cursor else ""),
             "state": "disabled" if page_idx >= (num - 1) // page_size else "",
         }
     )
@@ -264,6 +269,7 @@ def workers(request):
         "message": w["message"],
         "show_email": is_approver,
         "last_updated": w["last_updated"],
+        "telemetry": request.rundb.workerdb.get_telemetry(worker_name),
         "blocked_workers": blocked_workers,
     }
 
@@ -442,6 +448,8 @@ def nns(request):
     network_name = request.params.get("network_name", "")
     master_only = request.params.get("master_only", False)
 
+    cursor = request.params.get("cursor", "")
+
     page_param = request.params.get("page", "")
     page_idx = max(0, int(page_param) - 1) if page_param.isdigit() else 0
     page_size = 25
@@ -452,7 +460,10 @@ def nns(request):
         master_only=master_only,
         limit=page_size,
         skip=page_idx * page_size,
+        before=bson.ObjectId(cursor) if bson.ObjectId.is_valid(cursor) else None,
     )
+    nns = list(nns)
+    next_cursor = str(nns[-1]["_id"]) if nns else None
 
     query_params = ""
     if user:
@@ -462,7 +473,7 @@ def nns(request):
     if master_only:
         query_params += "&master_only={}".format(master_only)
 
-    pages = pagination(page_idx, num_nns, page_size, query_params)
+    pages = pagination(page_idx, num_nns, page_size, query_params, next_cursor)
 
     return {
         "nns": nns,
@@ -517,6 +528,7 @@ def actions(request):
     before = request.params.get("before", None)
     max_actions = request.params.get("max_actions", None)
     run_id = request.params.get("run_id", "")
+    cursor = request.params.get("cursor", "")
 
     if before:
         before = float(before)
@@ -536,7 +548,13 @@ def actions(request):
         utc_before=before,
         max_actions=max_actions,
         run_id=run_id,
+        before_id=cursor if bson.ObjectId.is_valid(cursor) else None,
     )
+    actions = list(actions)
+    next_cursor = str(actions[-1]["_id"]) if actions else None
+    if num_actions >= ACTIONS_COUNT_LIMIT and len(actions) == page_size:
+        # The count is capped, there may be more pages.
+        num_actions = max(num_actions, (page_idx + 2) * page_size)
 
     query_params = ""
     if username:
@@ -552,7 +570,7 @@ def actions(request):
     if run_id:
         query_params += "&run_id={}".format(run_id)
 
-    pages = pagination(page_idx, num_actions, page_size, query_params)
+    pages = pagination(page_idx, num_actions, page_size, query_params, next_cursor)
 
     return {
         "actions": actions,
@@ -1440,6 +1458,7 @@ def tests_delete(request):
             return home(request)
 
         request.rundb.set_inactive_run(run)
+        request.rundb.count_finished_run(run, -1)
         run["deleted"] = True
         try:
             validate(runs_schema, run, "run")
@@ -1798,15 +1817,20 @@ def get_paginated_finished_runs(request):
     page_param = request.params.get("page", "")
     page_idx = max(0, int(page_param) - 1) if page_param.isdigit() else 0
     page_size = 25
+    # The "Next" links carry the cursor of the last run of the page, so
+    # that paging through the history does not skip over the previous pages.
+    before = parse_run_cursor(request.params.get("cursor", ""))
 
     finished_runs, num_finished_runs = request.rundb.get_finished_runs(
         username=username,
         success_only=success_only,
         yellow_only=yellow_only,
         ltc_only=ltc_only,
-        skip=page_idx * page_size,
+        skip=0 if before else page_idx * page_size,
         limit=page_size,
+        before=before,
     )
+    next_cursor = run_cursor(finished_runs[-1]) if finished_runs else None
 
     query_params = ""
     if success_only:
@@ -1815,7 +1839,9 @@ def get_paginated_finished_runs(request):
         query_params += "&yellow_only=1"
     if ltc_only:
         query_params += "&ltc_only=1"
-    pages = pagination(page_idx, num_finished_runs, page_size, query_params)
+    pages = pagination(
+        page_idx, num_finished_runs, page_size, query_params, next_cursor
+    )
 
     failed_runs = []
     if page_idx == 0:
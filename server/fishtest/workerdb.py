@@ -1,6 +1,8 @@
+import threading
 from datetime import UTC, datetime
 
-from fishtest.schemas import worker_schema
+from fishtest.schemas import worker_counters, worker_phases, worker_schema
+from pymongo import UpdateOne
 from vtjson import validate
 
 
@@ -8,6 +10,13 @@ class WorkerDb:
     def __init__(self, db):
         self.db = db
         self.workers = self.db["workers"]
+        # Phase timings reported by the workers, aggregated in memory
+        # and written periodically by flush_telemetry(). They are kept apart
+        # from the workers collection, which holds only the workers that
+        # were blocked or annotated.
+        self.telemetry = self.db["worker_telemetry"]
+        self.telemetry_lock = threading.Lock()
+        self.pending_telemetry = {}
 
     def get_worker(
         self,
@@ -40,3 +49,61 @@ class WorkerDb:
     def get_blocked_workers(self):
         q = {"blocked": True}
         return list(self.workers.find(q))
+
+    def get_telemetry(self, worker_name):
+        return self.telemetry.find_one({"worker_name": worker_name}, {"_id": 0})
+
+    def record_telemetry(self, worker_name, telemetry):
+        # Unknown phases and counters (of newer workers) are ignored.
+        telemetry = {
+            kind: {key: telemetry[kind][key] for key in keys if key in telemetry[kind]}
+            for kind, keys in (("phases", worker_phases), ("counters", worker_counters))
+        }
+        with self.telemetry_lock:
+            self.merge_telemetry(
+                worker_name, {"tasks": 1, **telemetry, "last": telemetry}
+            )
+            self.pending_telemetry[worker_name]["last"] = telemetry
+
+    def merge_telemetry(self, worker_name, pending):
+        # Call with telemetry_lock held. The "last" telemetry which is already
+        # pending is the most recent one.
+        entry = self.pending_telemetry.setdefault(
+            worker_name, {"tasks": 0, "phases": {}, "counters": {}}
+        )
+        entry["tasks"] += pending["tasks"]
+        for kind in ("phases", "counters"):
+            for key, value in pending[kind].items():
+                entry[kind][key] = entry[kind].get(key, 0) + value
+        entry.setdefault("last", pending["last"])
+
+    def flush_telemetry(self):
+        with self.telemetry_lock:
+            pending, self.pending_telemetry = self.pending_telemetry, {}
+        if not pending:
+            return
+        now = datetime.now(UTC)
+        requests = []
+        for worker_name, entry in pending.items():
+            inc = {"tasks": entry["tasks"]}
+            for kind in ("phases", "counters"):
+                for key, value in entry[kind].items():
+                    inc[f"{kind}.{key}"] = value
+            requests.append(
+                UpdateOne(
+                    {"worker_name": worker_name},
+                    {
+                        "$inc": inc,
+                        "$set": {"last": entry["last"], "last_updated": now},
+                    },
+                    upsert=True,
+                )
+            )
+        try:
+            self.telemetry.bulk_write(requests, ordered=False)
+        except Exception:
+            # Keep the telemetry for the next flush.
+            with self.telemetry_lock:
+                for worker_name, entry in pending.items():
+                    self.merge_telemetry(worker_name, entry)
+            raise
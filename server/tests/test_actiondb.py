@@ -0,0 +1,75 @@
+import queue
+import threading
+import unittest
+from unittest import mock
+
+import util
+from fishtest.actiondb import ActionDb
+
+
+class TestActionDb(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rundb = util.get_rundb()
+
+    def setUp(self):
+        self.q = {"username": "travis", "action": "log_message"}
+        self.rundb.db["actions"].delete_many(self.q)
+        self.actiondb = ActionDb(self.rundb.db)
+        self.actiondb.write_queue = queue.Queue(maxsize=2)
+        # The writer thread blocks on its first batch until proceed is set.
+        self.batches = []
+        self.writing = threading.Event()
+        self.proceed = threading.Event()
+        insert_many = self.actiondb.actions.insert_many
+
+        def blocking_insert_many(batch, **kwargs):
+            self.batches.append([action["message"] for action in batch])
+            self.writing.set()
+            self.proceed.wait()
+            return insert_many(batch, **kwargs)
+
+        patcher = mock.patch.object(
+            self.actiondb.actions, "insert_many", side_effect=blocking_insert_many
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.proceed.set()
+        self.actiondb.flush()
+        self.rundb.db["actions"].delete_many(self.q)
+
+    def log(self, message):
+        self.actiondb.log_message(username="travis", message=message)
+
+    def messages(self):
+        return sorted(a["message"] for a in self.rundb.db["actions"].find(self.q))
+
+    def test_batching(self):
+        self.log("0")
+        self.assertTrue(self.writing.wait(5))
+        # Queued while the writer is busy, written together.
+        self.log("1")
+        self.log("2")
+        self.assertEqual(self.messages(), [])
+        self.proceed.set()
+        self.assertTrue(self.actiondb.flush())
+        self.assertEqual(self.batches, [["0"], ["1", "2"]])
+        self.assertEqual(self.messages(), ["0", "1", "2"])
+
+    def test_queue_full(self):
+        self.log("0")
+        self.assertTrue(self.writing.wait(5))
+        self.log("1")
+        self.log("2")
+        # The queue is full, the action is written synchronously.
+        self.log("3")
+        self.assertEqual(self.messages(), ["3"])
+        # The writer is stuck: flush gives up and drops the queued actions.
+        self.assertFalse(self.actiondb.flush(timeout=0.1))
+        self.assertTrue(self.actiondb.write_queue.empty())
+        self.proceed.set()
+        self.assertTrue(self.actiondb.flush())
+        self.assertEqual(self.batches, [["0"]])
+        self.assertEqual(self.messages(), ["0", "3"])
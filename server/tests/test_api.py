@@ -5,9 +5,12 @@ import io
 import sys
 import unittest
 from datetime import UTC, datetime
+from unittest import mock
 
 from fishtest.api import WORKER_VERSION, UserApi, WorkerApi
 from fishtest.run_cache import Prio
+from fishtest.util import parse_run_cursor, run_cursor, worker_name
+from pymongo.errors import AutoReconnect
 from pyramid.httpexceptions import HTTPBadRequest, HTTPUnauthorized
 from pyramid.testing import DummyRequest
 from util import get_rundb
@@ -193,6 +196,95 @@ class TestApi(unittest.TestCase):
         request = DummyRequest(rundb=self.rundb)
         response = UserApi(request).active_runs()
         self.assertTrue(run_id in response)
+        # The runs are copies, not shared with the run cache.
+        self.assertIsNot(
+            response[run_id]["results"], self.rundb.get_run(run_id)["results"]
+        )
+
+    def test_get_active_runs_delta(self):
+        request = DummyRequest(rundb=self.rundb, params={"since": ""})
+        response = UserApi(request).active_runs()
+        self.assertIsNone(response["removed"])
+        version = response["version"]
+        self.assertEqual(request.response.etag, version)
+
+        request = DummyRequest(
+            rundb=self.rundb, headers={"If-None-Match": f'"{version}"'}
+        )
+        response = UserApi(request).active_runs()
+        self.assertEqual(response.status_code, 304)
+
+        run_id = new_run(self)
+        request = DummyRequest(rundb=self.rundb, params={"since": version})
+        response = UserApi(request).active_runs()
+        self.assertEqual(list(response["runs"]), [run_id])
+        self.assertNotIn("tasks", response["runs"][run_id])
+        self.assertEqual(response["removed"], [])
+        version = response["version"]
+
+        run = self.rundb.get_run(run_id)
+        self.rundb.set_inactive_run(run)
+        request = DummyRequest(rundb=self.rundb, params={"since": version})
+        response = UserApi(request).active_runs()
+        self.assertEqual(response["runs"], {})
+        self.assertEqual(response["removed"], [run_id])
+        self.assertIn("tasks", run)
+
+    def test_get_finished_runs(self):
+        count = self.rundb.count_finished_runs(username="travis")
+        run_ids = [new_run(self) for _ in range(3)]
+        for run_id in run_ids:
+            self.rundb.set_inactive_run(self.rundb.get_run(run_id))
+        self.assertEqual(self.rundb.count_finished_runs(username="travis"), count + 3)
+
+        runs, num_runs = self.rundb.get_finished_runs(username="travis", limit=2)
+        self.assertEqual(num_runs, count + 3)
+        before = parse_run_cursor(run_cursor(runs[-1]))
+        more_runs, _ = self.rundb.get_finished_runs(
+            username="travis", limit=2, before=before
+        )
+        listed = [str(run["_id"]) for run in runs + more_runs]
+        self.assertEqual(listed[:3], run_ids[::-1])
+
+        run = self.rundb.get_run(run_ids[0])
+        self.rundb.count_finished_run(run, -1)
+        run["deleted"] = True
+        self.rundb.buffer(run, priority=Prio.SAVE_NOW)
+        self.assertEqual(self.rundb.count_finished_runs(username="travis"), count + 2)
+        runs, _ = self.rundb.get_finished_runs(username="travis", limit=3)
+        self.assertNotIn(run["_id"], [run["_id"] for run in runs])
+
+    def test_actions(self):
+        run_id = new_run(self)
+        run = self.rundb.get_run(run_id)
+        for message in ("first", "second"):
+            self.rundb.actiondb.new_run(username="travis", run=run, message=message)
+        query = {"action": ["new_run"], "run_id": run_id, "limit": 1}
+        request = self.build_json_request(query)
+        response = UserApi(request).actions()
+        self.assertEqual([action["message"] for action in response], ["second"])
+        cursor = request.response.headers["X-Next-Cursor"]
+
+        request = self.build_json_request({**query, "before": cursor, "limit": 5})
+        response = UserApi(request).actions()
+        self.assertEqual([action["message"] for action in response], ["first"])
+
+        first_time = response[0]["time"]
+        request = self.build_json_request(
+            {"run_id": run_id, "time": {"$gte": first_time}}
+        )
+        response = UserApi(request).actions()
+        self.assertEqual(
+            [action["message"] for action in response], ["second", "first"]
+        )
+        request = self.build_json_request(
+            {"run_id": run_id, "time": {"$lt": first_time}}
+        )
+        self.assertEqual(UserApi(request).actions(), [])
+
+        request = self.build_json_request({"run_id": {"$ne": run_id}})
+        with self.assertRaises(HTTPBadRequest):
+            UserApi(request).actions()
 
     def test_get_run(self):
         run_id = new_run(self)
@@ -227,6 +319,13 @@ class TestApi(unittest.TestCase):
 
         self.assertTrue(run_id in runs)
 
+        # The other runs are hinted for background builds.
+        prefetch = response["prefetch"]
+        self.assertEqual(len(prefetch), 2)
+        self.assertEqual(
+            prefetch[0]["resolved_new"], "347d613b0e2c47f90cbf1c5a5affe97303f1ac3d"
+        )
+
         run = self.rundb.get_run(run_id)
         self.assertEqual(len(run["tasks"]), 1)
         self.assertEqual(run["workers"], 1)
@@ -234,6 +333,40 @@ class TestApi(unittest.TestCase):
         task = run["tasks"][task_id]
         self.assertTrue(task["active"])
 
+    def test_request_task_telemetry(self):
+        stop_all_runs(self)
+        new_run(self)
+        telemetry = {
+            "phases": {"build": 12.5, "games": 300.0, "new_phase": 1.0},
+            "counters": {"api_calls": 20, "retries": 1},
+        }
+        request = self.correct_password_request()
+        request.json_body["worker_info"]["telemetry"] = telemetry
+        response = WorkerApi(request).request_task()
+
+        # The telemetry is aggregated per worker, not stored in the task.
+        run = self.rundb.get_run(str(response["run"]["_id"]))
+        task = run["tasks"][response["task_id"]]
+        self.assertNotIn("telemetry", task["worker_info"])
+
+        # The telemetry of a failed flush is written by the next one.
+        with mock.patch.object(
+            self.rundb.workerdb.telemetry,
+            "bulk_write",
+            side_effect=AutoReconnect("failover"),
+        ):
+            with self.assertRaises(AutoReconnect):
+                self.rundb.workerdb.flush_telemetry()
+        self.rundb.workerdb.flush_telemetry()
+        name = worker_name(self.worker_info, short=True)
+        t = self.rundb.workerdb.get_telemetry(name)
+        self.assertEqual(t["tasks"], 1)
+        self.assertEqual(t["phases"], {"build": 12.5, "games": 300.0})
+        self.assertEqual(t["last"]["counters"], telemetry["counters"])
+        # The workers collection holds only blocked or annotated workers.
+        self.assertIsNone(self.rundb.workerdb.workers.find_one({"worker_name": name}))
+        self.rundb.workerdb.telemetry.delete_one({"worker_name": name})
+
     def test_update_task(self):
         stop_all_runs(self)
         run_id = new_run(self)
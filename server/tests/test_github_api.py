@@ -116,6 +116,7 @@ class CreateGitHubApiTest(unittest.TestCase):
         }
         r = gh.compare_sha(sha1=sf10_sha, sha2=sf10_sha)
         self.assertFalse("__error__" in r)
+        self.actiondb.flush()
         a = list(self.actiondb.get_actions(username="fishtest.system")[0])[0]
         print(a)
         self.assertTrue("The previous attempt" in a["message"])
@@ -0,0 +1,44 @@
+import unittest
+
+from fishtest.kvstore import KeyValueStore
+
+
+class TestKeyValueStore(unittest.TestCase):
+    def setUp(self):
+        self.kvstore = KeyValueStore(
+            db_name="fishtest_tests", collection="kvstore_tests"
+        )
+
+    def tearDown(self):
+        for key in list(self.kvstore.keys()):
+            del self.kvstore[key]
+
+    def test_kvstore(self):
+        self.assertNotIn("a", self.kvstore)
+        self.kvstore["a"] = {"x": 1}
+        self.assertIn("a", self.kvstore)
+        self.assertEqual(self.kvstore["a"], {"x": 1})
+        # A write by another process invalidates the cached value.
+        other = KeyValueStore(db_name="fishtest_tests", collection="kvstore_tests")
+        other["a"] = {"x": 2}
+        self.assertEqual(self.kvstore["a"], {"x": 2})
+        self.assertEqual(self.kvstore.pop("a"), {"x": 2})
+        self.assertEqual(self.kvstore.get("a", None), None)
+
+    def test_update_fields(self):
+        value = {"w1": {"last_run": "r1"}, "w2": {"last_run": "r2"}}
+        self.kvstore["runs"] = value
+        value["w1"]["last_run"] = "r3"
+        del value["w2"]
+        value["w.3"] = {"last_run": "r4"}
+        self.kvstore.update_fields("runs", value, set_keys={"w1"}, unset_keys={"w2"})
+        other = KeyValueStore(db_name="fishtest_tests", collection="kvstore_tests")
+        self.assertEqual(other["runs"], {"w1": {"last_run": "r3"}})
+        # A key which is not a field name: the whole value is written.
+        self.kvstore.update_fields("runs", value, set_keys={"w.3"})
+        self.assertEqual(other["runs"], value)
+        self.assertEqual(self.kvstore["runs"], value)
+
+
+if __name__ == "__main__":
+    unittest.main()
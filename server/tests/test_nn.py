@@ -1,6 +1,8 @@
 import unittest
 from datetime import UTC, datetime
+from unittest import mock
 
+from pymongo.errors import AutoReconnect
 from util import get_rundb
 from vtjson import ValidationError
 
@@ -28,10 +30,21 @@ class TestNN(unittest.TestCase):
         net = self.rundb.get_nn(self.name)
         del net["_id"]
         self.assertEqual(net, {"user": self.user, "name": self.name, "downloads": 0})
-        self.rundb.increment_nn_downloads(self.name)
+        self.assertTrue(self.rundb.increment_nn_downloads(self.name))
+        self.assertFalse(self.rundb.increment_nn_downloads("nn-0000000000a1.nnue"))
+        self.rundb.flush_nn_downloads()
         net = self.rundb.get_nn(self.name)
         del net["_id"]
         self.assertEqual(net, {"user": self.user, "name": self.name, "downloads": 1})
+        # The downloads of a failed flush are written by the next one.
+        self.assertTrue(self.rundb.increment_nn_downloads(self.name))
+        with mock.patch.object(
+            self.rundb.nndb, "bulk_write", side_effect=AutoReconnect("failover")
+        ):
+            with self.assertRaises(AutoReconnect):
+                self.rundb.flush_nn_downloads()
+        self.rundb.flush_nn_downloads()
+        self.assertEqual(self.rundb.get_nn(self.name)["downloads"], 2)
         with self.assertRaises(ValidationError) as mc:
             new_net = {
                 "user": self.user,
@@ -75,3 +88,28 @@ class TestNN(unittest.TestCase):
         del net["_id"]
         new_net["downloads"] = 1
         self.assertEqual(net, new_net)
+
+    def test_get_nns(self):
+        names = ["nn-0000000000a0.nnue", "nn-0000000000a1.nnue", "nn-0000000000b0.nnue"]
+        for name in names:
+            self.rundb.upload_nn(self.user, name)
+        self.rundb.upload_nn("otherUser", "nn-0000000000c0.nnue")
+
+        nns, count = self.rundb.get_nns(user="USER0", network_name="NN-0000000000A")
+        self.assertEqual([nn["name"] for nn in nns], names[1::-1])
+        self.assertEqual(count, 2)
+        nns, count = self.rundb.get_nns(network_name="c0")
+        self.assertEqual([nn["user"] for nn in nns], ["otherUser"])
+
+        nns = list(self.rundb.get_nns(limit=2)[0])
+        more_nns, count = self.rundb.get_nns(limit=2, before=nns[-1]["_id"])
+        self.assertEqual([nn["name"] for nn in more_nns], names[1::-1])
+        self.assertEqual(count, 4)
+
+        net = self.rundb.get_nn(names[0])
+        net["is_master"] = True
+        net["first_test"] = {"date": self.first_test, "id": self.run_id}
+        net["last_test"] = {"date": self.last_test, "id": self.run_id}
+        self.rundb.update_nn(net)
+        nns, count = self.rundb.get_nns(master_only=True)
+        self.assertEqual([nn["name"] for nn in nns], names[:1])
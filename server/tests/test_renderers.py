@@ -0,0 +1,52 @@
+import json
+import unittest
+from datetime import UTC, datetime
+
+from bson.binary import Binary
+from bson.objectid import ObjectId
+from fishtest.renderers import dumps, json_renderer_factory
+from pyramid.testing import DummyRequest
+
+
+class JSONRendererTest(unittest.TestCase):
+    def test_bson_types(self):
+        _id = ObjectId()
+        date = datetime(2025, 1, 2, 3, 4, 5, 678000, tzinfo=UTC)
+        doc = {
+            "_id": _id,
+            "last_updated": date,
+            "packed_flips": Binary(b"\x01\xff"),
+            "nested": [{"start_time": date}],
+        }
+        self.assertEqual(
+            json.loads(dumps(doc)),
+            {
+                "_id": str(_id),
+                "last_updated": "2025-01-02 03:04:05.678000+00:00",
+                "packed_flips": [1, 255],
+                "nested": [{"start_time": "2025-01-02 03:04:05.678000+00:00"}],
+            },
+        )
+
+    def test_non_finite_floats(self):
+        doc = {"residual": float("inf"), "values": [float("-inf"), float("nan"), 1.5]}
+        self.assertEqual(
+            json.loads(dumps(doc)),
+            {"residual": "inf", "values": ["-inf", "nan", 1.5]},
+        )
+        # The document itself is not modified.
+        self.assertEqual(doc["residual"], float("inf"))
+
+    def test_unknown_type(self):
+        with self.assertRaises(TypeError):
+            dumps({"set": {1, 2}})
+
+    def test_content_type(self):
+        request = DummyRequest()
+        render = json_renderer_factory(None)
+        self.assertEqual(render({"a": 1}, {"request": request}), '{"a": 1}')
+        self.assertEqual(request.response.content_type, "application/json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from datetime import UTC, datetime
 
 import util
+from fishtest.userdb import UserDb
 from fishtest.views import login, signup
 from pyramid import testing
 
@@ -78,6 +79,35 @@ class Create50LoginTest(unittest.TestCase):
         self.assertEqual(response.code, 302)
         self.assertTrue("The resource was found at" in str(response))
 
+    def test_user_cache(self):
+        userdb = self.rundb.userdb
+        user = userdb.get_user("JoeUser")
+        hits = userdb.cache_info()["hits"]
+        self.assertIs(userdb.get_user("JoeUser"), user)
+        self.assertEqual(userdb.cache_info()["hits"], hits + 1)
+
+        self.assertFalse(userdb.is_blocked("JoeUser"))
+        user["blocked"] = True
+        userdb.save_user(user)
+        self.assertTrue(userdb.is_blocked("JoeUser"))
+        self.assertTrue(userdb.get_user("JoeUser")["blocked"])
+        user["blocked"] = False
+        userdb.save_user(user)
+        self.assertFalse(userdb.is_blocked("JoeUser"))
+
+        # Another instance sees the changes after a refresh, which only reads
+        # the users updated since the previous one.
+        other = UserDb(self.rundb.db)
+        self.assertFalse(other.is_blocked("JoeUser"))
+        user["blocked"] = True
+        userdb.save_user(user)
+        other.blocked_usernames_time = 0
+        self.assertTrue(other.is_blocked("JoeUser"))
+        user["blocked"] = False
+        userdb.save_user(user)
+        other.blocked_usernames_time = 0
+        self.assertFalse(other.is_blocked("JoeUser"))
+
 
 class Create90APITest(unittest.TestCase):
     def setUp(self):
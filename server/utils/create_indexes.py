@@ -27,38 +27,48 @@ def create_runs_indexes():
         name="unfinished_runs",
         partialFilterExpression={"finished": False},
     )
+    # The finished runs are listed newest first, with (last_updated, _id) as
+    # cursor, and without the deleted runs.
     db["runs"].create_index(
-        [("finished", ASCENDING), ("last_updated", DESCENDING)],
+        [("finished", ASCENDING), ("last_updated", DESCENDING), ("_id", DESCENDING)],
         name="finished_runs",
-        partialFilterExpression={"finished": True},
+        partialFilterExpression={"finished": True, "deleted": False},
     )
     db["runs"].create_index(
         [
             ("finished", ASCENDING),
             ("is_green", DESCENDING),
             ("last_updated", DESCENDING),
+            ("_id", DESCENDING),
         ],
         name="finished_green_runs",
-        partialFilterExpression={"finished": True, "is_green": True},
+        partialFilterExpression={"finished": True, "deleted": False, "is_green": True},
     )
     db["runs"].create_index(
         [
             ("finished", ASCENDING),
             ("is_yellow", DESCENDING),
             ("last_updated", DESCENDING),
+            ("_id", DESCENDING),
         ],
         name="finished_yellow_runs",
-        partialFilterExpression={"finished": True, "is_yellow": True},
+        partialFilterExpression={
+            "finished": True,
+            "deleted": False,
+            "is_yellow": True,
+        },
     )
     db["runs"].create_index(
         [
             ("finished", ASCENDING),
             ("last_updated", DESCENDING),
+            ("_id", DESCENDING),
             ("tc_base", DESCENDING),
         ],
         name="finished_ltc_runs",
         partialFilterExpression={
             "finished": True,
+            "deleted": False,
             "tc_base": {"$gte": rundb.ltc_lower_bound},
         },
     )
@@ -71,9 +81,10 @@ def create_runs_indexes():
             ("args.username", DESCENDING),
             ("finished", ASCENDING),
             ("last_updated", DESCENDING),
+            ("_id", DESCENDING),
         ],
         name="finished_user_runs",
-        partialFilterExpression={"finished": True},
+        partialFilterExpression={"finished": True, "deleted": False},
     )
 
 
@@ -85,20 +96,38 @@ def create_pgns_indexes():
 def create_nns_indexes():
     print("Creating indexes on nns collection")
     db["nns"].create_index([("name", DESCENDING)])
+    db["nns"].create_index([("user", ASCENDING), ("_id", DESCENDING)])
+    db["nns"].create_index(
+        [("is_master", ASCENDING), ("_id", DESCENDING)],
+        partialFilterExpression={"is_master": True},
+    )
 
 
 def create_users_indexes():
     db["users"].create_index("username", unique=True)
+    # For the refresh of the blocked users, see UserDb.is_blocked().
+    db["users"].create_index("last_updated")
 
 
 def create_workers_indexes():
     db["workers"].create_index("worker_name", unique=True)
 
 
+def create_worker_telemetry_indexes():
+    db["worker_telemetry"].create_index("worker_name", unique=True)
+    # Forget the workers which did not report for a month.
+    db["worker_telemetry"].create_index(
+        "last_updated", expireAfterSeconds=30 * 24 * 3600
+    )
+
+
 def create_actions_indexes():
     db["actions"].create_index([("username", ASCENDING), ("_id", DESCENDING)])
     db["actions"].create_index([("action", ASCENDING), ("_id", DESCENDING)])
     db["actions"].create_index([("run_id", ASCENDING), ("_id", DESCENDING)])
+    # For the searches by (prefix of the) worker name and by run name.
+    db["actions"].create_index([("worker", ASCENDING), ("_id", DESCENDING)])
+    db["actions"].create_index([("run", ASCENDING), ("_id", DESCENDING)])
     db["actions"].create_index(
         [
             ("action", "text"),
@@ -150,6 +179,9 @@ if __name__ == "__main__":
             if collection_name == "workers":
                 drop_indexes("workers")
                 create_workers_indexes()
+            elif collection_name == "worker_telemetry":
+                drop_indexes("worker_telemetry")
+                create_worker_telemetry_indexes()
             elif collection_name == "actions":
                 drop_indexes("actions")
                 create_actions_indexes()
@@ -1,6 +1,7 @@
 import base64
+import codecs
+import contextlib
 import copy
-import ctypes
 import hashlib
 import io
 import json
@@ -10,6 +11,7 @@ import os
 import platform
 import random
 import re
+import selectors
 import shutil
 import signal
 import statistics
@@ -25,15 +27,25 @@ from queue import Empty, Queue
 from zipfile import ZipFile
 
 try:
-    import requests
-except ImportError:
-    from packages import requests
+    import openlock
+except (ImportError, SyntaxError):
+    from packages import openlock
+from packages import requests
 
 IS_WINDOWS = "windows" in platform.system().lower()
 IS_MACOS = "darwin" in platform.system().lower()
 LOGFILE = "api.log"
+METRICS_FILE = "metrics.jsonl"
+METRICS_FILE_SIZE = 1 << 20
 
 LOG_LOCK = threading.Lock()
+VERIFIED_NETS_LOCK = threading.Lock()
+BENCH_CACHE_LOCK = threading.Lock()
+ENGINE_INFO_LOCK = threading.Lock()
+BENCH_CACHE = {}
+TELEMETRY_LOCK = threading.Lock()
+TELEMETRY = {"phases": {}, "counters": {}}
+CACHE_TOUCHES = {}
 
 
 def text_hash(file):
@@ -80,10 +92,32 @@ def is_64bit():
 HTTP_TIMEOUT = 30.0
 FASTCHESS_KILL_TIMEOUT = 15.0
 UPDATE_RETRY_TIME = 15.0
+UPDATE_RETRY_MAX_TIME = 120.0
+SPOOL_EXPIRATION = 86400.0
+OUTPUT_TICK = 1.0
+BUILD_LOCK_TIMEOUT = 600.0
+BENCH_CACHE_TTL = 3600.0
+BENCH_CALIBRATION_DEPTH = 9
+BENCH_CALIBRATION_TOLERANCE = 0.05
+PREFETCH_NICENESS = 19
+PREFETCH_LOGFILE = "prefetch.log"
 
 RAWCONTENT_HOST = "https://raw.githubusercontent.com"
 API_HOST = "https://api.github.com"
 EXE_SUFFIX = ".exe" if IS_WINDOWS else ""
+VERIFIED_NETS_FILE = "verified_nets.json"
+SPOOL_DIR = "spool"
+CACHE_SIZE = 4 << 30  # size budget of the global cache, see set_cache_size()
+CACHE_INDEX_FILE = "cache_index.json"
+CACHE_INDEX_LOCK = "cache_index.lock"
+CACHE_LOCK_TIMEOUT = 30.0
+CACHE_TOUCH_PERIOD = 3600.0  # granularity of the lru order of the global cache
+CACHE_TMP_EXPIRATION = 86400.0
+HASH_CHUNK_SIZE = 1 << 20
+SOURCES_DIR = "sources"
+SOURCES_BACKUPS = 4
+# The parts of the Stockfish repository which are needed to build it.
+BUILD_MEMBERS = ("src/", "scripts/")
 
 
 def log(s):
@@ -105,6 +139,52 @@ def backup_log():
         print(f"Exception moving log:\n{e}", file=sys.stderr)
 
 
+@contextlib.contextmanager
+def timed_phase(phase):
+    """Add the wall time of the enclosed code to the telemetry of the task"""
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - t0
+        with TELEMETRY_LOCK:
+            phases = TELEMETRY["phases"]
+            phases[phase] = phases.get(phase, 0.0) + elapsed
+
+
+def count_event(counter, n=1):
+    with TELEMETRY_LOCK:
+        counters = TELEMETRY["counters"]
+        counters[counter] = counters.get(counter, 0) + n
+
+
+def reset_telemetry():
+    """Start the telemetry of a new task and return the previous one"""
+    global TELEMETRY
+    with TELEMETRY_LOCK:
+        telemetry, TELEMETRY = TELEMETRY, {"phases": {}, "counters": {}}
+    return telemetry
+
+
+def write_metrics(record):
+    """Append a record to the metrics file, which is rotated like the log"""
+    try:
+        metrics_file = Path(__file__).resolve().parent / METRICS_FILE
+        metrics_file_previous = metrics_file.with_suffix(
+            metrics_file.suffix + ".previous"
+        )
+        with LOG_LOCK:
+            if (
+                metrics_file.exists()
+                and metrics_file.stat().st_size > METRICS_FILE_SIZE
+            ):
+                metrics_file.replace(metrics_file_previous)
+            with open(metrics_file, "a") as f:
+                f.write(json.dumps(record) + "\n")
+    except Exception as e:
+        print(f"Exception writing metrics:\n{e}", file=sys.stderr)
+
+
 def str_signal(signal_):
     try:
         return signal.Signals(signal_).name
@@ -122,6 +202,8 @@ def format_returncode(r):
 
 
 def send_ctrl_c(pid):
+    import ctypes  # only on Windows
+
     kernel = ctypes.windll.kernel32
     _ = (
         kernel.FreeConsole()
@@ -164,7 +246,9 @@ def trim_files(testing_dir, source_dir=None):
         ("fastchess" + EXE_SUFFIX, 1, math.inf, False),
         ("stockfish-*-old" + EXE_SUFFIX, 0, -1, True),
         ("stockfish-*" + EXE_SUFFIX, 50, 30, False),
+        ("uci-stockfish-*.json", 50, 30, False),
         ("nn-*.nnue", 10, 30, False),
+        (VERIFIED_NETS_FILE, 1, math.inf, True),
         ("results-*.pgn", 0, -1, True),
         ("*.epd", 4, 365, False),
         ("*.pgn", 4, 365, False),
@@ -199,29 +283,87 @@ def trim_files(testing_dir, source_dir=None):
     print(f"Cleaning up old files: {num_deleted} old files removed...")
 
 
+def set_cache_size(size):
+    """Set the size budget in bytes of the global cache"""
+    global CACHE_SIZE
+    CACHE_SIZE = size
+
+
+def is_cache_entry(name):
+    # Skip the index, the lock files and the temporary files of pending
+    # writes (also those of openlock), which are not cached data.
+    return not (
+        name.startswith(CACHE_INDEX_FILE)
+        or name.endswith(".lock")
+        or name.startswith("tmp")
+    )
+
+
+@contextlib.contextmanager
+def cache_index(cache):
+    """Yield the index of the global cache, locked against other workers,
+    and save it when the enclosed code does not raise. The index maps the
+    name of every entry to its size and the time of its last use."""
+    index_lock = openlock.FileLock(Path(cache) / CACHE_INDEX_LOCK)
+    index_lock.acquire(timeout=CACHE_LOCK_TIMEOUT)
+    try:
+        index_file = Path(cache) / CACHE_INDEX_FILE
+        try:
+            index = json.loads(index_file.read_text())
+        except FileNotFoundError:
+            index = {}
+        except Exception as e:
+            print(f"Rebuilding the invalid index of {cache}:\n{e}", file=sys.stderr)
+            index = {}
+        yield index
+        tmp_file = index_file.with_name(f"{index_file.name}.{os.getpid()}")
+        tmp_file.write_text(json.dumps(index))
+        tmp_file.replace(index_file)
+    finally:
+        index_lock.release()
+
+
 def cache_read(cache, name):
     """Read a binary blob of data from a global cache on disk, None if not available"""
     if cache == "":
         return None
 
     try:
-        return (Path(cache) / name).read_bytes()
+        data = (Path(cache) / name).read_bytes()
     except Exception:
         return None
+    cache_touch(cache, name)
+    return data
 
 
 def cache_write(cache, name, data):
     """Write a binary blob of data to a global cache on disk in an atomic way, skip if not available"""
+    cache_write_with(cache, name, lambda f: f.write(data))
+
+
+def cache_write_file(cache, name, path):
+    """Copy a file to a global cache on disk in an atomic way, skip if not available"""
+
+    def copy(f):
+        with open(path, "rb") as g:
+            shutil.copyfileobj(g, f, HASH_CHUNK_SIZE)
+
+    cache_write_with(cache, name, copy)
+
+
+def cache_write_with(cache, name, write):
     if cache == "":
         return
 
     try:
         temp_file = tempfile.NamedTemporaryFile(dir=cache, delete=False)
-        temp_file.write(data)
+        write(temp_file)
         temp_file.flush()
         os.fsync(temp_file.fileno())  # Ensure data is written to disk
         temp_file.close()
 
+        size = os.path.getsize(temp_file.name)
+
         # try linking, which is atomic, and will fail if the file exists
         try:
             os.link(temp_file.name, Path(cache) / name)
@@ -233,6 +375,46 @@ def cache_write(cache, name, data):
     except Exception:
         return
 
+    try:
+        with cache_index(cache) as index:
+            index[name] = {"size": size, "atime": time.time()}
+    except Exception as e:
+        print(f"Exception indexing {name} in {cache}:\n{e}", file=sys.stderr)
+    trim_cache(cache, keep=name)
+
+
+def cache_file(cache, name):
+    """The path of a file in the global cache, None if not available"""
+    if cache == "":
+        return None
+
+    path = Path(cache) / name
+    if not path.is_file():
+        return None
+    cache_touch(cache, name)
+    return path
+
+
+def cache_touch(cache, name):
+    """Mark a file in the global cache as recently used"""
+    if cache == "":
+        return
+
+    # Rewriting the index for every read would be wasteful: the lru order
+    # needs no more precision than CACHE_TOUCH_PERIOD.
+    now = time.time()
+    if now - CACHE_TOUCHES.get((cache, name), 0.0) < CACHE_TOUCH_PERIOD:
+        return
+    CACHE_TOUCHES[(cache, name)] = now
+    try:
+        os.utime(Path(cache) / name)
+        with cache_index(cache) as index:
+            entry = index.get(name)
+            if entry is not None:
+                entry["atime"] = now
+    except Exception:
+        return
+
 
 def cache_remove(cache, name):
     """Remove a file from the global cache on disk"""
@@ -241,10 +423,76 @@ def cache_remove(cache, name):
 
     try:
         (Path(cache) / name).unlink()
+        with cache_index(cache) as index:
+            index.pop(name, None)
     except Exception:
         return
 
 
+def trim_cache(cache, max_size=None, keep=None):
+    """Delete the least recently used files from the global cache until it
+    fits in its size budget. The file named keep, if any, is not deleted."""
+    if cache == "":
+        return
+    if max_size is None:
+        max_size = CACHE_SIZE
+
+    try:
+        with cache_index(cache) as index:
+            # Synchronize the index with the directory, which may have been
+            # modified by hand, by older workers or by a crashed worker.
+            now = time.time()
+            files = {}
+            for path in Path(cache).iterdir():
+                st = path.stat()
+                if is_cache_entry(path.name):
+                    files[path.name] = st
+                elif (
+                    path.name.startswith("tmp")
+                    and st.st_mtime < now - CACHE_TMP_EXPIRATION
+                ):
+                    path.unlink()
+            for name in list(index):
+                if name not in files:
+                    del index[name]
+            for name, st in files.items():
+                if name not in index:
+                    index[name] = {"size": st.st_size, "atime": st.st_mtime}
+
+            # A file and its hash are evicted together: a cached engine or
+            # zipball is useless without its hash, and the other way round.
+            units = {}
+            for name in index:
+                base = name[: -len(".sha256")] if name.endswith(".sha256") else name
+                units.setdefault(base if base in index else name, []).append(name)
+            total_size = sum(entry["size"] for entry in index.values())
+            lru = sorted(
+                units.values(),
+                key=lambda names: max(index[name]["atime"] for name in names),
+            )
+            num_deleted = 0
+            for names in lru:
+                if total_size <= max_size:
+                    break
+                if keep in names:
+                    continue
+                # The file goes first, so that it is never seen without its hash.
+                for name in sorted(names, key=lambda name: name.endswith(".sha256")):
+                    try:
+                        (Path(cache) / name).unlink()
+                    except OSError:
+                        # Probably still being read by another worker on
+                        # Windows, try again the next time.
+                        break
+                    total_size -= index.pop(name)["size"]
+                    num_deleted += 1
+    except Exception as e:
+        print(f"Exception trimming {cache}:\n{e}", file=sys.stderr)
+        return
+    if num_deleted > 0:
+        print(f"Trimming the global cache: {num_deleted} files removed...")
+
+
 # For background see:
 # https://stackoverflow.com/questions/16511337/correct-way-to-try-except-using-python-requests-module
 # It may be useful to introduce more refined http exception handling in the future.
@@ -259,9 +507,32 @@ def requests_get(remote, *args, **kw):
         print(f"Exception in requests.get():\n{e}", file=sys.stderr)
         raise WorkerException(f"Get request to {remote} failed.", e=e)
 
+    if not kw.get("stream", False):
+        count_event("bytes_received", len(result.content))
     return result
 
 
+def download_to_file(url, path):
+    """Stream the content of url to path without holding it in memory and
+    return its sha256"""
+    sha256 = hashlib.sha256()
+    temp_file = tempfile.NamedTemporaryFile(dir=path.parent, delete=False)
+    try:
+        with temp_file, requests_get(url, stream=True, timeout=HTTP_TIMEOUT) as r:
+            for chunk in r.iter_content(HASH_CHUNK_SIZE):
+                temp_file.write(chunk)
+                sha256.update(chunk)
+                count_event("bytes_received", len(chunk))
+        os.replace(temp_file.name, path)
+    except Exception as e:
+        try:
+            os.remove(temp_file.name)
+        except OSError:
+            pass
+        raise WorkerException(f"Download of {url} failed.", e=e)
+    return sha256.hexdigest()
+
+
 def requests_post(remote, *args, **kw):
     # A lightweight wrapper around requests.post()
     try:
@@ -275,12 +546,16 @@ def requests_post(remote, *args, **kw):
 
 def send_api_post_request(api_url, payload, quiet=False):
     t0 = datetime.now(timezone.utc)
+    data = json.dumps(payload)
+    count_event("api_calls")
+    count_event("bytes_sent", len(data))
     response = requests_post(
         api_url,
-        data=json.dumps(payload),
+        data=data,
         headers={"Content-Type": "application/json"},
         timeout=HTTP_TIMEOUT,
     )
+    count_event("bytes_received", len(response.content))
     valid_response = True
     try:
         response = response.json()
@@ -320,13 +595,101 @@ def post_to_worker_log(worker_info, password, remote, message):
         print(f"Exception while posting to worker log:\n{e}", file=sys.stderr)
 
 
+def spool_path(result):
+    name = "{}-{}.json".format(result["run_id"], result["task_id"])
+    return Path(__file__).resolve().parent / SPOOL_DIR / name
+
+
+def spool_update(result):
+    """Persist the latest update of a task so that it survives an outage
+    of the server or a restart of the worker."""
+    path = spool_path(result)
+    path.parent.mkdir(exist_ok=True)
+    update = {k: v for k, v in result.items() if k != "password"}
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(update, f)
+    os.replace(tmp_path, path)
+
+
+def unspool_update(result):
+    try:
+        spool_path(result).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def replay_spooled_updates(remote, password):
+    """Send the updates that could not be delivered before. The spool is
+    kept if the server is still unreachable."""
+    spool_dir = Path(__file__).resolve().parent / SPOOL_DIR
+    for path in sorted(spool_dir.glob("*.json")):
+        try:
+            expired = time.time() - path.stat().st_mtime > SPOOL_EXPIRATION
+            with open(path) as f:
+                update = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Unable to read the spooled update {path}:\n{e}", file=sys.stderr)
+            expired = True
+        if not expired:
+            print(f"Replaying the spooled update {path.name}...")
+            update["password"] = password
+            try:
+                send_api_post_request(remote + "/api/update_task", update)
+            except FatalException:
+                raise
+            except Exception as e:
+                print(f"Exception replaying {path.name}:\n{e}", file=sys.stderr)
+                return
+        try:
+            path.unlink()
+        except OSError as e:
+            print(f"Unable to remove the spooled update {path}:\n{e}", file=sys.stderr)
+
+
 def github_api(repo):
     """Convert from https://github.com/<user>/<repo>
     To https://api.github.com/repos/<user>/<repo>"""
     return repo.replace("https://github.com", "https://api.github.com/repos")
 
 
+def engine_info_path(engine):
+    return engine.with_name("uci-" + engine.name + ".json")
+
+
+def read_engine_info(engine):
+    """The cached UCI info of an engine, empty if the engine has changed since"""
+    try:
+        with open(engine_info_path(engine), "r") as f:
+            engine_info = json.load(f)
+        if engine_info["identity"] != file_identity(engine):
+            return {}
+    except Exception:
+        return {}
+    update_atime(engine_info_path(engine))
+    return engine_info
+
+
+def update_engine_info(engine, **kw):
+    engine_info_file = engine_info_path(engine)
+    tmp_file = engine_info_file.with_suffix(f".{os.getpid()}.tmp")
+    with ENGINE_INFO_LOCK:
+        engine_info = read_engine_info(engine)
+        try:
+            engine_info.update(kw)
+            engine_info["identity"] = file_identity(engine)
+            with open(tmp_file, "w") as f:
+                json.dump(engine_info, f)
+            tmp_file.replace(engine_info_file)
+        except Exception as e:
+            print(f"Exception writing {engine_info_file}:\n{e}", file=sys.stderr)
+
+
 def required_nets(engine):
+    nets = read_engine_info(engine).get("nets")
+    if nets is not None:
+        return nets
+
     nets = {}
     pattern = re.compile(r"(EvalFile\w*)\s+.*\s+(nn-[a-f0-9]{12}.nnue)")
     print(f"Obtaining EvalFile of {engine.name}...")
@@ -351,6 +714,7 @@ def required_nets(engine):
             f"UCI exited with non-zero code {format_returncode(p.returncode)}."
         )
 
+    update_engine_info(engine, nets=nets)
     return nets
 
 
@@ -397,19 +761,92 @@ def fetch_validated_net(remote, testing_dir, net, global_cache):
         print(f"Using {net} from global cache.")
 
     (testing_dir / net).write_bytes(content)
+    record_verified_net(testing_dir, net, hashlib.sha256(content).hexdigest())
     return True
 
 
-def is_valid_net(content, net):
-    net_hash = hashlib.sha256(content).hexdigest()
+def net_hash_matches(net_hash, net):
     return net_hash[:12] == net[3:15]
 
 
+def is_valid_net(content, net):
+    return net_hash_matches(hashlib.sha256(content).hexdigest(), net)
+
+
+def file_sha256(path):
+    # Hash the file in chunks so that we never hold a full net in memory.
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def file_identity(path):
+    # If any of these change then the file has to be hashed again.
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def read_verified_nets(testing_dir):
+    try:
+        with open(testing_dir / VERIFIED_NETS_FILE, "r") as f:
+            verified_nets = json.load(f)
+    except Exception:
+        return {}
+    return verified_nets if isinstance(verified_nets, dict) else {}
+
+
+def write_verified_nets(testing_dir, verified_nets):
+    verified_nets_file = testing_dir / VERIFIED_NETS_FILE
+    # Background builds run in another process.
+    tmp_file = verified_nets_file.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump(verified_nets, f)
+        tmp_file.replace(verified_nets_file)
+    except Exception as e:
+        print(f"Exception writing {verified_nets_file}:\n{e}", file=sys.stderr)
+
+
+def record_verified_net(testing_dir, net, net_hash):
+    with VERIFIED_NETS_LOCK:
+        verified_nets = read_verified_nets(testing_dir)
+        try:
+            verified_nets[net] = {
+                "identity": file_identity(testing_dir / net),
+                "sha256": net_hash,
+            }
+        except OSError:
+            verified_nets.pop(net, None)
+        # Forget nets that have been trimmed in the meantime.
+        verified_nets = {
+            k: v for k, v in verified_nets.items() if (testing_dir / k).exists()
+        }
+        write_verified_nets(testing_dir, verified_nets)
+
+
 def validate_net(testing_dir, net):
-    content = (testing_dir / net).read_bytes()
-    return is_valid_net(content, net)
+    # The file identity (size, mtime, inode) is recorded together with the
+    # hash when a net has been verified, so unchanged files are not hashed
+    # again when a new task starts.
+    path = testing_dir / net
+    with VERIFIED_NETS_LOCK:
+        entry = read_verified_nets(testing_dir).get(net)
+    if (
+        isinstance(entry, dict)
+        and entry.get("identity") == file_identity(path)
+        and net_hash_matches(entry.get("sha256", ""), net)
+    ):
+        return True
+    net_hash = file_sha256(path)
+    if not net_hash_matches(net_hash, net):
+        return False
+    record_verified_net(testing_dir, net, net_hash)
+    return True
 
 
+@timed_phase("net")
 def establish_validated_net(remote, testing_dir, net, global_cache):
     if (testing_dir / net).exists() and validate_net(testing_dir, net):
         update_atime(testing_dir / net)
@@ -436,36 +873,122 @@ def establish_validated_net(remote, testing_dir, net, global_cache):
             time.sleep(waitTime)
 
 
-def run_single_bench(engine, hash_size, threads, depth, timeout=600):
+def parse_cpulist(cpulist):
+    # Parse a list of cpus in the kernel format, e.g. "0-3,8-11".
+    cpus = []
+    for item in cpulist.strip().split(","):
+        if item:
+            first, _, last = item.partition("-")
+            cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpulist(cpus):
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def numa_nodes():
+    """The cpus of each numa node that we are allowed to use, [] if unknown"""
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+    usable = os.sched_getaffinity(0)
+    nodes = []
+    node_dirs = Path("/sys/devices/system/node").glob("node[0-9]*")
+    for node_dir in sorted(node_dirs, key=lambda d: int(d.name[4:])):
+        try:
+            cpus = parse_cpulist((node_dir / "cpulist").read_text())
+        except (OSError, ValueError):
+            continue
+        cpus = [cpu for cpu in cpus if cpu in usable]
+        if cpus:
+            nodes.append(cpus)
+    # Without numa information the machine is a single node.
+    return nodes if nodes else [sorted(usable)]
+
+
+def allocate_cpus(nodes, sizes):
+    """Carve cpu sets of the given sizes out of the numa nodes, each one on a
+    single node if possible. None if there are not enough cpus."""
+    free = [list(cpus) for cpus in nodes]
+    allocation = []
+    for size in sizes:
+        # Use the node with the most free cpus, to balance the load.
+        node = max(free, key=len)
+        if len(node) < size:
+            # Straddle nodes, starting with the emptiest ones.
+            free.sort(key=len)
+            node = [cpu for cpus in free for cpu in cpus]
+            if len(node) < size:
+                return None
+        allocation.append(node[:size])
+        used = set(node[:size])
+        free = [[cpu for cpu in cpus if cpu not in used] for cpus in free]
+    return allocation
+
+
+def game_slot_cpus(games_concurrency, threads):
+    """The cpus of each game slot (engine pair), None if they cannot be pinned"""
+    cpus = allocate_cpus(numa_nodes(), games_concurrency * [threads])
+    if cpus is None:
+        print("Not enough cpus available to pin the games.")
+    else:
+        print(f"Pinning the games to cpus {format_cpulist(sum(cpus, []))}.")
+    return cpus
+
+
+@contextlib.contextmanager
+def cpu_affinity(cpus):
+    """Run the calling thread, and the processes it starts, on the given cpus"""
+    if cpus is None:
+        yield
+        return
+    saved_cpus = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cpus)
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, saved_cpus)
+
+
+def run_single_bench(engine, hash_size, threads, depth, timeout=600, cpus=None):
     bench_time, bench_nodes = None, None
     try:
-        with subprocess.Popen(
-            [
-                engine,
-                "bench",
-                str(hash_size),
-                str(threads),
-                str(depth),
-                "default",
-                "depth",
-            ],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.DEVNULL,
-            universal_newlines=True,
-            bufsize=1,
-            close_fds=not IS_WINDOWS,
-        ) as p:
-            try:
-                _, stderr_data = p.communicate(timeout=timeout)
-            except subprocess.TimeoutExpired as e:
-                p.kill()
-                message = f"Bench of {engine.name} timed out after {timeout} seconds."
-                raise RunException(message) from e
-            for line in stderr_data.splitlines():
-                if "Total time (ms)" in line:
-                    bench_time = float(line.split(": ")[1].strip())
-                if "Nodes searched" in line:
-                    bench_nodes = float(line.split(": ")[1].strip())
+        with cpu_affinity(cpus):
+            with subprocess.Popen(
+                [
+                    engine,
+                    "bench",
+                    str(hash_size),
+                    str(threads),
+                    str(depth),
+                    "default",
+                    "depth",
+                ],
+                stderr=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                universal_newlines=True,
+                bufsize=1,
+                close_fds=not IS_WINDOWS,
+            ) as p:
+                try:
+                    _, stderr_data = p.communicate(timeout=timeout)
+                except subprocess.TimeoutExpired as e:
+                    p.kill()
+                    message = (
+                        f"Bench of {engine.name} timed out after {timeout} seconds."
+                    )
+                    raise RunException(message) from e
+                for line in stderr_data.splitlines():
+                    if "Total time (ms)" in line:
+                        bench_time = float(line.split(": ")[1].strip())
+                    if "Nodes searched" in line:
+                        bench_nodes = float(line.split(": ")[1].strip())
     except (OSError, subprocess.SubprocessError) as e:
         raise e
 
@@ -476,7 +999,8 @@ def run_single_bench(engine, hash_size, threads, depth, timeout=600):
     return bench_time, bench_nodes
 
 
-def run_parallel_benches(engine, concurrency, threads, hash_size, depth):
+def run_parallel_benches(engine, concurrency, threads, hash_size, depth, cpus=None):
+    # The benches are pinned like the game slots, if requested.
     try:
         with ThreadPoolExecutor(max_workers=concurrency) as executor:
             results = list(
@@ -486,6 +1010,8 @@ def run_parallel_benches(engine, concurrency, threads, hash_size, depth):
                     [hash_size] * concurrency,
                     [threads] * concurrency,
                     [depth] * concurrency,
+                    [600] * concurrency,
+                    cpus or [None] * concurrency,
                 )
             )
     except Exception as e:
@@ -495,15 +1021,48 @@ def run_parallel_benches(engine, concurrency, threads, hash_size, depth):
     return results
 
 
-def get_bench_nps(engine, games_concurrency, threads, hash_size):
-    _depth, depth = 11, 13
-    print("Warmup for bench...")
+def share_bench_cache(bench_cache, bench_cache_lock):
+    """Let the slots of a worker, running in separate processes, share their benches"""
+    global BENCH_CACHE, BENCH_CACHE_LOCK
+    BENCH_CACHE, BENCH_CACHE_LOCK = bench_cache, bench_cache_lock
+
+
+@timed_phase("bench")
+def get_bench_nps(engine, games_concurrency, threads, hash_size, cpus=None):
+    # The full bench is cached per engine build and bench setup. A cached
+    # value is only used if a short calibration bench shows that the machine
+    # still runs at the same speed (load and thermal conditions may change).
+    # The calibration bench is also the warmup of the full bench. The name of
+    # the engine identifies its build (sha, compiler and environment), also
+    # across the slots of a worker.
+    placement = tuple(map(tuple, cpus)) if cpus is not None else None
+    key = (engine.name, games_concurrency, threads, hash_size, placement)
+    print("Calibration bench...")
     results = run_parallel_benches(
-        engine, games_concurrency, threads, hash_size, _depth
+        engine, games_concurrency, threads, hash_size, BENCH_CALIBRATION_DEPTH, cpus
     )
+    calibration_nps = statistics.mean([1000 * bn / bt / threads for bt, bn in results])
     print(f"...done in {results[0][0]:.2f}ms.")
+    with BENCH_CACHE_LOCK:
+        cached = BENCH_CACHE.get(key)
+    if cached is not None and time.time() < cached["time"] + BENCH_CACHE_TTL:
+        deviation = calibration_nps / cached["calibration_nps"] - 1
+        if abs(deviation) <= BENCH_CALIBRATION_TOLERANCE:
+            print(
+                f"Using the cached bench of {engine.name}: {cached['nps']:.2f} nps "
+                f"(calibration deviation {100 * deviation:.2f}%)."
+            )
+            return cached["nps"]
+        print(
+            f"Calibration deviation {100 * deviation:.2f}% is too large, "
+            "running a full bench."
+        )
+
+    depth = 13
     print("Running bench...")
-    results = run_parallel_benches(engine, games_concurrency, threads, hash_size, depth)
+    results = run_parallel_benches(
+        engine, games_concurrency, threads, hash_size, depth, cpus
+    )
 
     bench_nodes_values = [bn for _, bn in results]
     bench_time_values = [bt for bt, _ in results]
@@ -529,14 +1088,25 @@ def get_bench_nps(engine, games_concurrency, threads, hash_size):
         f"{'Max nps':<15}: {max_nps:15.2f}\n"
         f"{'Stdev (%)':<15}: {100 * stdev_nps / mean_nps:15.2f}"
     )
+    with BENCH_CACHE_LOCK:
+        BENCH_CACHE[key] = {
+            "nps": mean_nps,
+            "calibration_nps": calibration_nps,
+            "time": time.time(),
+        }
     return mean_nps
 
 
 def verify_signature(engine, signature):
-    hash_size, threads, depth = 16, 1, 13
-    print("Computing engine signature...")
-    bench_time, bench_nodes = run_single_bench(engine, hash_size, threads, depth)
-    print(f"...done in {bench_time:.2f}ms.")
+    bench_nodes = read_engine_info(engine).get("signature")
+    if bench_nodes is None:
+        hash_size, threads, depth = 16, 1, 13
+        print("Computing engine signature...")
+        bench_time, bench_nodes = run_single_bench(engine, hash_size, threads, depth)
+        print(f"...done in {bench_time:.2f}ms.")
+        update_engine_info(engine, signature=int(bench_nodes))
+    else:
+        print(f"Using the cached signature of {engine.name}.")
     if int(bench_nodes) != int(signature):
         message = (
             f"Wrong bench in {engine.name}, "
@@ -546,6 +1116,10 @@ def verify_signature(engine, signature):
 
 
 def get_cpu_features(engine):
+    cpu_features = read_engine_info(engine).get("cpu_features")
+    if cpu_features is not None:
+        return cpu_features
+
     cpu_features = "?"
     with subprocess.Popen(
         [engine, "compiler"],
@@ -561,6 +1135,7 @@ def get_cpu_features(engine):
     if p.returncode != 0:
         message = f"Compiler info exited with non-zero code {format_returncode(p.returncode)}."
         raise WorkerException(message)
+    update_engine_info(engine, cpu_features=cpu_features)
     return cpu_features
 
 
@@ -610,6 +1185,123 @@ def unzip(blob, save_dir):
     return file_list
 
 
+def unzip_members(zip_path, save_dir, prefixes):
+    """Extract the members of a zipball (a single directory, like the ones of
+    github) whose path in that directory starts with one of the prefixes.
+    Return the path of the extracted directory."""
+    with ZipFile(zip_path) as zip_file:
+        names = zip_file.namelist()
+        top = names[0].split("/")[0] + "/"
+        members = [
+            name
+            for name in names
+            if name.startswith(top) and name[len(top) :].startswith(prefixes)
+        ]
+        if not members:
+            raise WorkerException(f"{zip_path.name} does not contain {prefixes}.")
+        for member in members:
+            zip_file.extract(member, save_dir)
+    return Path(save_dir) / top
+
+
+def trim_sources(sources_dir, keep):
+    """Delete the least recently used source trees, except the ones being used"""
+    trees = sorted(
+        (
+            path
+            for path in sources_dir.iterdir()
+            if path.is_dir() and not path.name.startswith("tmp")
+        ),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for path in trees[keep:]:
+        lock = openlock.FileLock(sources_dir / f"{path.name}.lock")
+        try:
+            lock.acquire(timeout=0)
+        except openlock.Timeout:
+            continue
+        try:
+            shutil.rmtree(path)
+        except Exception as e:
+            print(f"Failed to delete the sources {path}:\n{e}", file=sys.stderr)
+        finally:
+            lock.release()
+
+
+def setup_sources(worker_dir, sha, repo_url, global_cache, build_dir):
+    """Copy the sources of the commit sha to build_dir. The extracted sources
+    are kept per sha, so that the builds of the same commit (e.g. with other
+    compilers, or by the prefetcher) do not download and unpack them again."""
+    sources_dir = worker_dir / SOURCES_DIR
+    sources_dir.mkdir(exist_ok=True)
+    tree = sources_dir / sha
+    with openlock.FileLock(sources_dir / f"{sha}.lock"):
+        if not tree.is_dir():
+            extract_sources(sources_dir, sha, repo_url, global_cache)
+        else:
+            print(f"Using the sources in {tree}.")
+        os.utime(tree)
+        shutil.copytree(str(tree), str(build_dir))
+    trim_sources(sources_dir, SOURCES_BACKUPS)
+
+
+def extract_sources(sources_dir, sha, repo_url, global_cache):
+    zipball = sha + ".zip"
+    zip_path = cache_file(global_cache, zipball)
+    zip_hash = None
+    if zip_path is not None:
+        # The hash is published first, see below.
+        zip_hash = cache_read(global_cache, zipball + ".sha256")
+        if zip_hash is not None and file_sha256(zip_path) != zip_hash.decode().strip():
+            print(f"Removing invalid {zipball} from global cache.")
+            cache_remove(global_cache, zipball)
+            cache_remove(global_cache, zipball + ".sha256")
+            zip_path = None
+        else:
+            print(f"Using {zipball} from global cache.")
+
+    if zip_path is not None and zip_hash is None:
+        # Older workers cache the zipball without its hash. It is good if it
+        # unzips cleanly, and then we record its hash.
+        try:
+            unzip_sources(zip_path, sources_dir, sha)
+        except Exception as e:
+            print(f"Removing invalid {zipball} from global cache:\n{e}")
+            cache_remove(global_cache, zipball)
+            zip_path = None
+        else:
+            zip_hash = file_sha256(zip_path).encode()
+            cache_write(global_cache, zipball + ".sha256", zip_hash)
+            return
+
+    downloaded = zip_path is None
+    if downloaded:
+        item_url = github_api(repo_url) + "/zipball/" + sha
+        print(f"Downloading {item_url}...")
+        zip_path = sources_dir / zipball
+        with timed_phase("download"):
+            zip_hash = download_to_file(item_url, zip_path)
+
+    try:
+        unzip_sources(zip_path, sources_dir, sha)
+        # once unzipped without error we can write as needed
+        if downloaded:
+            cache_write(global_cache, zipball + ".sha256", zip_hash.encode())
+            cache_write_file(global_cache, zipball, zip_path)
+    finally:
+        if downloaded:
+            zip_path.unlink()
+
+
+def unzip_sources(zip_path, sources_dir, sha):
+    tmp_dir = Path(tempfile.mkdtemp(dir=sources_dir, prefix="tmp-"))
+    try:
+        unzip_members(zip_path, tmp_dir, BUILD_MEMBERS).replace(sources_dir / sha)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
 def clang_props():
     """Parse the output of clang++ -E - -march=native -### and extract the available clang properties"""
     with subprocess.Popen(
@@ -789,6 +1481,62 @@ def find_arch(compiler):
     return arch
 
 
+def host_arch_key(compiler):
+    """A short hash of the cpu/compiler properties which determine the arch of a build"""
+    try:
+        props = gcc_props() if compiler == "g++" else clang_props()
+    except Exception as e:
+        print(f"Exception obtaining the {compiler} properties:\n{e}", file=sys.stderr)
+        return None
+    key = props["arch"] + ":" + ",".join(sorted(props["flags"]))
+    return hashlib.sha256(key.encode()).hexdigest()[0:10]
+
+
+def engine_cache_name(engine_path, arch_key):
+    return f"{engine_path.stem}-{arch_key}{engine_path.suffix}"
+
+
+def engine_cache_read(global_cache, engine_path, arch_key):
+    """Copy a verified engine from the global cache to engine_path, False if not available"""
+    name = engine_cache_name(engine_path, arch_key)
+    blob = cache_read(global_cache, name)
+    if blob is None:
+        return False
+    engine_hash = cache_read(global_cache, name + ".sha256")
+    if (
+        engine_hash is None
+        or hashlib.sha256(blob).hexdigest() != engine_hash.decode().strip()
+    ):
+        print(f"Removing invalid {name} from global cache.")
+        cache_remove(global_cache, name)
+        cache_remove(global_cache, name + ".sha256")
+        return False
+    tmp_path = engine_path.with_name(engine_path.name + ".tmp")
+    tmp_path.write_bytes(blob)
+    tmp_path.chmod(0o755)
+    tmp_path.replace(engine_path)
+    print(f"Using {name} from global cache.")
+    return True
+
+
+def engine_cache_write(global_cache, engine_path, arch_key):
+    """Publish a freshly built engine in the global cache"""
+    name = engine_cache_name(engine_path, arch_key)
+    blob = engine_path.read_bytes()
+    engine_hash = hashlib.sha256(blob).hexdigest().encode()
+    # Profile-guided builds are not reproducible, so concurrent builds of the
+    # same engine differ. The engine and its hash are published together, by
+    # the first of them.
+    with openlock.FileLock(Path(global_cache) / f"{name}.lock", CACHE_LOCK_TIMEOUT):
+        if (Path(global_cache) / name).exists():
+            return
+        # A hash left behind without its engine would not be replaced.
+        cache_remove(global_cache, name + ".sha256")
+        # The hash is published first, so that readers never see an engine without it.
+        cache_write(global_cache, name + ".sha256", engine_hash)
+        cache_write(global_cache, name, blob)
+
+
 def create_environment():
     # OS and TEMP are necessary for msys2
     white_set = {"PATH", "OS", "TEMP"}
@@ -812,7 +1560,10 @@ def setup_engine(
     compiler,
     version,
     global_cache,
+    build_pid=None,
 ):
+    # build_pid is given by the background builds of prefetch_engines(), it
+    # receives the pid of make.
     compiler_ver = compiler + "_" + str("_".join([str(s) for s in version]))
     env, env_hash = create_environment()
     engine_name = "-".join(["stockfish", sha, compiler_ver, env_hash])
@@ -823,30 +1574,59 @@ def setup_engine(
             update_atime(path)
             return path
 
-    """Download and build sources in a temporary directory then move exe as engine_path"""
-    worker_dir = testing_dir.parent
-    tmp_dir = Path(tempfile.mkdtemp(dir=worker_dir))
+    # Engines built by other workers sharing the global cache on the same
+    # kind of cpu (and with the same toolchain) can be used as is.
+    arch_key = host_arch_key(compiler) if global_cache != "" else None
 
-    try:
-        blob = cache_read(global_cache, sha + ".zip")
+    def cached_engine():
+        if arch_key is None:
+            return None
+        for path in (engine_path_native, engine_path):
+            try:
+                if engine_cache_read(global_cache, path, arch_key):
+                    return path
+            except Exception as e:
+                print(
+                    f"Exception copying {path.name} from global cache:\n{e}",
+                    file=sys.stderr,
+                )
+        return None
 
-        if blob is None:
-            item_url = github_api(repo_url) + "/zipball/" + sha
-            print(f"Downloading {item_url}...")
-            blob = requests_get(item_url).content
-            blob_needs_write = True
+    path = cached_engine()
+    if path is not None:
+        return path
+
+    # Another worker sharing the global cache may be building the same
+    # engine right now. Wait for it rather than building it twice, but not
+    # forever. A background build skips the engine instead, and does not
+    # take the lock: nobody should wait for such a slow build.
+    build_lock = None
+    if arch_key is not None:
+        build_lock = openlock.FileLock(Path(global_cache) / f"build-{engine_name}.lock")
+        if build_pid is not None:
+            if build_lock.locked():
+                print(f"Skipping {engine_name}, which is being built elsewhere.")
+                return None
+            build_lock = None
         else:
-            blob_needs_write = False
-            print(f"Using {sha + '.zip'} from global cache.")
+            try:
+                build_lock.acquire(timeout=BUILD_LOCK_TIMEOUT)
+            except openlock.Timeout:
+                print(f"Timeout waiting for the build of {engine_name} elsewhere.")
+                build_lock = None
+            path = cached_engine()
+            if path is not None:
+                if build_lock is not None:
+                    build_lock.release()
+                return path
 
-        file_list = unzip(blob, tmp_dir)
-        # once unzipped without error we can write as needed
-        if blob_needs_write:
-            cache_write(global_cache, sha + ".zip", blob)
+    """Download and build sources in a temporary directory then move exe as engine_path"""
+    worker_dir = testing_dir.parent
+    tmp_dir = Path(tempfile.mkdtemp(dir=worker_dir))
 
-        build_dir = (
-            tmp_dir / os.path.commonprefix([n.filename for n in file_list]) / "src"
-        )
+    try:
+        setup_sources(worker_dir, sha, repo_url, global_cache, tmp_dir / "stockfish")
+        build_dir = tmp_dir / "stockfish" / "src"
         os.chdir(build_dir)
 
         for net in required_nets_from_source():
@@ -875,24 +1655,30 @@ def setup_engine(
             f"COMP={comp}",
         ]
 
-        with subprocess.Popen(
-            cmd,
-            env=env,
-            start_new_session=False if IS_WINDOWS else True,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            bufsize=1,
-            close_fds=not IS_WINDOWS,
-        ) as p:
-            try:
-                errors = p.stderr.readlines()
-            except Exception as e:
-                if not IS_WINDOWS:
-                    os.killpg(p.pid, signal.SIGINT)
-                raise WorkerException(
-                    f"Executing {cmd} raised Exception: {type(e).__name__}: {e}",
-                    e=e,
-                )
+        with timed_phase("build"):
+            with subprocess.Popen(
+                cmd,
+                env=env,
+                start_new_session=False if IS_WINDOWS else True,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                bufsize=1,
+                close_fds=not IS_WINDOWS,
+            ) as p:
+                if build_pid is not None:
+                    build_pid.value = p.pid
+                try:
+                    errors = p.stderr.readlines()
+                except Exception as e:
+                    if not IS_WINDOWS:
+                        os.killpg(p.pid, signal.SIGINT)
+                    raise WorkerException(
+                        f"Executing {cmd} raised Exception: {type(e).__name__}: {e}",
+                        e=e,
+                    )
+                finally:
+                    if build_pid is not None:
+                        build_pid.value = 0
         if p.returncode != 0:
             raise WorkerException(f"Executing {cmd} failed. Error: {errors}")
 
@@ -919,13 +1705,150 @@ def setup_engine(
             raise FatalException("Another worker is running in the same directory!")
         else:
             (build_dir / "stockfish").with_suffix(EXE_SUFFIX).replace(engine_path)
+
+        if arch_key is not None:
+            try:
+                engine_cache_write(global_cache, engine_path, arch_key)
+            except Exception as e:
+                print(
+                    f"Exception writing {engine_path.name} to global cache:\n{e}",
+                    file=sys.stderr,
+                )
     finally:
         os.chdir(worker_dir)
         shutil.rmtree(tmp_dir)
+        if build_lock is not None:
+            build_lock.release()
 
     return engine_path
 
 
+def prefetch_engines(
+    testing_dir,
+    remote,
+    hints,
+    compiler,
+    version,
+    global_cache,
+    cache_size,
+    stop_event,
+    build_pid,
+):
+    """Build the engines of the runs we will likely work on next (in a separate process)"""
+    # The process is spawned, the settings of the worker are not inherited.
+    set_cache_size(cache_size)
+
+    # Clean up when stopped (see setup_engine()), also when not forked.
+    def on_sigterm(signal_, frame):
+        raise FatalException(f"Terminated by signal {str_signal(signal_)}.")
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    # Keep the output of the main process readable.
+    try:
+        with open(testing_dir.parent / PREFETCH_LOGFILE, "w") as f:
+            os.dup2(f.fileno(), sys.stdout.fileno())
+            os.dup2(f.fileno(), sys.stderr.fileno())
+    except Exception as e:
+        print(f"Exception redirecting the output of the prefetcher:\n{e}")
+    try:
+        os.nice(PREFETCH_NICENESS)
+    except (AttributeError, OSError):
+        # Windows does not have os.nice().
+        pass
+
+    builds = []
+    for hint in hints:
+        for sha in (hint["resolved_new"], hint["resolved_base"]):
+            if (sha, hint["tests_repo"]) not in builds:
+                builds.append((sha, hint["tests_repo"]))
+
+    for sha, repo_url in builds:
+        if stop_event.is_set():
+            break
+        print(f"Prefetching {sha} from {repo_url}...", flush=True)
+        try:
+            # Use a single core: the games are running.
+            setup_engine(
+                testing_dir,
+                remote,
+                sha,
+                repo_url,
+                1,
+                compiler,
+                version,
+                global_cache,
+                build_pid=build_pid,
+            )
+        except FatalException as e:
+            print(f"Prefetching stopped:\n{e}", flush=True)
+            break
+        except Exception as e:
+            print(f"Exception prefetching {sha}:\n{e}", flush=True)
+    print("Prefetching done.", flush=True)
+
+
+def start_prefetch(testing_dir, remote, hints, compiler, version, global_cache):
+    hints = [hint for hint in hints if hint.get("tests_repo")]
+    if not hints:
+        return None
+    # Spawn rather than fork: a forked child could inherit a lock (e.g.
+    # LOG_LOCK) held by the heartbeat thread and deadlock on it.
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    build_pid = ctx.Value("i", 0)
+    p = ctx.Process(
+        target=prefetch_engines,
+        args=(
+            testing_dir,
+            remote,
+            hints,
+            compiler,
+            version,
+            global_cache,
+            CACHE_SIZE,
+            stop_event,
+            build_pid,
+        ),
+        daemon=True,
+    )
+    p.start()
+    print(f"Building the engines of {len(hints)} likely next run(s) in the background.")
+    return p, stop_event, build_pid
+
+
+def stop_prefetch(prefetch):
+    # This should be called before starting a new task, which needs the cpus.
+    # The background build is stopped without waiting for it: its partial
+    # build would not be worth the wait.
+    if prefetch is None:
+        return
+    p, stop_event, build_pid = prefetch
+    stop_event.set()
+    if not p.is_alive():
+        p.join()
+        return
+    print("Stopping the background build.")
+    # make runs in a session of its own, which would survive the prefetcher.
+    pid = build_pid.value
+    if pid != 0:
+        try:
+            if IS_WINDOWS:
+                subprocess.call(
+                    ["taskkill", "/F", "/T", "/PID", str(pid)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.STDOUT,
+                )
+            else:
+                os.killpg(pid, signal.SIGTERM)
+        except Exception as e:
+            print(
+                f"Exception killing the background build with PID {pid}:\n{e}",
+                file=sys.stderr,
+            )
+    # Triggers the cleanup in setup_engine(), see prefetch_engines().
+    p.terminate()
+
+
 def kill_process(p):
     p_name = os.path.basename(p.args[0])
     print(f"Killing {p_name} with PID {p.pid}... ", end="", flush=True)
@@ -984,12 +1907,142 @@ def adjust_tc(tc, factor):
 def enqueue_output(stream, queue):
     for line in iter(stream.readline, ""):
         queue.put(line)
+    queue.put(None)
+
+
+def threaded_output(p, tick):
+    # Windows cannot select() on pipes so we use a reader thread per stream.
+    q = Queue()
+    for stream in (p.stdout, p.stderr):
+        threading.Thread(target=enqueue_output, args=(stream, q), daemon=True).start()
+    open_streams = 2
+    while open_streams > 0:
+        try:
+            line = q.get(timeout=tick)
+        except Empty:
+            yield None
+            continue
+        if line is None:
+            open_streams -= 1
+        else:
+            yield line
+
+
+def process_output(p, tick=OUTPUT_TICK):
+    """Yield the lines that p writes to stdout and stderr until both are closed.
+    None is yielded if nothing was written during tick seconds."""
+    if IS_WINDOWS:
+        yield from threaded_output(p, tick)
+        return
+
+    with selectors.DefaultSelector() as selector:
+        for stream in (p.stdout, p.stderr):
+            # We bypass the buffering of the text streams, which would hide
+            # the available data from select().
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            selector.register(stream.fileno(), selectors.EVENT_READ, [decoder, ""])
+        while selector.get_map():
+            events = selector.select(tick)
+            if not events:
+                yield None
+                continue
+            for key, _ in events:
+                decoder, pending = key.data
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fd)
+                    pending += decoder.decode(b"", final=True)
+                    if pending:
+                        yield pending
+                    continue
+                lines = (pending + decoder.decode(data)).split("\n")
+                key.data[1] = lines.pop()
+                yield from lines
+
+
+class UpdateSender:
+    """Send the updates of a task to the server from a thread of its own, so
+    that the output of fastchess is read on while the server is slow or
+    unreachable. If the server cannot be reached we retry with an increasing
+    delay, always sending the most recent update. Since the stats are
+    cumulative, a late update replaces all the missed ones."""
+
+    def __init__(self, remote, current_state):
+        self.remote = remote
+        self.current_state = current_state
+        self.condition = threading.Condition()
+        self.pending = None  # the update being sent
+        self.task_alive = True
+        self.error = None  # to be raised by the reader of the output
+        self.num_delivered = 0
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, update):
+        with self.condition:
+            self.pending = update
+            self.condition.notify_all()
+
+    def idle(self, timeout):
+        """Wait until there is nothing left to send, False on timeout"""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.pending is None or self.stopped, timeout
+            )
+
+    def stop(self):
+        # The update being sent, if any, stays spooled.
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def run(self):
+        retry_delay = UPDATE_RETRY_TIME
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.pending is not None or self.stopped
+                )
+                if self.stopped:
+                    return
+                update = self.pending
+            try:
+                with timed_phase("update"):
+                    response = send_api_post_request(
+                        self.remote + "/api/update_task", update
+                    )
+            except Exception as e:
+                print(f"Exception calling update_task:\n{e}", file=sys.stderr)
+                count_event("retries")
+                print(f"Update spooled, next attempt in {retry_delay:.0f}s.")
+                with self.condition:
+                    self.condition.wait_for(lambda: self.stopped, retry_delay)
+                retry_delay = min(2 * retry_delay, UPDATE_RETRY_MAX_TIME)
+                continue
+            retry_delay = UPDATE_RETRY_TIME
+            with self.condition:
+                if "error" in response:
+                    self.error = WorkerException(
+                        f"Update_task failed: {response['error']}"
+                    )
+                    self.stopped = True
+                else:
+                    unspool_update(update)
+                    self.num_delivered += 1
+                    if not response["task_alive"]:
+                        self.task_alive = False
+                        self.stopped = True
+                    if self.pending is update:
+                        self.pending = None
+                    self.current_state["last_updated"] = datetime.now(timezone.utc)
+                self.condition.notify_all()
 
 
 def parse_fastchess_output(
     p,
     current_state,
-    remote,
+    sender,
     result,
     spsa_tuning,
     games_to_play,
@@ -1008,6 +2061,14 @@ def parse_fastchess_output(
 
     saved_stats = copy.deepcopy(result["stats"])
 
+    # Most lines (game starts and results, Elo estimates...) do not require
+    # any action. A single search with this pattern tells us if a line
+    # needs further inspection.
+    pattern_relevant = re.compile(
+        r"has CRC32:|Finished match|Warning;|disconnect|stall|on time|timeout"
+        r"|Games: |Ptnml\(0-2\): "
+    )
+
     # patterns used to obtain fastchess WLD and ptnml results from the following block of info:
     # --------------------------------------------------
     # Results of New-e443b2459e vs Base-e443b2459e (0.601+0.006, 1t, 16MB, UHO_Lichess_4852_v1.epd):
@@ -1024,66 +2085,82 @@ def parse_fastchess_output(
     )
     fastchess_WLD_results = None
     fastchess_ptnml_results = None
-    patterns_fastchess_error = (
+    pattern_fastchess_error = re.compile(
+        r"Warning;.*(?:"
         # Warning; New-SHA doesn't have option ThreatBySafePawn
-        re.compile(r"Warning;.*doesn't have option"),
+        r"doesn't have option"
         # Warning; Invalid value for option P: -354
-        re.compile(r"Warning;.*Invalid value"),
+        r"|Invalid value"
         # Warning; Illegal move e2e4 played by ...
-        re.compile(r"Warning;.*Illegal move"),
+        r"|Illegal move"
         # Warning; Illegal PV move e2e4 pv; ...
-        re.compile(r"Warning;.*Illegal PV move"),
+        r"|Illegal PV move"
         # Warning; Move does not match uci move format
-        re.compile(r"Warning;.*Move does not match uci move format"),
+        r"|Move does not match uci move format"
         # Warning; PV continues after checkmate
-        re.compile(r"Warning;.*PV continues after checkmate"),
+        r"|PV continues after checkmate"
         # Warning; PV continues after stalemate
-        re.compile(r"Warning;.*PV continues after stalemate"),
+        r"|PV continues after stalemate"
         # Warning; PV continues after threefold repetition - move ...
         # -> ignore for now, no error, but see https://github.com/official-stockfish/Stockfish/issues/6138
+        r")"
     )
 
-    q = Queue()
-    t_output = threading.Thread(target=enqueue_output, args=(p.stdout, q), daemon=True)
-    t_output.start()
-    t_error = threading.Thread(target=enqueue_output, args=(p.stderr, q), daemon=True)
-    t_error.start()
-
     end_time = datetime.now(timezone.utc) + timedelta(seconds=tc_limit)
     print(f"TC limit {tc_limit} End time: {end_time}")
 
-    num_games_updated = 0
+    # The results of a full batch are spooled to disk and handed to the
+    # sender, which delivers them to the server while we keep reading.
+    output = process_output(p)
+    num_games_spooled = 0
+    num_delivered = 0
     while datetime.now(timezone.utc) < end_time:
         if current_state["task_id"] is None:
             # This task is no longer necessary
             print(finished_task_message)
             return False
+        if sender.error is not None:
+            raise sender.error
+        if not sender.task_alive:
+            print(finished_task_message)
+            return False
+        if sender.num_delivered > num_delivered:
+            num_delivered = sender.num_delivered
+            if (Path(__file__).resolve().parent / "fish.exit").is_file():
+                raise WorkerException("Task stopped by 'fish.exit'.")
         try:
-            line = q.get_nowait().strip()
-        except Empty:
-            if p.poll() is not None:
+            line = next(output)
+        except StopIteration:
+            # fastchess is done, but the last update may still be pending
+            if sender.idle(OUTPUT_TICK) and not sender.stopped:
                 break
-            time.sleep(0.1)
+            continue
+        if line is None:
             continue
 
-        line = hash_pattern.sub(shorten_hash, line)
+        line = line.strip()
+        if "Base-" in line or "New-" in line:
+            line = hash_pattern.sub(shorten_hash, line)
         print(line, flush=True)
 
+        if not pattern_relevant.search(line):
+            continue
+
         # Do we have a pgn crc?
         if "has CRC32:" in line:
             pgn_file["CRC"] = line.split()[-1]
 
         # Have we reached the end of the match? Then just exit.
         if "Finished match" in line:
-            if num_games_updated == games_to_play:
+            if num_games_spooled == games_to_play:
                 print("Finished match cleanly.")
             else:
                 raise WorkerException(
-                    f"Finished match uncleanly {num_games_updated} vs. required {games_to_play}."
+                    f"Finished match uncleanly {num_games_spooled} vs. required {games_to_play}."
                 )
 
         # Check line for fastchess errors.
-        if any(pattern.search(line) for pattern in patterns_fastchess_error):
+        if pattern_fastchess_error.search(line):
             message = f"fastchess says: '{line}'"
             raise RunException(message)
 
@@ -1154,45 +2231,20 @@ def parse_fastchess_output(
                 + result["stats"]["draws"]
             )
             assert num_games_finished == 2 * sum(fastchess_ptnml_results)
-            assert num_games_finished <= num_games_updated + batch_size
+            assert num_games_finished <= num_games_spooled + batch_size
             assert num_games_finished <= games_to_play
 
             fastchess_ptnml_results = None
             fastchess_WLD_results = None
 
             # Send an update_task request after a batch is full or if we have played all games.
-            if (num_games_finished == num_games_updated + batch_size) or (
+            if (num_games_finished == num_games_spooled + batch_size) or (
                 num_games_finished == games_to_play
             ):
-                # Attempt to send game results to the server. Retry a few times upon error.
-                update_succeeded = False
-                for _ in range(5):
-                    try:
-                        response = send_api_post_request(
-                            remote + "/api/update_task", result
-                        )
-                        if "error" in response:
-                            break
-                    except Exception as e:
-                        print(f"Exception calling update_task:\n{e}", file=sys.stderr)
-                        if isinstance(e, FatalException):  # signal
-                            raise e
-                    else:
-                        if not response["task_alive"]:
-                            # This task is no longer necessary
-                            print(finished_task_message)
-                            return False
-                        update_succeeded = True
-                        num_games_updated = num_games_finished
-                        break
-                    time.sleep(UPDATE_RETRY_TIME)
-                if not update_succeeded:
-                    raise WorkerException("Too many failed update attempts.")
-                else:
-                    current_state["last_updated"] = datetime.now(timezone.utc)
-
-                if (Path(__file__).resolve().parent / "fish.exit").is_file():
-                    raise WorkerException("Task stopped by 'fish.exit'.")
+                num_games_spooled = num_games_finished
+                update = copy.deepcopy(result)
+                spool_update(update)
+                sender.send(update)
 
     else:
         raise WorkerException(
@@ -1212,10 +2264,12 @@ def launch_fastchess(
     batch_size,
     tc_limit,
     pgn_file,
+    cpus=None,
 ):
     if spsa_tuning:
         # Request parameters for next game.
-        req = send_api_post_request(remote + "/api/request_spsa", result)
+        with timed_phase("update"):
+            req = send_api_post_request(remote + "/api/request_spsa", result)
         if "error" in req:
             raise WorkerException(req["error"])
 
@@ -1264,52 +2318,56 @@ def launch_fastchess(
     )
 
     try:
-        with subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            bufsize=1,
-            # The next options are necessary to be able to send a CTRL_C_EVENT to this process.
-            # https://stackoverflow.com/questions/7085604/sending-c-to-python-subprocess-objects-on-windows
-            startupinfo=(
-                subprocess.STARTUPINFO(
-                    dwFlags=subprocess.STARTF_USESHOWWINDOW,
-                    wShowWindow=subprocess.SW_HIDE,
-                )
-                if IS_WINDOWS
-                else None
-            ),
-            creationflags=subprocess.CREATE_NEW_CONSOLE if IS_WINDOWS else 0,
-            close_fds=not IS_WINDOWS,
-        ) as p:
-            try:
-                task_alive = parse_fastchess_output(
-                    p,
-                    current_state,
-                    remote,
-                    result,
-                    spsa_tuning,
-                    games_to_play,
-                    batch_size,
-                    tc_limit,
-                    pgn_file,
-                )
-            finally:
-                # We nicely ask fastchess to stop.
-                try:
-                    send_sigint(p)
-                except Exception as e:
-                    print(f"\nException in send_sigint:\n{e}", file=sys.stderr)
-                # now wait...
-                print("\nWaiting for fastchess to finish... ", end="", flush=True)
+        # fastchess, and hence the engines, inherit the affinity
+        with timed_phase("games"), cpu_affinity(cpus):
+            with subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                bufsize=1,
+                # The next options are necessary to be able to send a CTRL_C_EVENT to this process.
+                # https://stackoverflow.com/questions/7085604/sending-c-to-python-subprocess-objects-on-windows
+                startupinfo=(
+                    subprocess.STARTUPINFO(
+                        dwFlags=subprocess.STARTF_USESHOWWINDOW,
+                        wShowWindow=subprocess.SW_HIDE,
+                    )
+                    if IS_WINDOWS
+                    else None
+                ),
+                creationflags=subprocess.CREATE_NEW_CONSOLE if IS_WINDOWS else 0,
+                close_fds=not IS_WINDOWS,
+            ) as p:
+                sender = UpdateSender(remote, current_state)
                 try:
-                    p.wait(timeout=FASTCHESS_KILL_TIMEOUT)
-                except subprocess.TimeoutExpired:
-                    print("timeout", flush=True)
-                    kill_process(p)
-                else:
-                    print("done.", flush=True)
+                    task_alive = parse_fastchess_output(
+                        p,
+                        current_state,
+                        sender,
+                        result,
+                        spsa_tuning,
+                        games_to_play,
+                        batch_size,
+                        tc_limit,
+                        pgn_file,
+                    )
+                finally:
+                    sender.stop()
+                    # We nicely ask fastchess to stop.
+                    try:
+                        send_sigint(p)
+                    except Exception as e:
+                        print(f"\nException in send_sigint:\n{e}", file=sys.stderr)
+                    # now wait...
+                    print("\nWaiting for fastchess to finish... ", end="", flush=True)
+                    try:
+                        p.wait(timeout=FASTCHESS_KILL_TIMEOUT)
+                    except subprocess.TimeoutExpired:
+                        print("timeout", flush=True)
+                        kill_process(p)
+                    else:
+                        print("done.", flush=True)
     except (OSError, subprocess.SubprocessError) as e:
         print(f"Exception starting fastchess:\n{e}", file=sys.stderr)
         raise WorkerException(f"Unable to start fastchess. Error: {e}")
@@ -1327,6 +2385,8 @@ def run_games(
     task_id,
     pgn_file,
     global_cache,
+    prefetch_hints=(),
+    affinity=False,
 ):
     # This is the main fastchess driver.
     # It is ok, and even expected, for this function to
@@ -1394,6 +2454,7 @@ def run_games(
     new_hash = int(match.group(1)) if match else 16
     match = re.search(r"\bHash=(\d+)\b", base_options)
     base_hash = int(match.group(1)) if match else 16
+    game_cpus = game_slot_cpus(games_concurrency, threads) if affinity else None
 
     opening_offset = task.get("start", task_id * task["num_games"])
     if "start" in task:
@@ -1448,7 +2509,8 @@ def run_games(
             or (testing_dir / book).stat().st_size == 0
         ):
             zipball = book + ".zip"
-            blob = download_from_github(zipball)
+            with timed_phase("download"):
+                blob = download_from_github(zipball)
             unzip(blob, testing_dir)
             downloaded_book = True
         else:
@@ -1513,7 +2575,9 @@ def run_games(
     try:
         cpu_features = get_cpu_features(base_engine)
         verify_signature(base_engine, run["args"]["base_signature"])
-        base_nps = get_bench_nps(base_engine, games_concurrency, threads, base_hash)
+        base_nps = get_bench_nps(
+            base_engine, games_concurrency, threads, base_hash, game_cpus
+        )
     except RunException as e:
         run_errors.append(str(e))
     except WorkerException as e:
@@ -1526,7 +2590,9 @@ def run_games(
         try:
             _ = get_cpu_features(new_engine)
             verify_signature(new_engine, run["args"]["new_signature"])
-            _ = get_bench_nps(new_engine, games_concurrency, threads, new_hash)
+            _ = get_bench_nps(
+                new_engine, games_concurrency, threads, new_hash, game_cpus
+            )
         except RunException as e:
             run_errors.append(str(e))
         except WorkerException as e:
@@ -1580,6 +2646,13 @@ def run_games(
     if spsa_tuning:
         tc_limit *= 2
 
+    # The benches are done: build the engines of the runs we will likely
+    # work on next while the games are running.
+    if prefetch_hints:
+        current_state["prefetch"] = start_prefetch(
+            testing_dir, remote, prefetch_hints, compiler, version, global_cache
+        )
+
     while games_remaining > 0:
         # Update frequency for NumGames/SPSA test:
         # every 4 games at LTC, or a similar time interval at shorter TCs
@@ -1674,6 +2747,11 @@ def run_games(
                 "-concurrency",
                 str(int(games_concurrency)),
             ]
+            + (
+                ["-use-affinity", ",".join(map(format_cpulist, game_cpus))]
+                if game_cpus is not None
+                else []
+            )
             + pgn_cmd
             + [
                 "-engine",
@@ -1708,6 +2786,7 @@ def run_games(
             batch_size,
             tc_limit * max(8, games_to_play / games_concurrency),
             pgn_file,
+            sum(game_cpus, []) if game_cpus is not None else None,
         )
 
         games_remaining -= games_to_play
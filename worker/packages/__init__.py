@@ -5,6 +5,9 @@ from pathlib import Path
 
 
 class LazyModule(types.ModuleType):
+    """A module which is imported when one of its attributes is first used.
+    An installed module is preferred to the vendored one."""
+
     def __init__(self, name):
         super().__init__(name)
         self._module_path = f".{name}"
@@ -12,10 +15,13 @@ class LazyModule(types.ModuleType):
 
     def _load(self):
         if self._module is None:
-            pkg_path = str(Path(__file__).resolve().parent)
-            if pkg_path not in sys.path:
-                sys.path.append(pkg_path)
-            self._module = importlib.import_module(self._module_path, __name__)
+            try:
+                self._module = importlib.import_module(self.__name__)
+            except ImportError:
+                pkg_path = str(Path(__file__).resolve().parent)
+                if pkg_path not in sys.path:
+                    sys.path.append(pkg_path)
+                self._module = importlib.import_module(self._module_path, __name__)
         return self._module
 
     def __getattr__(self, item):
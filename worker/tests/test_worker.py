@@ -1,17 +1,26 @@
+import hashlib
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
 import unittest
+from argparse import Namespace
 from configparser import ConfigParser
 from pathlib import Path
+from unittest import mock
+from zipfile import ZipFile
 
 import games
 import updater
 
 import worker
 
+# Cumulative import times (us, from -X importtime) of the worker and the GUI,
+# several times what they take on a desktop machine, for slow CI runners.
+WORKER_IMPORT_BUDGET = 1_000_000
+GUI_IMPORT_BUDGET = 500_000
+
 
 class WorkerTest(unittest.TestCase):
     def setUp(self):
@@ -50,6 +59,16 @@ class WorkerTest(unittest.TestCase):
         self.assertTrue(config.has_option("parameters", "host"))
         self.assertTrue(config.has_option("parameters", "port"))
         self.assertTrue(config.has_option("parameters", "concurrency"))
+        self.assertTrue(config.has_option("parameters", "prefetch"))
+        self.assertTrue(config.has_option("parameters", "slots"))
+        self.assertTrue(config.has_option("parameters", "affinity"))
+        self.assertTrue(config.has_option("parameters", "global_cache_size"))
+
+    def test_slot_uuid(self):
+        options = Namespace(uuid_prefix="_hw", hw_id="0123abcd")
+        self.assertTrue(worker.get_uuid(options).startswith("0123abcd-"))
+        self.assertTrue(worker.get_uuid(options, 0).startswith("0123abs0-"))
+        self.assertTrue(worker.get_uuid(options, 12).startswith("0123as12-"))
 
     def test_worker_script_with_bad_args(self):
         self.assertFalse((self.worker_dir / "fishtest.cfg").exists())
@@ -61,6 +80,253 @@ class WorkerTest(unittest.TestCase):
         with self.assertRaises(Exception):
             games.setup_engine("foo", cwd, cwd, "https://foo", "foo", "https://foo", 1)
 
+    def test_validate_net(self):
+        testing_dir = self.tempdir / "testing"
+        content = b"fishtest" * 1000
+        net = "nn-" + hashlib.sha256(content).hexdigest()[:12] + ".nnue"
+        (testing_dir / net).write_bytes(content)
+        self.assertTrue(games.validate_net(testing_dir, net))
+        self.assertIn(net, games.read_verified_nets(testing_dir))
+        self.assertTrue(games.validate_net(testing_dir, net))
+        (testing_dir / net).write_bytes(content + b"corrupted")
+        self.assertFalse(games.validate_net(testing_dir, net))
+
+    def test_engine_cache(self):
+        global_cache = self.tempdir / "global_cache"
+        global_cache.mkdir()
+        engine_path = self.tempdir / "testing" / "stockfish-foo"
+        engine_path.write_bytes(b"engine")
+        games.engine_cache_write(str(global_cache), engine_path, "abc")
+        engine_path.unlink()
+        self.assertTrue(games.engine_cache_read(str(global_cache), engine_path, "abc"))
+        self.assertEqual(engine_path.read_bytes(), b"engine")
+        # The engine published first is kept, together with its hash.
+        engine_path.write_bytes(b"other engine")
+        games.engine_cache_write(str(global_cache), engine_path, "abc")
+        engine_path.unlink()
+        self.assertTrue(games.engine_cache_read(str(global_cache), engine_path, "abc"))
+        self.assertEqual(engine_path.read_bytes(), b"engine")
+        self.assertFalse(games.engine_cache_read(str(global_cache), engine_path, "de"))
+        games.trim_cache(str(global_cache), max_size=0)
+        self.assertFalse(games.engine_cache_read(str(global_cache), engine_path, "abc"))
+        self.assertEqual(os.listdir(global_cache), ["cache_index.json"])
+
+    def test_cache_trim(self):
+        global_cache = str(self.tempdir / "global_cache")
+        Path(global_cache).mkdir()
+        for name in ("a.zip", "b.zip", "c.zip"):
+            games.cache_write(global_cache, name, b"x" * 100)
+        self.assertEqual(games.cache_read(global_cache, "a.zip"), b"x" * 100)
+        games.trim_cache(global_cache, max_size=200)
+        self.assertIsNone(games.cache_read(global_cache, "b.zip"))
+        self.assertIsNotNone(games.cache_read(global_cache, "a.zip"))
+        self.assertIsNotNone(games.cache_read(global_cache, "c.zip"))
+        with mock.patch("games.CACHE_SIZE", 100):
+            games.cache_write(global_cache, "d.zip", b"x" * 100)
+        self.assertEqual(
+            sorted(os.listdir(global_cache)), ["cache_index.json", "d.zip"]
+        )
+        # A file and its (older) hash are evicted together.
+        with mock.patch("games.CACHE_SIZE", 300):
+            games.cache_write(global_cache, "e.zip.sha256", b"x" * 10)
+            games.cache_write(global_cache, "e.zip", b"x" * 100)
+            games.cache_read(global_cache, "d.zip")
+            games.cache_write(global_cache, "f.zip", b"x" * 100)
+        self.assertEqual(
+            sorted(os.listdir(global_cache)), ["cache_index.json", "d.zip", "f.zip"]
+        )
+
+    def test_setup_sources(self):
+        global_cache = self.tempdir / "global_cache"
+        global_cache.mkdir()
+        zip_path = self.tempdir / "abc.zip"
+        with ZipFile(zip_path, "w") as zip_file:
+            zip_file.writestr("sf-abc/src/Makefile", "all:")
+            zip_file.writestr("sf-abc/scripts/net.sh", "true")
+            zip_file.writestr("sf-abc/tests/perft.sh", "true")
+        zip_hash = games.file_sha256(zip_path).encode()
+        games.cache_write(str(global_cache), "abc.zip.sha256", zip_hash)
+        games.cache_write_file(str(global_cache), "abc.zip", zip_path)
+        for build in ("build1", "build2"):
+            build_dir = self.tempdir / build
+            games.setup_sources(
+                self.tempdir, "abc", "foo", str(global_cache), build_dir
+            )
+            self.assertEqual((build_dir / "src" / "Makefile").read_text(), "all:")
+            self.assertTrue((build_dir / "scripts" / "net.sh").exists())
+            self.assertFalse((build_dir / "tests").exists())
+            # The extracted sources are reused.
+            games.cache_remove(str(global_cache), "abc.zip")
+        # Older workers cache the zipball without its hash.
+        games.cache_write_file(str(global_cache), "def.zip", zip_path)
+        games.setup_sources(
+            self.tempdir, "def", "foo", str(global_cache), self.tempdir / "build3"
+        )
+        self.assertTrue((self.tempdir / "build3" / "src" / "Makefile").exists())
+        self.assertEqual(
+            games.cache_read(str(global_cache), "def.zip.sha256"), zip_hash
+        )
+
+    def test_bench_cache(self):
+        engine = self.tempdir / "testing" / "stockfish-bar"
+        engine.write_bytes(b"engine")
+        calls = []
+
+        def run_parallel_benches(
+            engine, concurrency, threads, hash_size, depth, cpus=None
+        ):
+            calls.append(depth)
+            return concurrency * [(1000.0, speed[0])]
+
+        speed = [1e6]
+        with mock.patch("games.run_parallel_benches", run_parallel_benches):
+            # The calibration bench is the warmup of the full bench.
+            self.assertEqual(games.get_bench_nps(engine, 2, 1, 16), 1e6)
+            self.assertEqual(calls, [9, 13])
+            self.assertEqual(games.get_bench_nps(engine, 2, 1, 16), 1e6)
+            self.assertEqual(calls, [9, 13, 9])
+            speed = [0.8e6]
+            self.assertEqual(games.get_bench_nps(engine, 2, 1, 16), 0.8e6)
+            self.assertEqual(calls, [9, 13, 9, 9, 13])
+
+    def test_engine_info(self):
+        engine = self.tempdir / "testing" / "stockfish-baz"
+        engine.write_bytes(b"engine")
+        nets = {"EvalFile": "nn-000000000000.nnue"}
+        games.update_engine_info(engine, nets=nets)
+        self.assertEqual(games.required_nets(engine), nets)
+        engine.unlink()
+        engine.write_bytes(b"new engine")
+        self.assertEqual(games.read_engine_info(engine), {})
+
+    def test_process_output(self):
+        script = "import sys; print('a'); print('b', file=sys.stderr); print('c')"
+        with subprocess.Popen(
+            [sys.executable, "-c", script],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            bufsize=1,
+        ) as p:
+            lines = [line for line in games.process_output(p) if line is not None]
+        self.assertEqual(sorted(line.strip() for line in lines), ["a", "b", "c"])
+
+    def test_spool(self):
+        spool_dir = self.tempdir / "spool"
+        result = {"password": "secret", "run_id": "abc", "task_id": 1, "stats": {}}
+        updates = []
+
+        def send_api_post_request(api_url, payload):
+            if offline:
+                raise games.WorkerException("offline")
+            updates.append(payload)
+            return {"task_alive": False}
+
+        with mock.patch("games.SPOOL_DIR", str(spool_dir)):
+            with mock.patch("games.send_api_post_request", send_api_post_request):
+                games.spool_update(result)
+                self.assertTrue((spool_dir / "abc-1.json").exists())
+                offline = True
+                games.replay_spooled_updates("https://foo", "secret")
+                self.assertTrue((spool_dir / "abc-1.json").exists())
+                offline = False
+                games.replay_spooled_updates("https://foo", "secret")
+                self.assertFalse((spool_dir / "abc-1.json").exists())
+        self.assertEqual(updates, [result])
+
+    def test_update_sender(self):
+        responses = [
+            games.WorkerException("offline"),
+            {"task_alive": True},
+            {"task_alive": False},
+        ]
+        updates = []
+
+        def send_api_post_request(api_url, payload):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            updates.append(payload["task_id"])
+            return response
+
+        current_state = {"last_updated": None}
+        with mock.patch("games.SPOOL_DIR", str(self.tempdir / "spool")):
+            with mock.patch("games.send_api_post_request", send_api_post_request):
+                with mock.patch("games.UPDATE_RETRY_TIME", 0.01):
+                    sender = games.UpdateSender("https://foo", current_state)
+                    sender.send({"run_id": "abc", "task_id": 1})
+                    self.assertTrue(sender.idle(10))
+                    self.assertTrue(sender.task_alive)
+                    sender.send({"run_id": "abc", "task_id": 2})
+                    self.assertTrue(sender.idle(10))
+                    self.assertFalse(sender.task_alive)
+        self.assertEqual(updates, [1, 2])
+        self.assertIsNotNone(current_state["last_updated"])
+
+    def test_telemetry(self):
+        games.reset_telemetry()
+        with games.timed_phase("build"):
+            games.count_event("api_calls")
+        with games.timed_phase("build"):
+            games.count_event("api_calls", 2)
+        telemetry = games.reset_telemetry()
+        self.assertEqual(set(telemetry["phases"]), {"build"})
+        self.assertEqual(telemetry["counters"], {"api_calls": 3})
+        self.assertEqual(games.reset_telemetry(), {"phases": {}, "counters": {}})
+
+    def test_allocate_cpus(self):
+        self.assertEqual(games.parse_cpulist("0-2,8,10-11\n"), [0, 1, 2, 8, 10, 11])
+        self.assertEqual(games.format_cpulist([11, 0, 1, 2, 8, 10]), "0-2,8,10-11")
+        nodes = [[0, 1, 2, 3], [4, 5, 6, 7]]
+        self.assertEqual(
+            games.allocate_cpus(nodes, [2, 2, 2]), [[0, 1], [4, 5], [2, 3]]
+        )
+        self.assertEqual(
+            games.allocate_cpus(nodes, [3, 3, 2]), [[0, 1, 2], [4, 5, 6], [3, 7]]
+        )
+        self.assertIsNone(games.allocate_cpus(nodes, [4, 4, 1]))
+
+    def import_times(self, code, cwd):
+        p = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=cwd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+        times = {}
+        for line in p.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                times[fields[2].strip()] = int(fields[1])  # cumulative, in us
+        return times
+
+    @unittest.skipIf(sys.version_info < (3, 7), "-X importtime requires Python 3.7")
+    def test_import_time(self):
+        # The worker is restarted after every update, keep its startup fast
+        # and the heavy modules out of it.
+        times = self.import_times("import worker", self.worker_dir)
+        self.assertLess(times["worker"], WORKER_IMPORT_BUDGET)
+        self.assertNotIn("requests", times)
+        self.assertNotIn("multiprocessing.managers", times)
+        self.assertNotIn("ctypes", times)
+
+    @unittest.skipIf(sys.version_info < (3, 7), "-X importtime requires Python 3.7")
+    def test_gui_import_time(self):
+        gui_dir = self.worker_dir.parent
+        if not (gui_dir / "fishtest_gui.py").exists():
+            self.skipTest("the GUI is not installed")
+        try:
+            import tkinter  # noqa: F401
+        except ImportError:
+            self.skipTest("tkinter is not available")
+        # The notification system is only needed once the user acts.
+        times = self.import_times("import fishtest_gui", gui_dir)
+        self.assertLess(times["fishtest_gui"], GUI_IMPORT_BUDGET)
+        self.assertNotIn("notification_system", times)
+        self.assertNotIn("webbrowser", times)
+
     def test_updater(self):
         file_list = updater.update(restart=False, test=True)
         self.assertIn("worker.py", file_list)
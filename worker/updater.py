@@ -7,11 +7,7 @@ from pathlib import Path
 from zipfile import ZipFile
 
 from games import trim_files
-
-try:
-    import requests
-except ImportError:
-    from packages import requests
+from packages import requests
 
 start_dir = Path().cwd()
 
@@ -34,11 +34,6 @@ try:
     import openlock
 except (ImportError, SyntaxError):
     from packages import openlock
-try:
-    import requests
-except ImportError:
-    from packages import requests
-
 from games import (
     EXE_SUFFIX,
     IS_MACOS,
@@ -46,20 +41,30 @@ from games import (
     FatalException,
     RunException,
     WorkerException,
+    allocate_cpus,
     backup_log,
     cache_read,
     cache_write,
     download_from_github,
     format_returncode,
     log,
+    numa_nodes,
+    replay_spooled_updates,
     requests_get,
+    reset_telemetry,
     run_games,
     send_api_post_request,
+    set_cache_size,
+    share_bench_cache,
+    stop_prefetch,
     str_signal,
     text_hash,
+    timed_phase,
     trim_files,
     unzip,
+    write_metrics,
 )
+from packages import requests
 from updater import update
 
 LOCK_FILE = Path(__file__).resolve().parent / "fishtest_worker.lock"
@@ -73,7 +78,7 @@ MIN_CLANG_MINOR = 0
 
 FASTCHESS_SHA = "5e4b66b57ef790d68119f4bfdda4546bbab31d08"
 
-WORKER_VERSION = 288
+WORKER_VERSION = 311
 FILE_LIST = ["updater.py", "worker.py", "games.py"]
 HTTP_TIMEOUT = 30.0
 INITIAL_RETRY_TIME = 15.0
@@ -644,6 +649,10 @@ def setup_parameters(worker_dir):
         ("parameters", "min_threads", "1", int, None),
         ("parameters", "fleet", "False", _bool, None),
         ("parameters", "global_cache", "", str, None),
+        ("parameters", "global_cache_size", "4096", int, None),
+        ("parameters", "prefetch", "True", _bool, None),
+        ("parameters", "slots", "1", int, None),
+        ("parameters", "affinity", "False", _bool, None),
         ("parameters", "compiler", default_compiler, compiler_names, None),
         ("private", "hw_seed", str(random.randint(0, 0xFFFFFFFF)), int, None),
     ]
@@ -739,9 +748,48 @@ def setup_parameters(worker_dir):
         type=str,
         help="""Useful only when running multiple workers concurrently:
                 an existing absolute path to be used to globally cache on disk
-                certain downloads, reducing load on github or net server.
+                certain downloads and the compiled engines, reducing load on
+                github or net server and avoiding duplicate builds.
                 An empty string ("") disables using a cache.""",
     )
+    parser.add_argument(
+        "-G",
+        "--global_cache_size",
+        dest="global_cache_size",
+        default=config.getint("parameters", "global_cache_size"),
+        type=int,
+        help="the size budget of the global cache (in MiB); the least "
+        "recently used files are removed when it is exceeded",
+    )
+    parser.add_argument(
+        "-B",
+        "--prefetch",
+        dest="prefetch",
+        default=config.getboolean("parameters", "prefetch"),
+        type=_bool,
+        choices=[False, True],  # useful for usage message
+        help="if 'True', build the engines of the runs that are likely to be "
+        "next in the background, at low priority, while playing games",
+    )
+    parser.add_argument(
+        "-S",
+        "--slots",
+        dest="slots",
+        default=config.getint("parameters", "slots"),
+        type=int,
+        help="the number of tasks that the worker runs concurrently, each with "
+        "an equal share of the cores and of the memory; useful on large hosts",
+    )
+    parser.add_argument(
+        "-A",
+        "--affinity",
+        dest="affinity",
+        default=config.getboolean("parameters", "affinity"),
+        type=_bool,
+        choices=[False, True],  # useful for usage message
+        help="if 'True', pin the games and the benches to cpus, keeping every "
+        "game on a single numa node (Linux only)",
+    )
     parser.add_argument(
         "-C",
         "--compiler",
@@ -795,17 +843,25 @@ def setup_parameters(worker_dir):
         print("Changing port to 443.")
         options.port = 443
 
+    if not 1 <= options.slots <= options.concurrency:
+        print(f"The number of slots must be between 1 and {options.concurrency}.")
+        return None
+
+    if options.global_cache_size < 0:
+        print("The size of the global cache cannot be negative.")
+        return None
+
     # Limit concurrency so that at least STC tests can run with the available memory
     # The memory needs per engine are:
     # 16 for the TT Hash, 10 for the process, 138 for the net, and 16 per thread
-    # 60 is the need for fastchess
+    # 60 is the need for fastchess (one per slot)
     # These numbers need to be up-to-date with the server values
     STC_memory = 2 * (16 + 10 + 138 + 16)
-    fc_memory = 60
+    fc_memory = 60 * options.slots
     max_concurrency = int((options.max_memory - fc_memory) / STC_memory)
-    if max_concurrency < 1:
+    if max_concurrency < options.slots:
         print(
-            f"You need to reserve at least {STC_memory + fc_memory} MiB to run the worker!"
+            f"You need to reserve at least {options.slots * STC_memory + fc_memory} MiB to run the worker!"
         )
         return None
     options.concurrency_reduced = False
@@ -821,6 +877,10 @@ def setup_parameters(worker_dir):
         options.concurrency = max_concurrency
         options.concurrency_reduced = True
 
+    if options.affinity and not hasattr(os, "sched_setaffinity"):
+        print("Pinning to cpus is not supported on this system.")
+        options.affinity = False
+
     options.compiler = compilers[options.compiler_]
 
     options.hw_id = hw_id(config.getint("private", "hw_seed"))
@@ -864,6 +924,10 @@ def setup_parameters(worker_dir):
     config.set("parameters", "min_threads", str(options.min_threads))
     config.set("parameters", "fleet", str(options.fleet))
     config.set("parameters", "global_cache", str(options.global_cache))
+    config.set("parameters", "global_cache_size", str(options.global_cache_size))
+    config.set("parameters", "prefetch", str(options.prefetch))
+    config.set("parameters", "slots", str(options.slots))
+    config.set("parameters", "affinity", str(options.affinity))
     config.set("parameters", "compiler", options.compiler_)
 
     with open(config_file, "w") as f:
@@ -873,7 +937,7 @@ def setup_parameters(worker_dir):
 
     print(f"System memory determined to be: {mem / 1024**3:.3f}GiB.")
     print(
-        f"Worker constraints: {{'concurrency': {options.concurrency}, 'max_memory': {options.max_memory}, 'min_threads': {options.min_threads}}}"
+        f"Worker constraints: {{'concurrency': {options.concurrency}, 'max_memory': {options.max_memory}, 'min_threads': {options.min_threads}, 'slots': {options.slots}}}"
     )
     print(f"Config file {config_file} written.")
 
@@ -978,12 +1042,17 @@ def hw_id(hw_seed):
     return format(hw_seed ^ fingerprint_machine ^ fingerprint_path, "08x")
 
 
-def get_uuid(options):
+def get_uuid(options, slot=None):
     if options.uuid_prefix == "_hw":
         uuid_prefix = options.hw_id
     else:
         uuid_prefix = options.uuid_prefix
 
+    if slot is not None:
+        # The server tells workers apart by the first part of the uuid.
+        suffix = f"s{slot}"
+        uuid_prefix = uuid_prefix[: 8 - len(suffix)] + suffix
+
     return uuid_prefix[:8] + str(uuid.uuid4())[8:]
 
 
@@ -1217,6 +1286,11 @@ def verify_worker_version(remote, username, password, worker_lock):
     if "error" in req:
         return False  # likewise
     if req["version"] > WORKER_VERSION:
+        if worker_lock is None:
+            # We are a slot of a worker: the worker itself updates
+            # once all the slots have stopped.
+            print(f"Stopping the slot to update to worker version {req['version']}.")
+            return False
         print(f"Updating worker version to {req['version']}.")
         backup_log()
         try:
@@ -1232,6 +1306,27 @@ def verify_worker_version(remote, username, password, worker_lock):
     return True
 
 
+def finish_telemetry(current_state, worker_info, run, task_id, success):
+    # Write the phase timings of the task to the metrics file and keep
+    # a summary for the server, which is sent with the next request_task.
+    telemetry = reset_telemetry()
+    summary = {
+        "phases": {k: round(v, 3) for k, v in telemetry["phases"].items()},
+        "counters": telemetry["counters"],
+    }
+    write_metrics(
+        {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "unique_key": worker_info["unique_key"],
+            "run_id": str(run["_id"]),
+            "task_id": task_id,
+            "success": success,
+            **summary,
+        }
+    )
+    current_state["telemetry"] = summary
+
+
 def fetch_and_handle_task(
     worker_dir,
     worker_info,
@@ -1240,6 +1335,8 @@ def fetch_and_handle_task(
     current_state,
     global_cache,
     worker_lock,
+    prefetch,
+    affinity,
 ):
     # This function should normally not raise exceptions.
     # Unusual conditions are handled by returning False.
@@ -1251,6 +1348,10 @@ def fetch_and_handle_task(
         f"Current time is {datetime.now(timezone.utc)} UTC (local offset: {utcoffset()})."
     )
 
+    # A background build must not race with the builds for the next task.
+    stop_prefetch(current_state["prefetch"])
+    current_state["prefetch"] = None
+
     # Check the worker version and upgrade if necessary
     ret = verify_worker_version(remote, worker_info["username"], password, worker_lock)
     if ret is False:
@@ -1261,6 +1362,9 @@ def fetch_and_handle_task(
     # Clean up old files:
     trim_files(worker_dir / "testing")
 
+    # Deliver the results that could not be sent during a server outage
+    replay_spooled_updates(remote, password)
+
     # Verify if we still have enough GitHub api calls
     remaining = get_remaining_github_api_calls()
     print(f"Remaining number of GitHub api calls = {remaining}.")
@@ -1277,10 +1381,14 @@ def fetch_and_handle_task(
     # Let's go!
     print("Fetching task...")
     payload = {"worker_info": worker_info, "password": password}
+    if current_state["telemetry"] is not None:
+        payload["worker_info"] = dict(worker_info, telemetry=current_state["telemetry"])
     try:
-        req = send_api_post_request(remote + "/api/request_task", payload)
+        with timed_phase("request_task"):
+            req = send_api_post_request(remote + "/api/request_task", payload)
     except WorkerException:
         return False  # error message has already been printed
+    current_state["telemetry"] = None
 
     if "error" in req:
         return False  # likewise
@@ -1332,6 +1440,8 @@ def fetch_and_handle_task(
             task_id,
             pgn_file,
             global_cache,
+            prefetch_hints=req.get("prefetch", []) if prefetch else [],
+            affinity=affinity,
         )
         success = True
     except FatalException as e:
@@ -1361,7 +1471,9 @@ def fetch_and_handle_task(
         "worker_info": worker_info,
     }
 
-    if not success:
+    if success:
+        print(f"Task {task_id} of {run['_id']} completed.")
+    else:
         print(f"\nException running games:\n{message}", file=sys.stderr)
         print("Informing the server.")
         try:
@@ -1388,6 +1500,7 @@ def fetch_and_handle_task(
         or pgn_file["name"].stat().st_size == 0
     ):
         print("Task exited")
+        finish_telemetry(current_state, worker_info, run, task_id, success)
         return success
 
     crc_expected = pgn_file["CRC"]
@@ -1408,7 +1521,8 @@ def fetch_and_handle_task(
             else:
                 # Decode bytes to text, ignoring non UTF-8 characters
                 data = file_content.decode("utf-8", errors="ignore")
-                upload_pgn_data(data, run["_id"], task_id, remote, payload)
+                with timed_phase("pgn_upload"):
+                    upload_pgn_data(data, run["_id"], task_id, remote, payload)
         except Exception as e:
             print(f"\nException uploading PGN file:\n{e}", file=sys.stderr)
 
@@ -1418,9 +1532,190 @@ def fetch_and_handle_task(
         print(f"Exception deleting PGN file:\n{e}", file=sys.stderr)
 
     print("Task exited.")
+    finish_telemetry(current_state, worker_info, run, task_id, success)
     return success
 
 
+def install_signal_handlers(current_state):
+    signal.signal(signal.SIGINT, partial(on_sigint, current_state))
+    signal.signal(signal.SIGTERM, partial(on_sigint, current_state))
+    try:
+        signal.signal(signal.SIGQUIT, partial(on_sigint, current_state))
+    except Exception:
+        # Windows does not have SIGQUIT.
+        pass
+    try:
+        signal.signal(signal.SIGBREAK, partial(on_sigint, current_state))
+    except Exception:
+        # Linux does not have SIGBREAK.
+        pass
+
+
+def new_current_state():
+    # We record some state that is shared by the three
+    # parallel event handling mechanisms:
+    # - the main loop;
+    # - the heartbeat loop;
+    # - the signal handler.
+    return {
+        "run": None,  # the current run
+        "task_id": None,  # the id of the current task
+        "alive": True,  # controls the main and heartbeat loop
+        "prefetch": None,  # the background build of the likely next engines
+        "telemetry": None,  # the phase timings of the last task, for the server
+        "last_updated": datetime.now(
+            timezone.utc
+        ),  # tracks the last update to the server
+    }
+
+
+def run_tasks(
+    worker_dir, task_dir, worker_info, options, remote, current_state, worker_lock
+):
+    # Fetch and run tasks in task_dir until we are stopped. Returns True
+    # if we were stopped by the 'fish.exit' file.
+
+    # Start heartbeat thread as a daemon (not strictly necessary, but there might be bugs)
+    heartbeat_thread = threading.Thread(
+        target=heartbeat,
+        args=(worker_info, options.password, remote, current_state),
+        daemon=True,
+    )
+    heartbeat_thread.start()
+
+    # If fleet==True then the worker will quit if it is unable to obtain
+    # or execute a task. If fleet==False then the worker will go to the
+    # next iteration of the main loop.
+    # The reason for the existence of this parameter is that it allows
+    # a fleet of workers to quickly quit as soon as the queue is empty
+    # or the server is down.
+
+    # Start the main loop.
+    delay = INITIAL_RETRY_TIME
+    fish_exit = False
+
+    while current_state["alive"]:
+        success = fetch_and_handle_task(
+            task_dir,
+            worker_info,
+            options.password,
+            remote,
+            current_state,
+            options.global_cache,
+            worker_lock,
+            options.prefetch,
+            options.affinity,
+        )
+        if (worker_dir / "fish.exit").is_file():
+            current_state["alive"] = False
+            print("Stopped by 'fish.exit' file.")
+            fish_exit = True
+            break
+        elif not current_state["alive"]:  # the user may have pressed Ctrl-C...
+            break
+        elif not success:
+            if options.fleet:
+                current_state["alive"] = False
+                print("Exiting the worker since fleet==True and an error occurred.")
+                break
+            else:
+                print(f"Waiting {delay} seconds before retrying.")
+                safe_sleep(delay)
+                delay = min(MAX_RETRY_TIME, delay * 2)
+        else:
+            delay = INITIAL_RETRY_TIME
+
+    stop_prefetch(current_state["prefetch"])
+
+    print("Waiting for the heartbeat thread to finish...")
+    heartbeat_thread.join(THREAD_JOIN_TIMEOUT)
+
+    return fish_exit
+
+
+def run_slot(worker_dir, slot_dir, worker_info, options, remote, bench_cache, cpus):
+    # The entry point of the process running a slot.
+    share_bench_cache(*bench_cache)
+    set_cache_size(options.global_cache_size * 1024 * 1024)
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    current_state = new_current_state()
+    install_signal_handlers(current_state)
+    os.chdir(slot_dir)
+    print(f"Slot started in {slot_dir} with PID={os.getpid()}.")
+    fish_exit = run_tasks(
+        worker_dir, slot_dir, worker_info, options, remote, current_state, None
+    )
+    sys.exit(0 if fish_exit else 1)
+
+
+def run_slots(worker_dir, worker_info, options, remote):
+    # Every slot runs its own tasks in a separate process and directory
+    # (building engines and running games relies on the current directory).
+    # The slots share fastchess, the global cache (so that nets and engines
+    # are downloaded and built only once) and their benches.
+    slots_dir = worker_dir / "slots"
+    if options.global_cache == "":
+        options.global_cache = str(slots_dir / "cache")
+        Path(options.global_cache).mkdir(parents=True, exist_ok=True)
+    fastchess_path = (worker_dir / "testing" / "fastchess").with_suffix(EXE_SUFFIX)
+
+    # Only imported here, most workers run a single slot.
+    from multiprocessing.managers import SyncManager
+
+    # Ctrl-C should stop the slots, not the manager they depend on.
+    manager = SyncManager()
+    manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+    bench_cache = (manager.dict(), manager.Lock())
+
+    concurrencies = [
+        options.concurrency // options.slots
+        + (slot < options.concurrency % options.slots)
+        for slot in range(options.slots)
+    ]
+    # With affinity, the slots get disjoint cpus, aligned on numa nodes.
+    slot_cpus = allocate_cpus(numa_nodes(), concurrencies) if options.affinity else None
+    if slot_cpus is None:
+        slot_cpus = options.slots * [None]
+
+    processes = []
+    for slot, (concurrency, cpus) in enumerate(zip(concurrencies, slot_cpus)):
+        slot_dir = slots_dir / str(slot)
+        (slot_dir / "testing").mkdir(parents=True, exist_ok=True)
+        shutil.copy2(fastchess_path, slot_dir / "testing")
+        slot_info = dict(
+            worker_info,
+            concurrency=concurrency,
+            max_memory=options.max_memory // options.slots,
+            unique_key=get_uuid(options, slot),
+        )
+        print(
+            f"Slot {slot}: concurrency {slot_info['concurrency']}, "
+            f"max_memory {slot_info['max_memory']}, UUID: {slot_info['unique_key']}",
+            flush=True,
+        )
+        process = multiprocessing.Process(
+            target=run_slot,
+            args=(worker_dir, slot_dir, slot_info, options, remote, bench_cache, cpus),
+        )
+        process.start()
+        processes.append(process)
+
+    try:
+        for process in processes:
+            process.join()
+    except FatalException:
+        # The slots may have received the signal as well. Otherwise, they
+        # stop cleanly on SIGTERM, just like the worker.
+        for process in processes:
+            process.join(THREAD_JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    manager.shutdown()
+
+
 def worker():
     print(LOGO)
     worker_lock = None
@@ -1443,33 +1738,10 @@ def worker():
     # Create the testing directory if missing.
     (worker_dir / "testing").mkdir(exist_ok=True)
 
-    # We record some state that is shared by the three
-    # parallel event handling mechanisms:
-    # - the main loop;
-    # - the heartbeat loop;
-    # - the signal handler.
-    current_state = {
-        "run": None,  # the current run
-        "task_id": None,  # the id of the current task
-        "alive": True,  # controls the main and heartbeat loop
-        "last_updated": datetime.now(
-            timezone.utc
-        ),  # tracks the last update to the server
-    }
+    current_state = new_current_state()
 
     # Install signal handlers.
-    signal.signal(signal.SIGINT, partial(on_sigint, current_state))
-    signal.signal(signal.SIGTERM, partial(on_sigint, current_state))
-    try:
-        signal.signal(signal.SIGQUIT, partial(on_sigint, current_state))
-    except Exception:
-        # Windows does not have SIGQUIT.
-        pass
-    try:
-        signal.signal(signal.SIGBREAK, partial(on_sigint, current_state))
-    except Exception:
-        # Linux does not have SIGBREAK.
-        pass
+    install_signal_handlers(current_state)
 
     # Handle command line parameters and the config file.
     options = setup_parameters(worker_dir)
@@ -1485,6 +1757,7 @@ def worker():
         return 0
 
     remote = f"{options.protocol}://{options.host}:{options.port}"
+    set_cache_size(options.global_cache_size * 1024 * 1024)
 
     # Check the worker version and upgrade if necessary
     try:
@@ -1548,55 +1821,25 @@ def worker():
         "near_github_api_limit": False,
     }
 
-    print("UUID:", worker_info["unique_key"])
-
-    # Start heartbeat thread as a daemon (not strictly necessary, but there might be bugs)
-    heartbeat_thread = threading.Thread(
-        target=heartbeat,
-        args=(worker_info, options.password, remote, current_state),
-        daemon=True,
-    )
-    heartbeat_thread.start()
-
-    # If fleet==True then the worker will quit if it is unable to obtain
-    # or execute a task. If fleet==False then the worker will go to the
-    # next iteration of the main loop.
-    # The reason for the existence of this parameter is that it allows
-    # a fleet of workers to quickly quit as soon as the queue is empty
-    # or the server is down.
-
-    # Start the main loop.
-    delay = INITIAL_RETRY_TIME
-    fish_exit = False
-
-    while current_state["alive"]:
-        success = fetch_and_handle_task(
+    if options.slots > 1:
+        run_slots(worker_dir, worker_info, options, remote)
+        fish_exit = (worker_dir / "fish.exit").is_file()
+        if not fish_exit:
+            # The slots may have stopped for a worker update.
+            verify_worker_version(
+                remote, options.username, options.password, worker_lock
+            )
+    else:
+        print("UUID:", worker_info["unique_key"])
+        fish_exit = run_tasks(
+            worker_dir,
             worker_dir,
             worker_info,
-            options.password,
+            options,
             remote,
             current_state,
-            options.global_cache,
             worker_lock,
         )
-        if (worker_dir / "fish.exit").is_file():
-            current_state["alive"] = False
-            print("Stopped by 'fish.exit' file.")
-            fish_exit = True
-            break
-        elif not current_state["alive"]:  # the user may have pressed Ctrl-C...
-            break
-        elif not success:
-            if options.fleet:
-                current_state["alive"] = False
-                print("Exiting the worker since fleet==True and an error occurred.")
-                break
-            else:
-                print(f"Waiting {delay} seconds before retrying.")
-                safe_sleep(delay)
-                delay = min(MAX_RETRY_TIME, delay * 2)
-        else:
-            delay = INITIAL_RETRY_TIME
 
     if fish_exit:
         print("Removing fish.exit file.")
@@ -1605,9 +1848,6 @@ def worker():
     print("Releasing the worker lock.")
     worker_lock.release()
 
-    print("Waiting for the heartbeat thread to finish...")
-    heartbeat_thread.join(THREAD_JOIN_TIMEOUT)
-
     return 0 if fish_exit else 1
 
 
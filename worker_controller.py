@@ -101,19 +101,16 @@ class WorkerController:
     def _monitor_output(self):
         """Monitor worker output in background thread"""
         try:
-            while self.is_worker_running and self.worker_process:
-                if self.worker_process.poll() is not None:
-                    # Process has ended
-                    break
-                    
-                try:
-                    line = self.worker_process.stdout.readline()
-                    if line and self.output_callback:
-                        line = line.strip()
-                        if line:  # Only send non-empty lines
-                            self.output_callback(line)
-                except Exception:
+            # Read until EOF, so that the last lines of a worker which
+            # has just exited are not lost. The callback only queues the
+            # line, the GUI shows the queued lines in batches.
+            process = self.worker_process
+            for line in iter(process.stdout.readline, ''):
+                if not self.is_worker_running:
                     break
+                line = line.strip()
+                if line and self.output_callback:  # Only send non-empty lines
+                    self.output_callback(line)
                     
         except Exception as e:
             if self.output_callback:
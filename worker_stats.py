@@ -0,0 +1,132 @@
+"""
+Worker Statistics for Fishtest Worker GUI
+Parses the output of the worker incrementally and keeps rolling throughput statistics.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+
+# Games finished in the last RATE_WINDOW seconds give the games per minute
+RATE_WINDOW = 120.0
+# One point of the sparklines every SAMPLE_PERIOD seconds
+SAMPLE_PERIOD = 10.0
+HISTORY_SIZE = 60
+LATENCY_SAMPLES = 20
+
+TASK_PATTERN = re.compile(r"^Working on task (\d+)")
+TASK_DONE_PATTERN = re.compile(r"^Task \d+ of \S+ completed")
+STARTED_PATTERN = re.compile(r"^Started game (\d+) of (\d+)")
+FINISHED_PATTERN = re.compile(r"^Finished game (\d+)")
+NPS_PATTERN = re.compile(r"^Mean nps\s*:\s*([0-9.]+)")
+POST_PATTERN = re.compile(
+    r"^Post request \S+ handled in ([0-9.]+)ms \(server: ([0-9.]+)ms\)"
+)
+
+
+class WorkerStats:
+    """Rolling statistics of a worker, fed line by line with its output"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, now=None):
+        """Start the statistics of a new worker session"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.start_time = now
+            self.stop_time = None
+            self.tasks = 0
+            self.games = 0
+            self.task_games = 0
+            self.task_size = None
+            self.nps = None
+            self.finish_times = deque()
+            self.latencies = deque(maxlen=LATENCY_SAMPLES)
+            self.next_sample = now
+            self.history = {
+                "games_per_minute": deque(maxlen=HISTORY_SIZE),
+                "nps": deque(maxlen=HISTORY_SIZE),
+                "latency": deque(maxlen=HISTORY_SIZE),
+            }
+
+    def stop(self, now=None):
+        """Freeze the uptime when the worker stops"""
+        with self.lock:
+            self.stop_time = time.monotonic() if now is None else now
+
+    def feed(self, line, now=None):
+        """Parse a line of worker output (called from the output monitoring thread)"""
+        # Most lines match none of the patterns, check the cheap prefixes first.
+        if not line or line[0] not in "WSFMPT":
+            return
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if FINISHED_PATTERN.match(line):
+                self.games += 1
+                self.task_games += 1
+                self.finish_times.append(now)
+                return
+            # A task (e.g. of spsa) may run several matches.
+            if TASK_DONE_PATTERN.match(line):
+                self.tasks += 1
+                return
+            m = STARTED_PATTERN.match(line)
+            if m:
+                self.task_size = int(m.group(2))
+                return
+            m = POST_PATTERN.match(line)
+            if m:
+                self.latencies.append((float(m.group(1)), float(m.group(2))))
+                return
+            m = NPS_PATTERN.match(line)
+            if m:
+                self.nps = float(m.group(1))
+                return
+            if TASK_PATTERN.match(line):
+                self.task_games = 0
+                self.task_size = None
+
+    def snapshot(self, now=None):
+        """Current statistics and the history of the sparklines"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            while self.finish_times and self.finish_times[0] < now - RATE_WINDOW:
+                self.finish_times.popleft()
+            window = min(RATE_WINDOW, now - self.start_time)
+            games_per_minute = (
+                60 * len(self.finish_times) / window if window > 0 else 0.0
+            )
+            latency = None
+            if self.latencies:
+                latency = sum(w for w, _ in self.latencies) / len(self.latencies)
+                server = sum(s for _, s in self.latencies) / len(self.latencies)
+
+            if now >= self.next_sample:
+                self.next_sample = now + SAMPLE_PERIOD
+                self.history["games_per_minute"].append(games_per_minute)
+                if self.nps is not None:
+                    self.history["nps"].append(self.nps)
+                if latency is not None:
+                    self.history["latency"].append(latency)
+
+            uptime = int((self.stop_time or now) - self.start_time)
+            stats = {
+                "tests_completed": self.tasks,
+                "uptime": f"{uptime // 3600:02d}:{uptime // 60 % 60:02d}:{uptime % 60:02d}",
+                "games_played": self.games,
+                "games_per_minute": f"{games_per_minute:.1f}",
+                "nps": f"{self.nps / 1e6:.2f} M" if self.nps is not None else "-",
+                "task_progress": (
+                    f"{self.task_games} / {self.task_size}" if self.task_size else "-"
+                ),
+                "latency": (
+                    f"{latency:.0f} ms (server {server:.0f} ms)"
+                    if latency is not None
+                    else "-"
+                ),
+            }
+            history = {key: list(values) for key, values in self.history.items()}
+        return stats, history